@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Side-by-side benchmark: service-a on gunicorn sync workers (app:app) vs. uvicorn (asgi_app:app)
+
+Both servers are started from services/service-a against the Postgres given by the usual DB_*
+variables, with the same number of worker processes, and driven with identical closed-loop
+load at increasing concurrency. Results are printed as JSON.
+
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres \\
+        python benchmarks/asgi_vs_wsgi.py --workers 2 --concurrency 50 500 2000 --duration 15
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+import subprocess
+from contextlib import contextmanager
+
+from http_load import run_closed_loop, wait_until_up
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'service-a')
+
+SCENARIOS = {
+    'get_data': lambda: ('GET', '/api/data?limit=10', b''),
+    'post_data': lambda: ('POST', '/api/data', b'{"data": "benchmark"}'),
+}
+
+
+@contextmanager
+def server(command, port):
+    """Run a server subprocess for the duration of the block"""
+    env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED='1')
+    # The async app has no response cache, so compare raw request paths
+    env.setdefault('DATA_CACHE_ENABLED', 'false')
+    env.setdefault('PROBE_PORT', '0')
+    process = subprocess.Popen(command, cwd=SERVICE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not asyncio.run(wait_until_up('127.0.0.1', port)):
+            raise RuntimeError(f"Server did not come up: {' '.join(command)}")
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 500, 2000])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), nargs='+', default=sorted(SCENARIOS))
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+
+    if not os.getenv('DB_HOST'):
+        logger.error("DB_HOST must point at a local Postgres with the app_data table")
+        sys.exit(1)
+
+    servers = {
+        'wsgi_sync': [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+                      '--workers', str(args.workers), '--worker-class', 'sync',
+                      '--backlog', '2048', '--bind', f'127.0.0.1:{args.port}', 'app:app'],
+        'asgi_asyncio': [sys.executable, '-m', 'uvicorn', '--workers', str(args.workers),
+                         '--log-level', 'warning', '--backlog', '2048',
+                         '--host', '127.0.0.1', '--port', str(args.port), 'asgi_app:app'],
+    }
+
+    results = []
+    for name, command in servers.items():
+        logger.info(f"Starting {name}")
+        with server(command, args.port):
+            for scenario in args.scenario:
+                for concurrency in args.concurrency:
+                    logger.info(f"{name}: {scenario} at concurrency {concurrency}")
+                    summary = asyncio.run(run_closed_loop(
+                        '127.0.0.1', args.port, SCENARIOS[scenario], concurrency, args.duration
+                    ))
+                    results.append({'server': name, 'scenario': scenario,
+                                    'concurrency': concurrency, **summary})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
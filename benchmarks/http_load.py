@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Minimal asyncio HTTP/1.1 load generator used by the benchmark scripts
+Dependency-free so it can drive thousands of concurrent connections from one process
+"""
+
+import math
+import time
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (method, path, body)
+RequestSpec = Tuple[str, str, bytes]
+
+
+async def send_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str,
+                       method: str, path: str, body: bytes = b'') -> Tuple[int, bool]:
+    """Send one request on an open connection and drain the response; returns (status, must_close)"""
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += "Content-Type: application/json\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed before response")
+    status = int(status_line.split()[1])
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, True
+
+    return status, headers.get('connection') == 'close'
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], statuses: Dict, elapsed: float) -> dict:
+    """Reduce raw samples to throughput and tail-latency figures (milliseconds)"""
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 500)
+    return {
+        'requests': len(ordered),
+        'ok': ok,
+        'errors': len(ordered) - ok,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'p999_ms': round(percentile(ordered, 99.9) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+async def run_closed_loop(host: str, port: int, next_request: Callable[[], RequestSpec],
+                          concurrency: int, duration: float, timeout: float = 30.0) -> dict:
+    """Keep `concurrency` connections busy back-to-back for `duration` seconds"""
+    latencies: List[float] = []
+    statuses: Dict = {}
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        conn: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        while time.perf_counter() < deadline:
+            method, path, body = next_request()
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                status, must_close = await asyncio.wait_for(
+                    send_request(conn[0], conn[1], host, method, path, body), timeout
+                )
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                status, must_close = 'error', True
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if must_close and conn is not None:
+                conn[1].close()
+                conn = None
+        if conn is not None:
+            conn[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+async def run_open_loop(host: str, port: int, next_request: Callable[[], Tuple[str, RequestSpec]],
+                        rate: float, duration: float, max_connections: int = 256,
+                        timeout: float = 30.0) -> Dict[str, dict]:
+    """
+    Issue requests at a fixed `rate` per second for `duration` seconds, whatever the response times.
+
+    next_request returns (label, request) so a mix can be reported per request type. Latency is
+    measured from each request's scheduled start, not from when a connection became free, so
+    time spent queued behind a slow server counts (no coordinated omission). At most
+    max_connections requests are in flight; the rest wait for a connection.
+    Returns {'all': summary, <label>: summary, ...}.
+    """
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, Dict] = {}
+    idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+    slots = asyncio.Semaphore(max_connections)
+    interval = 1.0 / rate
+
+    async def issue(label: str, spec: RequestSpec, scheduled: float):
+        method, path, body = spec
+        async with slots:
+            conn = idle.pop() if idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                status, must_close = await asyncio.wait_for(
+                    send_request(conn[0], conn[1], host, method, path, body), timeout
+                )
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                status, must_close = 'error', True
+            latencies.setdefault(label, []).append(time.perf_counter() - scheduled)
+            by_status = statuses.setdefault(label, {})
+            by_status[status] = by_status.get(status, 0) + 1
+            if conn is not None:
+                if must_close:
+                    conn[1].close()
+                else:
+                    idle.append(conn)
+
+    started = time.perf_counter()
+    tasks = []
+    for index in range(int(rate * duration)):
+        scheduled = started + index * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        label, spec = next_request()
+        tasks.append(asyncio.ensure_future(issue(label, spec, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    for conn in idle:
+        conn[1].close()
+
+    results = {'all': summarize(
+        [value for values in latencies.values() for value in values],
+        {status: sum(by_status.get(status, 0) for by_status in statuses.values())
+         for status in {status for by_status in statuses.values() for status in by_status}},
+        elapsed
+    )}
+    for label in sorted(latencies):
+        results[label] = summarize(latencies[label], statuses[label], elapsed)
+    return results
+
+
+async def wait_until_up(host: str, port: int, path: str = '/live', timeout: float = 30.0) -> bool:
+    """Poll an endpoint until it answers 200 or the timeout expires"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            status, _ = await send_request(reader, writer, host, 'GET', path)
+            writer.close()
+            if status == 200:
+                return True
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        await asyncio.sleep(0.2)
+    return False
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of building a GET /api/data page in Python vs. in Postgres
+
+Calls service-a's two page loaders directly, against the Postgres given by the usual DB_*
+variables, for each page size:
+
+    load_data_page          rows fetched into dicts, reshaped, then json.dumps
+    load_data_page_from_db  items rendered as JSON by Postgres and copied through as bytes
+
+For each it reports the median wall time, the CPU time spent in this process (what a gunicorn
+worker pays; Postgres runs elsewhere), the peak memory traced by tracemalloc and the number of
+generation-0 garbage collections per 1,000 requests (a proxy for objects allocated). Results are
+printed as JSON. app_data and its keyset index are created if missing, and the table is topped up to
+the largest limit with --seed.
+
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres \\
+        python benchmarks/json_render.py --limits 100 1000 10000 --requests 200 --seed
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import logging
+import statistics
+import tracemalloc
+
+import psycopg2
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'service-a')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_data (
+    id SERIAL PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+-- The keyset index GET /api/data is written against
+CREATE INDEX IF NOT EXISTS app_data_created_at_id ON app_data (created_at DESC, id DESC)
+"""
+
+
+def prepare_table(rows: int, seed: bool):
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST'), port=int(os.getenv('DB_PORT', '5432')),
+        dbname=os.getenv('DB_NAME', 'cloudphoenix'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA)
+            cursor.execute('SELECT count(*) FROM app_data')
+            missing = rows - cursor.fetchone()[0]
+            if missing > 0:
+                if not seed:
+                    raise SystemExit(f"app_data needs {missing} more rows for the largest limit; rerun with --seed")
+                logger.info(f"Seeding {missing} rows")
+                cursor.execute(
+                    "INSERT INTO app_data (data) SELECT 'benchmark row ' || i || ' ' || md5(i::text) "
+                    "FROM generate_series(1, %s) AS i", (missing,)
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def measure(loader, limit: int, requests: int) -> dict:
+    loader(None, limit)  # warm the pool and the plan cache
+
+    wall = []
+    gc0_before = gc.get_stats()[0]['collections']
+    cpu_start = time.process_time()
+    for _ in range(requests):
+        start = time.perf_counter()
+        _, document = loader(None, limit)
+        wall.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    gc0 = gc.get_stats()[0]['collections'] - gc0_before
+
+    # Separate pass: tracing allocations slows everything down
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(requests, 20)):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        loader(None, limit)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        'wall_ms_p50': round(statistics.median(wall) * 1000, 3),
+        'cpu_ms_per_request': round(cpu / requests * 1000, 3),
+        'peak_alloc_kib': round(statistics.median(peaks) / 1024, 1),
+        'gc_gen0_per_1k_requests': round(gc0 / requests * 1000, 1),
+        'document_bytes': len(document),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limits', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per loader and limit')
+    parser.add_argument('--seed', action='store_true', help='Insert rows if app_data is too small')
+    args = parser.parse_args()
+
+    if not os.getenv('DB_HOST'):
+        logger.error("DB_HOST must point at a local Postgres")
+        sys.exit(1)
+
+    prepare_table(max(args.limits) + 1, args.seed)
+
+    sys.path.insert(0, SERVICE_DIR)
+    import app
+    logging.getLogger('app').setLevel(logging.WARNING)
+    if not app.init_db_pool():
+        logger.error("Could not connect to Postgres")
+        sys.exit(1)
+
+    results = []
+    for limit in args.limits:
+        python = measure(app.load_data_page, limit, args.requests)
+        postgres = measure(app.load_data_page_from_db, limit, args.requests)
+        logger.info(f"limit={limit}: {python['cpu_ms_per_request']} -> {postgres['cpu_ms_per_request']} CPU ms")
+        results.append({
+            'limit': limit,
+            'python': python,
+            'postgres': postgres,
+            'cpu_saving': round(1 - postgres['cpu_ms_per_request'] / python['cpu_ms_per_request'], 3),
+            'peak_alloc_saving': round(1 - postgres['peak_alloc_kib'] / python['peak_alloc_kib'], 3),
+        })
+
+    app.db_pool.closeall()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
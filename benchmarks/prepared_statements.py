@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Per-query cost of the hot statements with and without server-side prepared statements
+
+Runs each statement service-a and service-b send on their hot paths against the Postgres given by
+the usual DB_* variables, first as a plain parameterised query (parsed and planned on every call),
+then through PreparedStatements (PREPARE once per connection, then EXECUTE):
+
+    insert      INSERT ... RETURNING behind POST /api/data and POST /api/process
+    page        GET /api/data first page (the keyset SELECT ... ORDER BY created_at DESC LIMIT)
+    page_after  GET /api/data later pages (keyset SELECT with a cursor)
+    page_json   GET /api/data first page rendered by Postgres (the default, DATA_RENDER_IN_DB)
+
+For each it reports the median and p99 round trip in microseconds and the saving per query.
+Inserts run in a transaction that is rolled back, so app_data is left as it was. Results are
+printed as JSON. Use --seed to top app_data up so the page queries read real rows.
+
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres \\
+        python benchmarks/prepared_statements.py --queries 5000 --seed
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import statistics
+
+import psycopg2
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'service-a')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_data (
+    id SERIAL PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS app_data_created_at_id ON app_data (created_at DESC, id DESC)
+"""
+
+
+def connect(options: str = ''):
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST'), port=int(os.getenv('DB_PORT', '5432')),
+        dbname=os.getenv('DB_NAME', 'cloudphoenix'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD'),
+        options=options
+    )
+
+
+def prepare_table(rows: int, seed: bool):
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA)
+            cursor.execute('SELECT count(*) FROM app_data')
+            missing = rows - cursor.fetchone()[0]
+            if missing > 0 and seed:
+                logger.info(f"Seeding {missing} rows")
+                cursor.execute(
+                    "INSERT INTO app_data (data) SELECT 'benchmark row ' || i || ' ' || md5(i::text) "
+                    "FROM generate_series(1, %s) AS i", (missing,)
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def measure(run, conn, queries: int, rollback: bool) -> dict:
+    cursor = conn.cursor()
+    for _ in range(20):  # warm the connection (and prepare, when prepared)
+        run(cursor)
+        cursor.fetchall()
+    conn.rollback()
+
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        run(cursor)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+        if not rollback:
+            conn.rollback()
+    conn.rollback()
+    cursor.close()
+
+    timings.sort()
+    return {
+        'p50_us': round(statistics.median(timings) * 1e6, 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=5000, help='Executions per statement and mode')
+    parser.add_argument('--limit', type=int, default=100, help='Page size for the page queries')
+    parser.add_argument('--seed', action='store_true', help='Insert rows if app_data is smaller than 10 pages')
+    args = parser.parse_args()
+
+    if not os.getenv('DB_HOST'):
+        logger.error("DB_HOST must point at a local Postgres")
+        sys.exit(1)
+
+    prepare_table(args.limit * 10, args.seed)
+
+    sys.path.insert(0, SERVICE_DIR)
+    import app
+    from prepared_statements import PreparedStatements
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    # Session settings as in the services (plan_cache_mode only affects prepared statements)
+    conn = connect(app.DB_SESSION_OPTIONS)
+    with conn.cursor() as cursor:
+        cursor.execute(*app.build_keyset_query(None, args.limit))
+        rows = cursor.fetchall()
+    conn.rollback()
+    after = (rows[-1][2], rows[-1][0]) if rows else (app.datetime.now(), 0)
+
+    statements = {
+        'insert': ((app.INSERT_ROW_SQL, ('benchmark insert',)), True),
+        'page': (app.build_keyset_query(None, args.limit + 1), False),
+        'page_after': (app.build_keyset_query(after, args.limit + 1), False),
+        'page_json': (app.build_page_json_query(None, args.limit), False),
+    }
+
+    prepared = PreparedStatements()
+    results = []
+    for name, ((sql, params), rollback) in statements.items():
+        plain = measure(lambda cursor: cursor.execute(sql, params), conn, args.queries, rollback)
+        with_prepare = measure(lambda cursor: prepared.execute(cursor, sql, params), conn, args.queries, rollback)
+        saving = plain['p50_us'] - with_prepare['p50_us']
+        logger.info(f"{name}: {plain['p50_us']} -> {with_prepare['p50_us']} us per query")
+        results.append({
+            'statement': name,
+            'plain': plain,
+            'prepared': with_prepare,
+            'saving_us_per_query': round(saving, 1),
+            'saving': round(saving / plain['p50_us'], 3),
+        })
+
+    conn.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
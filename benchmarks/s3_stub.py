@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+In-memory S3 stand-in for benchmarks
+Implements the handful of path-style S3 calls the services make (ListBuckets, Put/Get/Head/DeleteObject)
+without checking signatures. Point a service at it with AWS_ENDPOINT_URL_S3=http://127.0.0.1:<port>.
+
+    python benchmarks/s3_stub.py --port 9000
+"""
+
+import argparse
+import hashlib
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import unquote, urlsplit
+
+LIST_BUCKETS_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<ListAllMyBucketsResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+    '<Owner><ID>benchmark</ID><DisplayName>benchmark</DisplayName></Owner>'
+    '<Buckets>{buckets}</Buckets></ListAllMyBucketsResult>'
+)
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _split(self) -> Tuple[str, str]:
+        path = unquote(urlsplit(self.path).path).lstrip('/')
+        bucket, _, key = path.partition('/')
+        return bucket, key
+
+    def _reply(self, status: int, body: bytes = b'', headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        bucket, key = self._split()
+        objects = self.server.objects
+        if not bucket:
+            buckets = ''.join(
+                f'<Bucket><Name>{name}</Name><CreationDate>{datetime.utcnow().isoformat()}Z</CreationDate></Bucket>'
+                for name in sorted({bucket for bucket, _ in objects} | self.server.buckets)
+            )
+            return self._reply(200, LIST_BUCKETS_TEMPLATE.format(buckets=buckets).encode(),
+                               {'Content-Type': 'application/xml'})
+        body = objects.get((bucket, key))
+        if body is None:
+            return self._reply(404, b'<Error><Code>NoSuchKey</Code></Error>', {'Content-Type': 'application/xml'})
+        self._reply(200, body, {'ETag': f'"{hashlib.md5(body).hexdigest()}"',
+                                'Content-Type': 'application/octet-stream'})
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        bucket, key = self._split()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if key:
+            self.server.objects[(bucket, key)] = body
+        else:
+            self.server.buckets.add(bucket)
+        self._reply(200, b'', {'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+
+    def do_DELETE(self):
+        self.server.objects.pop(self._split(), None)
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_s3_stub(host: str = '127.0.0.1', port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve the stub from a daemon thread; returns (server, endpoint URL)"""
+    server = ThreadingHTTPServer((host, port), _S3Handler)
+    server.daemon_threads = True
+    server.objects = {}
+    server.buckets = {'cloudphoenix-benchmark'}
+    threading.Thread(target=server.serve_forever, name='s3-stub', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    args = parser.parse_args()
+    server, url = start_s3_stub(args.host, args.port)
+    print(f"S3 stand-in listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Throughput and tail-latency benchmark for service-a and service-b
+
+Each service involved in the request mix is started under its own gunicorn_config.py against a
+local Postgres (the usual DB_* variables; the app_data table is created if missing) and an
+in-memory S3 stand-in, then driven at a fixed request rate with the given mix. Per request type
+it reports throughput and p50/p95/p99/p99.9 latency as JSON. Latency is measured from each
+request's scheduled send time, so queueing inside an overloaded server is included.
+
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres \\
+        python benchmarks/service_bench.py --rate 200 --duration 30 \\
+            --mix get_data=70 post_data=20 post_process=10 --output results.json
+
+Store a run with --save-baseline and later fail (exit status 1) if a run regresses against it:
+
+    python benchmarks/service_bench.py ... --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import platform
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import psycopg2
+
+from http_load import RequestSpec, run_open_loop, wait_until_up
+from s3_stub import start_s3_stub
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+# Request type -> (service that serves it, request factory)
+SCENARIOS = {
+    'get_data': ('service-a', lambda: ('GET', '/api/data?limit=20', b'')),
+    'post_data': ('service-a', lambda: ('POST', '/api/data',
+                                        json.dumps({'data': f'bench-{random.getrandbits(32)}'}).encode())),
+    'post_process': ('service-b', lambda: ('POST', '/api/process',
+                                           json.dumps({'data': f'bench-{random.getrandbits(32)}'}).encode())),
+}
+
+LATENCY_METRICS = {'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99, 'p999_ms': 99.9}
+# A percentile is only compared when at least this many samples lie above it; p99.9 of a
+# 2,000-request run is just the second-slowest request and too noisy to gate on
+MIN_TAIL_SAMPLES = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_data (
+    id SERIAL PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+)
+"""
+
+
+def parse_mix(items: List[str]) -> Dict[str, float]:
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown request type {name!r}; choose from {sorted(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def ensure_schema():
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST'), port=int(os.getenv('DB_PORT', '5432')),
+        dbname=os.getenv('DB_NAME', 'cloudphoenix'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def service(name: str, port: int, workers: int, s3_endpoint: str):
+    """Run a service under gunicorn for the duration of the block"""
+    env = dict(os.environ, PORT=str(port), GUNICORN_WORKERS=str(workers), PROBE_PORT='0',
+               AWS_ENDPOINT_URL_S3=s3_endpoint, PYTHONUNBUFFERED='1')
+    # The stand-in ignores signatures, but botocore refuses to sign without some credentials
+    env.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', 'app:app'],
+        cwd=os.path.join(SERVICES_DIR, name), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not asyncio.run(wait_until_up('127.0.0.1', port, path='/ready', timeout=60)):
+            raise RuntimeError(f"{name} did not become ready")
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_service(name: str, mix: Dict[str, float], args, port: int, s3_endpoint: str) -> Dict[str, dict]:
+    labels = list(mix)
+    weights = [mix[label] for label in labels]
+
+    def next_request() -> Tuple[str, RequestSpec]:
+        label = random.choices(labels, weights)[0]
+        return label, SCENARIOS[label][1]()
+
+    with service(name, port, args.workers, s3_endpoint):
+        if args.warmup:
+            logger.info(f"{name}: warming up for {args.warmup}s")
+            asyncio.run(run_open_loop('127.0.0.1', port, next_request, args.rate, args.warmup,
+                                      args.max_connections))
+        logger.info(f"{name}: {args.rate} req/s for {args.duration}s, mix {mix}")
+        return asyncio.run(run_open_loop('127.0.0.1', port, next_request, args.rate, args.duration,
+                                         args.max_connections))
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """List every figure that is worse than the baseline by more than the tolerance"""
+    regressions = []
+    for name, by_label in baseline['results'].items():
+        for label, expected in by_label.items():
+            actual = results['results'].get(name, {}).get(label)
+            if actual is None:
+                continue
+            where = f"{name} {label}"
+            for metric, pct in LATENCY_METRICS.items():
+                if min(actual['requests'], expected['requests']) * (100 - pct) / 100 < MIN_TAIL_SAMPLES:
+                    continue
+                limit = expected[metric] * (1 + tolerance)
+                # Sub-millisecond jitter on fast endpoints isn't a regression
+                if actual[metric] > limit and actual[metric] - expected[metric] > min_delta_ms:
+                    regressions.append(f"{where}: {metric} {actual[metric]} > {round(limit, 3)} "
+                                       f"(baseline {expected[metric]})")
+            if actual['throughput_rps'] < expected['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{where}: throughput {actual['throughput_rps']} req/s "
+                                   f"< baseline {expected['throughput_rps']}")
+            error_rate = actual['errors'] / actual['requests'] if actual['requests'] else 0.0
+            expected_rate = expected['errors'] / expected['requests'] if expected['requests'] else 0.0
+            if error_rate > expected_rate + 0.001:
+                regressions.append(f"{where}: error rate {error_rate:.4f} > baseline {expected_rate:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', nargs='+', default=['get_data=70', 'post_data=20', 'post_process=10'],
+                        help='Request types and relative weights, e.g. get_data=70 post_data=30')
+    parser.add_argument('--rate', type=float, default=100.0, help='Requests per second sent to each service')
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds per service')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before each run')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers per service')
+    parser.add_argument('--max-connections', type=int, default=256)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    parser.add_argument('--save-baseline', help='Also write the results to this baseline file')
+    parser.add_argument('--baseline', help='Fail if results regress against this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='Ignore latency increases smaller than this many milliseconds')
+    args = parser.parse_args()
+
+    if not os.getenv('DB_HOST'):
+        logger.error("DB_HOST must point at a local Postgres")
+        sys.exit(1)
+
+    mix = parse_mix(args.mix)
+    by_service: Dict[str, Dict[str, float]] = {}
+    for label, weight in mix.items():
+        by_service.setdefault(SCENARIOS[label][0], {})[label] = weight
+
+    ensure_schema()
+    s3_server, s3_endpoint = start_s3_stub()
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'rate_per_service': args.rate,
+            'duration_s': args.duration,
+            'workers': args.workers,
+            'mix': mix,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'results': {},
+    }
+    try:
+        for name in sorted(by_service):
+            results['results'][name] = run_service(name, by_service[name], args, args.port, s3_endpoint)
+    finally:
+        s3_server.shutdown()
+
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+    else:
+        print(document)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(document + '\n')
+        logger.info(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            for regression in regressions:
+                logger.error(f"Regression: {regression}")
+            sys.exit(1)
+        logger.info(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Startup and memory footprint of a service under gunicorn, with and without preload_app
+
+For each mode the service's own gunicorn_config.py is started against the Postgres given by the
+usual DB_* variables. The benchmark records the time from launch to the first 200 from /ready on
+the probe port, then the RSS, PSS and private (USS) memory of every worker from
+/proc/<pid>/smaps_rollup (Linux only). PSS charges shared pages proportionally, so it is the figure
+that shows copy-on-write sharing. Results are printed as JSON.
+
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres \\
+        python benchmarks/startup_footprint.py --service service-a --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import subprocess
+
+from http_load import send_request
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+
+async def time_until_ready(host: str, port: int, started: float, timeout: float) -> float:
+    """Poll /ready every 10 ms and return seconds from `started` to the first 200"""
+    while time.perf_counter() - started < timeout:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            status, _ = await send_request(reader, writer, host, 'GET', '/ready')
+            writer.close()
+            if status == 200:
+                return time.perf_counter() - started
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        await asyncio.sleep(0.01)
+    raise RuntimeError(f"/ready did not return 200 within {timeout}s")
+
+
+def worker_pids(master_pid: int):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_kib(pid: int) -> dict:
+    """RSS, PSS and USS (private clean + dirty) in KiB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def measure(service: str, preload: bool, workers: int, port: int, probe_port: int,
+            settle: float, timeout: float) -> dict:
+    env = dict(os.environ, PORT=str(port), PROBE_PORT=str(probe_port), GUNICORN_WORKERS=str(workers),
+               GUNICORN_PRELOAD='true' if preload else 'false', PYTHONUNBUFFERED='1')
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', 'app:app'],
+        cwd=os.path.join(SERVICES_DIR, service), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready = asyncio.run(time_until_ready('127.0.0.1', probe_port, started, timeout))
+        # Let the remaining workers finish booting and their background threads start
+        time.sleep(settle)
+        samples = [memory_kib(pid) for pid in worker_pids(process.pid)]
+        master = memory_kib(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def mean(key):
+        return round(sum(sample[key] for sample in samples) / len(samples) / 1024, 1) if samples else None
+
+    return {
+        'service': service,
+        'preload': preload,
+        'workers': len(samples),
+        'time_to_first_ready_s': round(ready, 3),
+        'worker_rss_mib': mean('rss'),
+        'worker_pss_mib': mean('pss'),
+        'worker_uss_mib': mean('uss'),
+        'master_rss_mib': round(master['rss'] / 1024, 1),
+        'total_pss_mib': round((sum(sample['pss'] for sample in samples) + master['pss']) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--service', choices=['service-a', 'service-b'], default='service-a')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=3, help='Runs per mode; the median run is reported')
+    parser.add_argument('--settle', type=float, default=3.0, help='Seconds to wait after first ready')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--probe-port', type=int, default=18081)
+    args = parser.parse_args()
+
+    if not os.getenv('DB_HOST'):
+        logger.error("DB_HOST must point at a local Postgres with the app_data table")
+        sys.exit(1)
+
+    results = []
+    for preload in (False, True):
+        runs = []
+        for run in range(args.runs):
+            logger.info(f"{args.service}: preload={preload} run {run + 1}/{args.runs}")
+            runs.append(measure(args.service, preload, args.workers, args.port, args.probe_port,
+                                args.settle, args.timeout))
+        runs.sort(key=lambda result: result['time_to_first_ready_s'])
+        results.append(runs[len(runs) // 2])
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Admission control
+Sheds requests that have waited too long in the queue with a 503 before the app spends any work on them
+"""
+
+import math
+import time
+import socket
+import ipaddress
+import struct
+import logging
+import threading
+from typing import Callable, Optional, Sequence
+
+from werkzeug.wsgi import ClosingIterator
+
+logger = logging.getLogger(__name__)
+
+# Set by the proxy in front to the time it received the request, e.g. in nginx:
+#     proxy_set_header X-Request-Start "t=${msec}";
+# Only honoured from trusted_proxies: a client sending its own could have itself admitted or shed at will
+REQUEST_START_HEADER = 'X-Request-Start'
+_REQUEST_START_ENVIRON = 'HTTP_X_REQUEST_START'
+# WSGI environ key holding the request's queueing delay in seconds (absent when it could not be measured)
+QUEUE_DELAY_ENVIRON = 'admission.queue_delay'
+
+PROBE = 'probe'
+WRITE = 'write'
+READ = 'read'
+
+_READ_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+# struct tcp_info (Linux); for a listening socket tcpi_unacked is the length of the accept queue
+_TCP_INFO_SIZE = 104
+_TCPI_UNACKED = 24
+# Weight of the latest request in the mean service time
+_SERVICE_TIME_WEIGHT = 0.05
+_MAX_RETRY_AFTER = 30
+
+
+def parse_request_start(value: str, now: float) -> Optional[float]:
+    """Unix time in seconds from an X-Request-Start value, which proxies send as t=<seconds, ms or us>"""
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        start = float(value)
+    except ValueError:
+        return None
+    if not 0 < start < math.inf:
+        return None
+    while start > now * 100:
+        start /= 1000
+    return start
+
+
+def listen_queue_length(sock) -> Optional[int]:
+    """Connections waiting in a listening TCP socket's accept queue; None where the kernel does not say"""
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO_SIZE)
+    except (AttributeError, OSError):
+        return None
+    return struct.unpack_from('I', info, _TCPI_UNACKED)[0]
+
+
+class AdmissionController:
+    """
+    WSGI middleware shedding load with CoDel (controlled delay) before it reaches the app.
+
+    A sync gunicorn worker takes one connection at a time from the listen
+    backlog, so under overload requests wait there and are served after their
+    clients have given up. Each request's queueing delay is taken from
+    X-Request-Start when the connection comes from one of trusted_proxies
+    (addresses or networks), which must set or overwrite the header; a
+    header from anyone else is ignored. Otherwise the delay is estimated
+    from the listen socket's accept queue (Linux, once attach() has been
+    given the listeners): the connections waiting times the mean service
+    time, divided by the workers draining them. The service time is the gap
+    between a worker's consecutive requests while connections are waiting,
+    so it includes the server's own work on each request (reading, parsing,
+    writing the response) and not just the app's.
+
+    CoDel tells a standing queue from a burst by the smallest delay seen over
+    an interval: a burst drains, so some request gets through quickly, while
+    under overload even the luckiest one waits. Once the minimum over the
+    last interval exceeded `target`, reads that queued longer than target are
+    shed; otherwise, and always for writes, only those that queued longer
+    than `interval`. Paths in exempt_paths (probes, health, metrics) are
+    never shed. A shed request gets 503 with Retry-After, the standing
+    queue's delay rounded up to whole seconds.
+
+    The state is per worker: each sees its share of the pod's requests,
+    which all wait while the queue stands. An interval that ended more than
+    an interval ago (the worker was busy with a slow request) is forgotten
+    rather than judged. on_decision(priority, admitted, queue_delay) is
+    called for every request, queue_delay being None when unknown;
+    on_overload(overloaded) on each change of state; on_in_flight(count)
+    whenever a request starts or its response is closed.
+    """
+
+    def __init__(self, app: Callable, target: float = 0.05, interval: float = 0.5,
+                 exempt_paths: Sequence[str] = (), trusted_proxies: Sequence[str] = (), enabled: bool = True,
+                 on_decision: Optional[Callable[[str, bool, Optional[float]], None]] = None,
+                 on_overload: Optional[Callable[[bool], None]] = None,
+                 on_in_flight: Optional[Callable[[int], None]] = None):
+        self.app = app
+        self.target = target
+        self.interval = interval
+        self.exempt_paths = frozenset(exempt_paths)
+        self.trusted_proxies = tuple(ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies)
+        self.enabled = enabled
+        self.on_decision = on_decision or (lambda priority, admitted, queue_delay: None)
+        self.on_overload = on_overload or (lambda overloaded: None)
+        self.on_in_flight = on_in_flight or (lambda count: None)
+        self.listeners: Sequence = ()
+        self.workers = 1
+        self.in_flight = 0
+        self.service_time = 0.0
+        self.overloaded = False
+        self._interval_end = 0.0
+        self._min_delay = 0.0
+        self._standing_delay = 0.0
+        self._last_start = 0.0
+        self._lock = threading.Lock()
+
+    def attach(self, listeners: Sequence, workers: int):
+        """Estimate queueing from these listen sockets' backlog, drained by `workers` processes"""
+        self.listeners = tuple(listeners)
+        self.workers = max(1, workers)
+
+    def __call__(self, environ, start_response):
+        priority = self.priority(environ)
+        delay = self.queue_delay(environ)
+        if delay is not None:
+            environ[QUEUE_DELAY_ENVIRON] = delay
+        admitted = priority == PROBE or not self.enabled or delay is None or self._admit(priority, delay)
+        self.on_decision(priority, admitted, delay)
+        if not admitted:
+            return self._shed(start_response)
+
+        self._started()
+        try:
+            app_iter = self.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        return ClosingIterator(app_iter, self._finished)
+
+    def priority(self, environ) -> str:
+        if environ.get('PATH_INFO', '') in self.exempt_paths:
+            return PROBE
+        return READ if environ.get('REQUEST_METHOD', 'GET') in _READ_METHODS else WRITE
+
+    def queue_delay(self, environ) -> Optional[float]:
+        """Seconds the request waited before reaching this worker, or None when unknown"""
+        header = environ.get(_REQUEST_START_ENVIRON)
+        if header and self._from_trusted_proxy(environ):
+            now = time.time()
+            started = parse_request_start(header, now)
+            if started is not None:
+                # Clocks of the proxy's host and this one may disagree by a little either way
+                return max(0.0, now - started)
+        queued = None
+        for listener in self.listeners:
+            length = listen_queue_length(listener)
+            if length is not None:
+                queued = (queued or 0) + length
+        if queued is None:
+            return None
+        self._measure_service_time(queued)
+        return queued * self.service_time / self.workers
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'overloaded': self.overloaded,
+                'in_flight': self.in_flight,
+                'standing_delay_ms': round(self._standing_delay * 1000, 1),
+                'mean_service_ms': round(self.service_time * 1000, 1),
+            }
+
+    def _from_trusted_proxy(self, environ) -> bool:
+        if not self.trusted_proxies:
+            return False
+        try:
+            address = ipaddress.ip_address(environ.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False  # e.g. a unix socket
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return any(address in network for network in self.trusted_proxies)
+
+    def _admit(self, priority: str, delay: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            was_overloaded = self.overloaded
+            if now >= self._interval_end:
+                stale = now >= self._interval_end + self.interval
+                self.overloaded = not stale and self._min_delay > self.target
+                self._standing_delay = self._min_delay if self.overloaded else 0.0
+                self._interval_end = now + self.interval
+                self._min_delay = delay
+            elif delay < self._min_delay:
+                self._min_delay = delay
+            overloaded = self.overloaded
+            standing = self._standing_delay
+        if overloaded != was_overloaded:
+            if overloaded:
+                logger.warning(f"Requests are queueing for at least {standing * 1000:.0f}ms; "
+                               f"shedding reads queued over {self.target * 1000:.0f}ms")
+            else:
+                logger.info("Request queue drained; admitting all requests")
+            self.on_overload(overloaded)
+        limit = self.target if overloaded and priority == READ else self.interval
+        return delay <= limit
+
+    def _shed(self, start_response):
+        retry_after = min(_MAX_RETRY_AFTER, max(1, math.ceil(self._standing_delay)))
+        body = b'{"error":"Service overloaded, retry later"}'
+        start_response('503 Service Unavailable', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', str(retry_after)),
+        ])
+        return [body]
+
+    def _started(self):
+        with self._lock:
+            self.in_flight += 1
+            count = self.in_flight
+        self.on_in_flight(count)
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+            count = self.in_flight
+        self.on_in_flight(count)
+
+    def _measure_service_time(self, queued: int):
+        now = time.monotonic()
+        with self._lock:
+            previous, self._last_start = self._last_start, now
+            # With connections waiting, the worker went straight from the previous request to this one;
+            # a gap longer than an interval is a slow request (an export, say) or an idle spell before a burst
+            seconds = now - previous
+            if not queued or not previous or seconds > self.interval:
+                return
+            if self.service_time:
+                self.service_time += _SERVICE_TIME_WEIGHT * (seconds - self.service_time)
+            else:
+                self.service_time = seconds
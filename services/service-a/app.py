@@ -9,29 +9,49 @@ import sys
 import time
 import signal
 import json
+import base64
+import codecs
+import hashlib
+import hmac
 import logging
+import threading
 import traceback
 from contextlib import contextmanager
 from functools import wraps
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Tuple
 from datetime import datetime
 
-from flask import Flask, jsonify, request, g
-import psycopg2
-from psycopg2 import pool, OperationalError, InterfaceError
-from psycopg2.extras import RealDictCursor
-import boto3
-from botocore.exceptions import ClientError, BotoCoreError
-from botocore.config import Config
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+# Imported first so that, with STARTUP_PROFILE=true, the imports below are timed
+from startup_profile import startup_profiler
+
+from flask import Flask, jsonify, request, g, Response, has_request_context, stream_with_context
+from psycopg2 import OperationalError, InterfaceError, errors
+from psycopg2.pool import PoolError
+
+from admission import QUEUE_DELAY_ENVIRON, AdmissionController
+from circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from cloud_metadata import CloudMetadata
+from data_export import available_compressions, stream_copy
+from conn_budget import ConnectionBudget, pod_budget
+from db_pool import ConnectionPool
+from deadline import DeadlineExceeded, parse_deadline, remaining
+from group_commit import GroupCommitWriter
+from health_prober import HealthProber
+from idempotency import MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyStore
+from log_pipeline import RequestLogSampler, configure_logging
+from metrics import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from object_storage import InvalidObjectRequest, ObjectStore
+from prepared_statements import PreparedStatements
+from probe_server import ProbeServer
+from replica_router import Replica, ReplicaRouter
+from response_cache import ResponseCache
+from schema import IndexBuilder
+
+# Configure structured logging: JSON lines written to stdout by a background thread from a bounded queue
+configure_logging(
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'info').upper(), logging.INFO),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    on_drop=lambda: LOG_RECORDS_DROPPED.inc()
 )
 logger = logging.getLogger(__name__)
 
@@ -39,20 +59,222 @@ app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 
 # Application state
-db_pool: Optional[pool.ThreadedConnectionPool] = None
-s3_client: Optional[boto3.client] = None
+db_pool: Optional[ConnectionPool] = None
+replica_router: Optional[ReplicaRouter] = None
+s3_client: Optional[Any] = None  # boto3 S3 client, see init_s3()
 shutdown_flag = False
+# Tells the gunicorn master this worker is alive while it streams a long response
+worker_heartbeat: Optional[Callable[[], None]] = None
 
 # Configuration
 DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
 DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
 DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '20'))
-S3_RETRY_CONFIG = Config(
-    retries={'max_attempts': 3, 'mode': 'adaptive'},
-    connect_timeout=10,
-    read_timeout=10
+# Postgres connections for the whole pod, split across its workers; 0 lets every worker open DB_POOL_MAX.
+# With DB_CONN_BUDGET_DEPLOYMENT set, each pod also stays within its 1/DB_CONN_BUDGET_MAX_PODS share of it.
+DB_CONN_BUDGET = pod_budget(
+    int(os.getenv('DB_CONN_BUDGET_POD', '0')),
+    int(os.getenv('DB_CONN_BUDGET_DEPLOYMENT', '0')),
+    int(os.getenv('DB_CONN_BUDGET_MAX_PODS', '0'))
 )
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+# Connections idle at least this long are checked with SELECT 1 before use
+DB_POOL_VALIDATE_AFTER = float(os.getenv('DB_POOL_VALIDATE_AFTER', '1'))
+# Prepare the hot statements once per connection; turn off behind PgBouncer in transaction mode,
+# where consecutive transactions may run on different server sessions
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+# Time budget of a request that sends no X-Request-Deadline or X-Request-Timeout header, and the most
+# one may ask for; keep it under gunicorn's 30 s worker timeout and the load balancer's idle timeout
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '25'))
+REQUEST_TIMEOUT_MAX = float(os.getenv('REQUEST_TIMEOUT_MAX', str(REQUEST_TIMEOUT)))
+# Session statement timeout: the limit for work outside a request, and for requests on their default
+# budget. Transactions of requests with less time left get SET LOCAL statement_timeout instead.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', str(int(REQUEST_TIMEOUT * 1000))))
+# Prepared statements use their generic plan: for the LIMIT and keyset statements Postgres would
+# otherwise pick a custom plan, i.e. plan again, on every execution
+DB_SESSION_OPTIONS = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}' + (
+    ' -c plan_cache_mode=force_generic_plan' if DB_PREPARED_STATEMENTS else ''
+)
+# Circuit breakers: once CIRCUIT_BREAKER_FAILURE_RATIO of the calls to the database (or to S3) in the
+# last CIRCUIT_BREAKER_WINDOW_SECONDS fail, calls are refused at once for CIRCUIT_BREAKER_OPEN_SECONDS
+# (doubling per consecutive trip, up to the max) instead of each waiting out the connect/acquire timeouts
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_BREAKER_FAILURE_RATIO = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATIO', '0.5'))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', '20'))
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW_SECONDS', '10'))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '5'))
+CIRCUIT_BREAKER_MAX_OPEN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_MAX_OPEN_SECONDS', '60'))
+# Retries of failed database reads: at most this fraction of calls, with jittered exponential backoff
+DB_RETRY_BUDGET_RATIO = float(os.getenv('DB_RETRY_BUDGET_RATIO', '0.1'))
+DB_RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', '0.05'))
+DB_RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', '1'))
+# Admission control (CoDel): once even the least-delayed request of an ADMISSION_INTERVAL_MS interval
+# queued longer than ADMISSION_TARGET_MS, reads that queued longer than the target get 503; writes
+# only after queueing a whole interval. Set the target above the clock skew between proxy and pods.
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+ADMISSION_TARGET = float(os.getenv('ADMISSION_TARGET_MS', '50')) / 1000
+ADMISSION_INTERVAL = float(os.getenv('ADMISSION_INTERVAL_MS', '500')) / 1000
+# Proxies (comma-separated addresses or CIDRs) whose X-Request-Start is trusted as the time a request
+# arrived; empty ignores the header and estimates queueing from the listen backlog
+ADMISSION_TRUSTED_PROXIES = [
+    proxy.strip() for proxy in os.getenv('ADMISSION_TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
+# Read replicas (comma-separated host[:port]) for GET /api/data; reads fall back to the primary
+# when no replica is within DB_REPLICA_MAX_LAG_SECONDS of it
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '2'))
+DB_REPLICA_POOL_MAX = int(os.getenv('DB_REPLICA_POOL_MAX', '5'))
+# A busy replica pool spills reads over to the primary instead of queueing them
+DB_REPLICA_ACQUIRE_TIMEOUT = float(os.getenv('DB_REPLICA_ACQUIRE_TIMEOUT', '0.05'))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+# botocore Config for the shared S3 client; see s3_config(). Point it at a local S3 stand-in with
+# AWS_ENDPOINT_URL_S3 (and S3_ADDRESSING_STYLE=path unless the stand-in serves bucket subdomains)
+S3_CLIENT_CONFIG = {
+    'retries': {'max_attempts': 3, 'mode': 'adaptive'},
+    'connect_timeout': 10,
+    'read_timeout': 10,
+    # Presigned URLs are SigV4 (the only scheme newer regions accept) for the regional endpoint
+    'signature_version': 's3v4',
+    's3': {
+        'addressing_style': os.getenv('S3_ADDRESSING_STYLE', 'auto'),
+        'us_east_1_regional_endpoint': 'regional'
+    },
+    # Connections the client keeps for concurrent calls, kept alive between them
+    'max_pool_connections': int(os.getenv('S3_MAX_POOL_CONNECTIONS', '25')),
+    'tcp_keepalive': True
+}
+# Bucket for direct client uploads and downloads through presigned URLs; /api/objects is off without it
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+# Client keys live under this prefix and cannot leave it
+S3_OBJECT_PREFIX = os.getenv('S3_OBJECT_PREFIX', 'uploads/')
+S3_PRESIGN_TTL = int(os.getenv('S3_PRESIGN_TTL', '900'))
+# Parts of a large upload may be sent long after it starts
+S3_MULTIPART_URL_TTL = int(os.getenv('S3_MULTIPART_URL_TTL', '3600'))
+# Bearer token required by /api/objects
+OBJECTS_API_TOKEN = os.getenv('OBJECTS_API_TOKEN', '')
+# Build the S3 client's service model in the gunicorn master, shared copy-on-write by the workers.
+# It costs about 130 ms (importing boto3, parsing the model) before any worker is forked, so set
+# false where the first request matters more than worker memory
+S3_PRELOAD = os.getenv('S3_PRELOAD', 'true').lower() == 'true'
+# Cap on the wait between attempts while a worker keeps trying to reach the database at startup
+DB_INIT_RETRY_MAX_DELAY = float(os.getenv('DB_INIT_RETRY_MAX_DELAY', '10'))
 HEALTH_CHECK_TIMEOUT = int(os.getenv('HEALTH_CHECK_TIMEOUT', '5'))
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '5'))
+# Port for the standalone /live and /ready listener; 0 disables it
+PROBE_PORT = int(os.getenv('PROBE_PORT', '8081'))
+# A snapshot older than this means probe rounds are not completing
+HEALTH_SNAPSHOT_MAX_AGE = float(os.getenv(
+    'HEALTH_SNAPSHOT_MAX_AGE', str(3 * HEALTH_CHECK_INTERVAL + HEALTH_CHECK_TIMEOUT)
+))
+CLOUD_METADATA_TIMEOUT = float(os.getenv('CLOUD_METADATA_TIMEOUT', '1'))
+CLOUD_METADATA_REFRESH_INTERVAL = float(os.getenv('CLOUD_METADATA_REFRESH_INTERVAL', '300'))
+# Errors and slow requests are always logged; other requests at LOG_SAMPLE_RATE
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_SLOW_REQUEST_SECONDS = float(os.getenv('LOG_SLOW_REQUEST_SECONDS', '1'))
+GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'false').lower() == 'true'
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', '2'))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv('GROUP_COMMIT_MAX_ROWS', '100'))
+DATA_CACHE_ENABLED = os.getenv('DATA_CACHE_ENABLED', 'true').lower() == 'true'
+DATA_CACHE_MAX_ENTRIES = int(os.getenv('DATA_CACHE_MAX_ENTRIES', '256'))
+DATA_CACHE_TTL_SECONDS = float(os.getenv('DATA_CACHE_TTL_SECONDS', '1'))
+# Let Postgres render GET /api/data items as JSON and pass the bytes through undecoded
+DATA_RENDER_IN_DB = os.getenv('DATA_RENDER_IN_DB', 'true').lower() == 'true'
+# Retried writes carrying the same Idempotency-Key within the TTL get the first response back
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_BLOOM_CAPACITY = int(os.getenv('IDEMPOTENCY_BLOOM_CAPACITY', '100000'))
+IDEMPOTENCY_BLOOM_ERROR_RATE = float(os.getenv('IDEMPOTENCY_BLOOM_ERROR_RATE', '0.01'))
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains; preload',
+    'Content-Security-Policy': "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:",
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+    'Permissions-Policy': 'geolocation=(), microphone=(), camera=()',
+}
+DATA_PAGE_MAX = int(os.getenv('DATA_PAGE_MAX', '100'))
+DATA_STREAM_CHUNK_SIZE = int(os.getenv('DATA_STREAM_CHUNK_SIZE', '1000'))
+DATA_MAX_CHARS = 10000
+DATA_BATCH_MAX_ITEMS = int(os.getenv('DATA_BATCH_MAX_ITEMS', '50000'))
+DATA_BATCH_PAGE_SIZE = int(os.getenv('DATA_BATCH_PAGE_SIZE', '1000'))
+# GET /api/data/export is disabled unless a bearer token is configured
+EXPORT_API_TOKEN = os.getenv('EXPORT_API_TOKEN', '')
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', str(64 * 1024)))
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv('EXPORT_STATEMENT_TIMEOUT_MS', '0'))  # 0 = no limit
+# Exports stop this far behind the present. created_at is the start of the row's transaction, so a row
+# can commit after later rows were exported; every row whose transaction commits within this long of
+# starting is exported exactly once. Keep it well above the longest write transaction.
+EXPORT_WATERMARK_LAG = float(os.getenv('EXPORT_WATERMARK_LAG_SECONDS', '60'))
+BATCH_READ_CHUNK_SIZE = 64 * 1024
+
+DATA_CACHE_EVENTS = Counter('data_cache_events_total', 'GET /api/data cache hits, misses and evictions', ['event'])
+
+data_cache = ResponseCache(
+    max_entries=DATA_CACHE_MAX_ENTRIES,
+    ttl_seconds=DATA_CACHE_TTL_SECONDS,
+    on_event=lambda event: DATA_CACHE_EVENTS.labels(event).inc()
+) if DATA_CACHE_ENABLED else None
+
+# Metrics (aggregated across gunicorn workers through PROMETHEUS_MULTIPROC_DIR)
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route', ['method', 'route'])
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Database connections checked out of the pool')
+DB_POOL_IDLE = Gauge('db_pool_connections_idle', 'Idle database connections held by the pool')
+DB_POOL_WAITING = Gauge('db_pool_waiting_requests', 'Requests blocked waiting for a pool connection')
+DB_POOL_TIMEOUTS = Counter('db_pool_acquire_timeouts_total', 'Pool checkouts that gave up after the acquire timeout')
+DB_POOL_FLUSHES = Counter('db_pool_flushes_total', 'Times the pool discarded all connections after a failure or DNS change')
+DB_POOL_WORKER_CONNECTIONS = Gauge(
+    'db_pool_worker_connections', 'Connections held by each worker (in use + idle)', ['pid']
+)
+DB_POOL_WORKER_LIMIT = Gauge('db_pool_worker_limit', "Each worker's share of the pod connection budget", ['pid'])
+DB_READS = Counter('db_reads_total', 'Read queries by the database that served them', ['target'])
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds', 'Replay lag of each read replica as last measured by each worker', ['replica', 'pid']
+)
+S3_PRESIGNED_URLS = Counter('s3_presigned_urls_total', 'Presigned S3 URLs issued, by operation', ['operation'])
+DB_STATEMENT_PREPARES = Counter(
+    'db_statement_prepares_total', 'Statements prepared on a database connection, by reason', ['reason']
+)
+IDEMPOTENCY_EVENTS = Counter(
+    'idempotency_events_total', 'Idempotency-Key handling: new keys, replays, prefilter results, conflicts', ['event']
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'circuit_breaker_transitions_total', 'Circuit breaker state changes, by dependency and new state',
+    ['dependency', 'state']
+)
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    'circuit_breaker_rejections_total', 'Calls refused at once because the dependency\'s circuit was open',
+    ['dependency']
+)
+REQUEST_DEADLINE_EXCEEDED = Counter(
+    'request_deadline_exceeded_total', 'Work refused because the request deadline had passed, by stage', ['stage']
+)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total', 'Requests admitted or shed by admission control, by priority', ['priority', 'decision']
+)
+ADMISSION_OVERLOADED = Gauge(
+    'admission_overloaded_workers', 'Workers that found a standing queue at their latest request and shed reads'
+)
+HTTP_QUEUE_DELAY = Histogram(
+    'http_request_queue_seconds', 'Time requests waited before a worker picked them up',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled')
+DB_RETRIES = Counter(
+    'db_retries_total', 'Retries of failed database operations, and retries refused by the retry budget', ['outcome']
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_acquire_wait_seconds', 'Time spent acquiring a pool connection',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+
+
+request_log_sampler = RequestLogSampler(sample_rate=LOG_SAMPLE_RATE, slow_seconds=LOG_SLOW_REQUEST_SECONDS)
 
 
 class ServiceError(Exception):
@@ -70,43 +292,162 @@ class StorageError(ServiceError):
     pass
 
 
-def retry_db_operation(max_retries=3, delay=1):
-    """Decorator for retrying database operations"""
+def make_breaker(dependency: str) -> Optional[CircuitBreaker]:
+    """Circuit breaker for one dependency, shared by the pod's workers, or None when disabled"""
+    if not CIRCUIT_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        dependency,
+        failure_ratio=CIRCUIT_BREAKER_FAILURE_RATIO,
+        min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+        window=CIRCUIT_BREAKER_WINDOW,
+        open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS,
+        max_open_seconds=CIRCUIT_BREAKER_MAX_OPEN_SECONDS,
+        on_transition=lambda state: CIRCUIT_BREAKER_TRANSITIONS.labels(dependency, state).inc()
+    )
+
+
+db_breaker = make_breaker('database')
+s3_breaker = make_breaker('s3')
+db_retry_budget = RetryBudget(ratio=DB_RETRY_BUDGET_RATIO, window=CIRCUIT_BREAKER_WINDOW)
+
+
+def is_connection_failure(e: BaseException) -> bool:
+    """A lost or refused connection, directly or behind a DatabaseError; statement timeouts don't count"""
+    if isinstance(e, DatabaseError):
+        e = e.__cause__
+    return isinstance(e, (OperationalError, InterfaceError)) and not isinstance(e, errors.QueryCanceled)
+
+
+def retry_db_operation(max_retries=3, delay=DB_RETRY_BASE_DELAY):
+    """
+    Decorator for retrying idempotent database operations after a connection failure. Retries back off
+    with full jitter, capped at DB_RETRY_MAX_DELAY, and stop once the retry budget is spent or the pause
+    would outlast the request's deadline; a refusal by the circuit breaker, a pool timeout or a statement
+    timeout is not retried.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
+            db_retry_budget.record_call()
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except (OperationalError, InterfaceError) as e:
-                    last_exception = e
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Database operation failed (attempt {attempt + 1}/{max_retries}): {e}")
-                        time.sleep(delay * (attempt + 1))
-                    else:
+                except (OperationalError, InterfaceError, DatabaseError) as e:
+                    if not is_connection_failure(e):
+                        raise
+                    pause = backoff_delay(attempt, delay, DB_RETRY_MAX_DELAY)
+                    deadline = request_deadline()
+                    if attempt == max_retries - 1:
                         logger.error(f"Database operation failed after {max_retries} attempts: {e}")
-                        raise DatabaseError(f"Database operation failed: {e}") from e
-            raise last_exception
+                    elif deadline is not None and remaining(deadline) <= pause:
+                        logger.warning(f"Database operation failed with no time left to retry: {e}")
+                    elif not db_retry_budget.try_retry():
+                        DB_RETRIES.labels('budget_exhausted').inc()
+                        logger.warning(f"Database operation failed and the retry budget is spent: {e}")
+                    else:
+                        DB_RETRIES.labels('retried').inc()
+                        logger.warning(f"Database operation failed (attempt {attempt + 1}/{max_retries}): {e}")
+                        time.sleep(pause)
+                        continue
+                    if isinstance(e, DatabaseError):
+                        raise
+                    raise DatabaseError(f"Database operation failed: {e}") from e
         return wrapper
     return decorator
 
 
+# SET LOCAL costs a round trip, so it is only sent when it shortens the session timeout by at least this
+DEADLINE_MIN_SAVING_MS = 1000
+
+
+def request_deadline() -> Optional[float]:
+    """The current request's deadline on the time.monotonic() clock, or None outside a request"""
+    return g.get('deadline') if has_request_context() else None
+
+
+def check_deadline(stage: str = 'database') -> Optional[float]:
+    """Seconds left before the current request's deadline (None outside a request); DatabaseError once it has passed"""
+    deadline = request_deadline()
+    if deadline is None:
+        return None
+    left = remaining(deadline)
+    if left <= 0:
+        REQUEST_DEADLINE_EXCEEDED.labels(stage).inc()
+        error = DeadlineExceeded(f"Request deadline passed {-left:.3f}s ago")
+        raise DatabaseError(str(error)) from error
+    return left
+
+
+def apply_statement_deadline(conn, prepared_first: bool = False):
+    """
+    Limit the connection's current transaction to the time left before the request's deadline.
+    With prepared_first the limit goes out with the caller's first statement, which must be run
+    through prepared_statements: sent on its own it would make that statement the second in its
+    transaction, which could then not be retried when its prepared statement has vanished.
+    """
+    prepared_statements.defer(conn)
+    deadline = request_deadline()
+    if deadline is None:
+        return
+    timeout_ms = max(1, int(remaining(deadline) * 1000))
+    if timeout_ms <= DB_STATEMENT_TIMEOUT_MS - DEADLINE_MIN_SAVING_MS:
+        if prepared_first:
+            prepared_statements.defer(conn, 'SET LOCAL statement_timeout = %s', (timeout_ms,))
+            return
+        cursor = conn.cursor()
+        cursor.execute('SET LOCAL statement_timeout = %s', (timeout_ms,))
+        cursor.close()
+
+
+def cancelled_by_deadline(e: BaseException) -> bool:
+    """Whether a statement was cancelled because the request ran out of time, not because the database is slow"""
+    deadline = request_deadline()
+    return isinstance(e, errors.QueryCanceled) and deadline is not None and remaining(deadline) <= 0.001
+
+
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections with proper error handling"""
+def get_db_connection(guarded: bool = True, prepared_first: bool = False):
+    """
+    Context manager for database connections with proper error handling. While the database circuit
+    is open it raises DatabaseError at once; guarded=False bypasses the breaker (health checks must
+    see the database itself) and leaves its statistics alone. prepared_first: the caller's first
+    statement goes through prepared_statements (see apply_statement_deadline).
+    """
+    left = check_deadline()
+    breaker = db_breaker if guarded else None
+    if breaker and not breaker.allow():
+        CIRCUIT_BREAKER_REJECTIONS.labels('database').inc()
+        error = CircuitOpenError('database', breaker.retry_after())
+        raise DatabaseError(str(error)) from error
+    
     conn = None
+    acquire_timeout = DB_POOL_ACQUIRE_TIMEOUT if left is None else min(DB_POOL_ACQUIRE_TIMEOUT, left)
     try:
         if not db_pool:
             raise DatabaseError("Database pool not initialized")
         
-        conn = db_pool.getconn(timeout=5)
-        if not conn:
-            raise DatabaseError("Failed to get connection from pool")
+        wait_start = time.perf_counter()
+        try:
+            conn = db_pool.getconn(timeout=acquire_timeout)
+        except PoolError as e:
+            DB_POOL_TIMEOUTS.inc()
+            # A wait cut short by the request's deadline says nothing about the database
+            if breaker and acquire_timeout == DB_POOL_ACQUIRE_TIMEOUT:
+                breaker.record_failure()
+            raise DatabaseError(f"No database connection available: {e}") from e
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - wait_start)
         
+        apply_statement_deadline(conn, prepared_first)
         yield conn
     except (OperationalError, InterfaceError) as e:
         logger.error(f"Database connection error: {e}")
+        if breaker and not cancelled_by_deadline(e):
+            breaker.record_failure()
+        if conn is None or conn.closed:
+            # A dead socket usually means a failover: every pooled connection points at the old primary
+            db_pool.flush(f"connection failure: {e}")
         if conn:
             try:
                 db_pool.putconn(conn, close=True)
@@ -116,18 +457,191 @@ def get_db_connection():
     except Exception as e:
         logger.error(f"Unexpected database error: {e}")
         if conn:
+            # The database answered; the error is the query's or the caller's
+            if breaker:
+                breaker.record_success()
+            try:
+                db_pool.putconn(conn)
+            except Exception:
+                pass
+        raise
+    except BaseException:
+        # Generator closed mid-stream (e.g. client disconnected); return the connection
+        if conn:
+            if breaker:
+                breaker.record_success()
             try:
                 db_pool.putconn(conn)
             except Exception:
                 pass
         raise
     else:
+        if breaker:
+            breaker.record_success()
         if conn:
             db_pool.putconn(conn)
+    finally:
+        record_pool_usage()
+
+
+@contextmanager
+def get_read_connection(prepared_first: bool = False):
+    """
+    Connection for read-only queries: a replica within DB_REPLICA_MAX_LAG_SECONDS if one is
+    available and has a free connection, otherwise the primary through get_db_connection()
+    """
+    left = check_deadline()
+    replica = replica_router.choose() if replica_router else None
+    conn = None
+    if replica is not None:
+        try:
+            conn = replica.pool.getconn(
+                timeout=DB_REPLICA_ACQUIRE_TIMEOUT if left is None else min(DB_REPLICA_ACQUIRE_TIMEOUT, left)
+            )
+        except PoolError:
+            pass
+        except (OperationalError, InterfaceError) as e:
+            replica_router.mark_down(replica, str(e))
+    
+    if conn is None:
+        DB_READS.labels('primary').inc()
+        with get_db_connection(prepared_first=prepared_first) as conn:
+            yield conn
+        return
+    
+    DB_READS.labels(replica.name).inc()
+    try:
+        apply_statement_deadline(conn, prepared_first)
+        yield conn
+    except (OperationalError, InterfaceError) as e:
+        logger.error(f"Read replica {replica.name} connection error: {e}")
+        if conn.closed:
+            replica_router.mark_down(replica, str(e))
+        replica.pool.putconn(conn, close=True)
+        raise DatabaseError(f"Read replica connection failed: {e}") from e
+    except BaseException:
+        replica.pool.putconn(conn)
+        raise
+    else:
+        replica.pool.putconn(conn)
+
+
+def record_pool_usage():
+    """Publish this worker's pool occupancy to the shared gauges"""
+    if db_pool:
+        stats = db_pool.stats()
+        DB_POOL_IN_USE.set(stats['in_use'])
+        DB_POOL_IDLE.set(stats['idle'])
+        DB_POOL_WAITING.set(stats['waiting'])
+        DB_POOL_WORKER_CONNECTIONS.labels(os.getpid()).set(stats['in_use'] + stats['idle'] + stats['opening'])
+
+
+def resize_db_pool(share: int):
+    """Apply this worker's share of the connection budget to its pool"""
+    maxconn = min(share, DB_POOL_MAX)
+    DB_POOL_WORKER_LIMIT.labels(os.getpid()).set(maxconn)
+    if db_pool:
+        db_pool.resize(maxconn)
+    if replica_router:
+        # Each replica is sized like the primary, so the same share keeps it within its connection limit
+        for replica in replica_router.replicas:
+            replica.pool.resize(min(share, DB_REPLICA_POOL_MAX))
+
+
+connection_budget = ConnectionBudget(DB_CONN_BUDGET, on_change=resize_db_pool) if DB_CONN_BUDGET else None
+
+
+group_commit_writer = GroupCommitWriter(
+    get_db_connection,
+    window_seconds=GROUP_COMMIT_WINDOW_MS / 1000.0,
+    max_rows=GROUP_COMMIT_MAX_ROWS
+) if GROUP_COMMIT_ENABLED else None
+
+
+INSERT_ROW_SQL = 'INSERT INTO app_data (data) VALUES (%s) RETURNING id, created_at'
+
+prepared_statements = PreparedStatements(
+    enabled=DB_PREPARED_STATEMENTS,
+    on_prepare=lambda reason: DB_STATEMENT_PREPARES.labels(reason).inc()
+)
+
+
+def insert_data_row(data_value: str):
+    """Insert one app_data row and return (id, created_at), coalescing with concurrent writers when enabled"""
+    if group_commit_writer:
+        try:
+            return group_commit_writer.insert(data_value, timeout=check_deadline())
+        except TimeoutError as e:
+            raise DatabaseError(str(e)) from e
+    
+    with get_db_connection(prepared_first=True) as conn:
+        cursor = conn.cursor()
+        prepared_statements.execute(cursor, INSERT_ROW_SQL, (data_value,))
+        row_id, created_at = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+    return row_id, created_at
 
 
-def init_db_pool() -> bool:
-    """Initialize database connection pool with retries"""
+# Built on the primary; replicas get the index through replication
+index_builder = IndexBuilder(get_db_connection)
+
+
+idempotency_store = IdempotencyStore(
+    get_db_connection,
+    ttl=IDEMPOTENCY_TTL,
+    bloom_capacity=IDEMPOTENCY_BLOOM_CAPACITY,
+    bloom_error_rate=IDEMPOTENCY_BLOOM_ERROR_RATE,
+    on_event=lambda event: IDEMPOTENCY_EVENTS.labels(event).inc()
+) if IDEMPOTENCY_ENABLED else None
+
+
+def idempotency_request() -> Optional[Tuple[str, str]]:
+    """(key, request fingerprint) if the request carries an Idempotency-Key header; ValueError if it is malformed"""
+    key = request.headers.get('Idempotency-Key')
+    if key is None or not idempotency_store:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+    return key, IdempotencyStore.fingerprint(request.method, request.path, request.get_data())
+
+
+def insert_data_row_once(idempotency: Tuple[str, str], data_value: str,
+                         describe: Callable[[int, datetime], Dict[str, Any]]) -> Tuple[int, Dict[str, Any], bool]:
+    """
+    Insert one app_data row at most once per idempotency key and return (status, body, replayed).
+    The row and the key are committed together; if the key is already held, the insert is rolled
+    back and the stored response returned. Group commit is bypassed so both share a transaction.
+    """
+    key, request_hash = idempotency
+    stored = idempotency_store.lookup(key, request_hash)
+    if stored is not None:
+        return stored[0], stored[1], True
+    
+    with get_db_connection(prepared_first=True) as conn:
+        cursor = conn.cursor()
+        prepared_statements.execute(cursor, INSERT_ROW_SQL, (data_value,))
+        body = describe(*cursor.fetchone())
+        try:
+            stored = idempotency_store.claim(cursor, key, request_hash, 201, body)
+        except IdempotencyConflict as e:
+            # A client error, not a database one: leave the connection block before raising
+            stored = e
+        if stored is None:
+            conn.commit()
+        else:
+            conn.rollback()
+        cursor.close()
+    if isinstance(stored, IdempotencyConflict):
+        raise stored
+    if stored is not None:
+        return stored[0], stored[1], True
+    idempotency_store.remember(key)
+    return 201, body, False
+
+
+def init_db_pool(max_retries: Optional[int] = 3) -> bool:
+    """Initialize database connection pool with retries (max_retries=None: until it succeeds)"""
     global db_pool
     
     db_host = os.getenv('DB_HOST')
@@ -144,42 +658,110 @@ def init_db_pool() -> bool:
         logger.warning("DB_USER or DB_PASSWORD not set, attempting IAM authentication")
         # In production, use IAM roles for RDS authentication
     
-    max_retries = 3
-    for attempt in range(max_retries):
+    maxconn = DB_POOL_MAX
+    if connection_budget:
+        maxconn = min(DB_POOL_MAX, connection_budget.rebalance())
+    
+    # Built once, with only the connecting retried: each pool registers a fork hook that keeps it alive
+    pool = ConnectionPool(
+        minconn=min(DB_POOL_MIN, maxconn),
+        maxconn=maxconn,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        max_idle=DB_POOL_MAX_IDLE,
+        validate_after=DB_POOL_VALIDATE_AFTER,
+        on_flush=lambda reason: DB_POOL_FLUSHES.inc(),
+        prefill=False,
+        host=db_host,
+        port=db_port,
+        database=db_name,
+        user=db_user,
+        password=db_password,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        options=DB_SESSION_OPTIONS
+    )
+    
+    attempt = 0
+    while True:
         try:
-            db_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=DB_POOL_MIN,
-                maxconn=DB_POOL_MAX,
-                host=db_host,
-                port=db_port,
-                database=db_name,
-                user=db_user,
-                password=db_password,
-                connect_timeout=DB_CONNECT_TIMEOUT,
-                options='-c statement_timeout=30000'  # 30 second statement timeout
-            )
+            pool.prefill()
             
-            # Test connection
-            test_conn = db_pool.getconn()
-            test_conn.close()
-            db_pool.putconn(test_conn)
+            # Test connection (validated on checkout)
+            test_conn = pool.getconn()
+            pool.putconn(test_conn)
             
-            logger.info(f"Database connection pool initialized (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+            db_pool = pool
+            if connection_budget:
+                connection_budget.ensure_started()
+            logger.info(f"Database connection pool initialized (min={db_pool.minconn}, max={maxconn})")
             return True
         except Exception as e:
-            logger.error(f"Failed to initialize DB pool (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
+            attempt += 1
+            logger.error(f"Failed to initialize DB pool (attempt {attempt}/{max_retries or 'unlimited'}): {e}")
+            if max_retries and attempt >= max_retries:
                 logger.critical("Failed to initialize database pool after all retries")
+                pool.closeall()
                 return False
+            time.sleep(min(2 ** (attempt - 1), DB_INIT_RETRY_MAX_DELAY))  # Exponential backoff
+
+
+def init_replica_router():
+    """Create a pool per read replica and start measuring their lag"""
+    global replica_router
+    if not DB_REPLICA_HOSTS:
+        return
+    
+    maxconn = DB_REPLICA_POOL_MAX
+    if connection_budget:
+        maxconn = min(maxconn, connection_budget.rebalance())
     
-    return False
+    replicas = []
+    for address in DB_REPLICA_HOSTS:
+        host, _, port = address.partition(':')
+        # No connections are opened up front: an unreachable replica must not stop the worker starting
+        pool = ConnectionPool(
+            minconn=0,
+            maxconn=maxconn,
+            acquire_timeout=DB_REPLICA_ACQUIRE_TIMEOUT,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            max_idle=DB_POOL_MAX_IDLE,
+            validate_after=DB_POOL_VALIDATE_AFTER,
+            on_flush=lambda reason: DB_POOL_FLUSHES.inc(),
+            host=host,
+            port=int(port or os.getenv('DB_PORT', '5432')),
+            database=os.getenv('DB_NAME', 'cloudphoenix'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            connect_timeout=DB_REPLICA_CONNECT_TIMEOUT,
+            options=DB_SESSION_OPTIONS
+        )
+        replicas.append(Replica(host, pool))
+    
+    replica_router = ReplicaRouter(
+        replicas,
+        max_lag=DB_REPLICA_MAX_LAG,
+        check_interval=DB_REPLICA_CHECK_INTERVAL,
+        on_lag=lambda name, lag: DB_REPLICA_LAG.labels(name, os.getpid()).set(-1 if lag is None else lag)
+    )
+    replica_router.ensure_started()
+    logger.info(f"Routing reads to {len(replicas)} read replicas within {DB_REPLICA_MAX_LAG}s of the primary")
+
+
+def s3_config():
+    """botocore Config for the S3 client"""
+    from botocore.config import Config
+    return Config(**S3_CLIENT_CONFIG)
 
 
 def init_s3() -> bool:
-    """Initialize S3 client using IAM roles (preferred) or credentials"""
+    """
+    Initialize S3 client using IAM roles (preferred) or credentials. No request is made:
+    the health prober's S3 check is the first to reach the service.
+    """
     global s3_client
+    # Only the health check uses S3; boto3 is imported here rather than at startup
+    import boto3
+    from botocore.exceptions import ClientError, BotoCoreError
     
     try:
         # Prefer IAM role over credentials
@@ -189,7 +771,7 @@ def init_s3() -> bool:
         # Check if we should use IAM role (no credentials provided)
         if not os.getenv('AWS_ACCESS_KEY_ID'):
             logger.info("Using IAM role for S3 access")
-            s3_client = boto3.client('s3', region_name=region, config=S3_RETRY_CONFIG)
+            s3_client = boto3.client('s3', region_name=region, config=s3_config())
         else:
             logger.info("Using provided credentials for S3 access")
             s3_client = boto3.client(
@@ -197,11 +779,8 @@ def init_s3() -> bool:
                 aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
                 aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
                 region_name=region,
-                config=S3_RETRY_CONFIG
+                config=s3_config()
             )
-        
-        # Test connection
-        s3_client.list_buckets()
         logger.info("S3 client initialized successfully")
         return True
     except (ClientError, BotoCoreError) as e:
@@ -212,6 +791,63 @@ def init_s3() -> bool:
         return False
 
 
+object_store = ObjectStore(
+    lambda: s3_client,
+    bucket=S3_BUCKET,
+    prefix=S3_OBJECT_PREFIX,
+    url_ttl=S3_PRESIGN_TTL,
+    multipart_url_ttl=S3_MULTIPART_URL_TTL,
+    on_presign=lambda operation: S3_PRESIGNED_URLS.labels(operation).inc()
+) if S3_BUCKET else None
+
+
+def check_database():
+    """Dependency check: round-trip a trivial query through the pool"""
+    if not db_pool:
+        return {'status': 'not_initialized'}
+    with get_db_connection(guarded=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+
+
+def check_s3():
+    """Dependency check: list buckets with the shared S3 client"""
+    if not s3_client:
+        return {'status': 'not_initialized'}
+    s3_client.list_buckets()
+
+
+def check_read_database():
+    """Dependency check for the read path: SELECT 1 on whichever database get_read_connection() picks"""
+    if not db_pool:
+        return {'status': 'not_initialized'}
+    start = time.perf_counter()
+    with get_read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+        target = conn.info.host
+    return {
+        'status': 'ok',
+        'target': 'primary' if target == db_pool.connect_kwargs.get('host') else target,
+        'response_time_ms': round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+health_checks = {'database': check_database, 's3': check_s3}
+if DB_REPLICA_HOSTS:
+    health_checks['database_read'] = check_read_database
+
+health_prober = HealthProber(
+    health_checks,
+    interval=HEALTH_CHECK_INTERVAL,
+    timeout=HEALTH_CHECK_TIMEOUT
+)
+
+cloud_metadata = CloudMetadata(timeout=CLOUD_METADATA_TIMEOUT, refresh_interval=CLOUD_METADATA_REFRESH_INTERVAL)
+
+
 def validate_request_json(required_fields=None):
     """Validate request JSON and required fields"""
     if not request.is_json:
@@ -229,11 +865,289 @@ def validate_request_json(required_fields=None):
     return True, data
 
 
+def validate_data_item(item):
+    """Validate a single {'data': ...} item and return its stripped value"""
+    if not isinstance(item, dict):
+        return False, "Item must be a JSON object"
+    if 'data' not in item:
+        return False, "Missing required fields: data"
+    
+    data_value = item['data']
+    if not isinstance(data_value, str):
+        return False, "Data field must be a string"
+    
+    data_value = data_value.strip()
+    if not data_value:
+        return False, "Data field cannot be empty"
+    
+    if len(data_value) > DATA_MAX_CHARS:  # Reasonable limit
+        return False, f"Data field too large (max {DATA_MAX_CHARS} chars)"
+    
+    return True, data_value
+
+
+def iter_json_array(stream, chunk_size=BATCH_READ_CHUNK_SIZE):
+    """Incrementally decode the elements of a top-level JSON array from a byte stream"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = '', 0, False
+    expect = 'open'
+    
+    def read_more():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+    
+    while True:
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            read_more()
+        if pos >= len(buf):
+            raise ValueError("Unexpected end of JSON array")
+        
+        char = buf[pos]
+        if expect == 'open':
+            if char != '[':
+                raise ValueError("Request body must be a JSON array")
+            pos += 1
+            expect = 'first'
+        elif expect in ('first', 'separator') and char == ']':
+            return
+        elif expect == 'separator':
+            if char != ',':
+                raise ValueError("Expected ',' or ']' in JSON array")
+            pos += 1
+            expect = 'value'
+        else:
+            while True:
+                try:
+                    value, pos = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise ValueError("Invalid JSON in request body")
+                    read_more()
+            yield value
+            expect = 'separator'
+
+
+def iter_ndjson(stream):
+    """Decode one JSON document per non-blank line from a byte stream"""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ValueError("Invalid JSON line in request body")
+
+
+def encode_cursor(created_at, row_id) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor token"""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str):
+    """Decode a cursor token back into (created_at, id), raising ValueError if malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+def build_keyset_query(after, limit: Optional[int]):
+    """Build the newest-first keyset query; served by app_data_created_at_id, which index_builder creates"""
+    sql = 'SELECT id, data, created_at FROM app_data'
+    params = []
+    if after:
+        sql += ' WHERE (created_at, id) < (%s, %s)'
+        params.extend(after)
+    sql += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    return sql, tuple(params)
+
+
+def stream_data_rows(after, limit: Optional[int]):
+    """Yield NDJSON lines from a server-side cursor, fetching DATA_STREAM_CHUNK_SIZE rows at a time"""
+    sql, params = build_keyset_query(after, limit)
+    with get_read_connection() as conn:
+        try:
+            from psycopg2.extras import RealDictCursor
+            # Named cursors live on the server, so only one chunk is held in memory at once
+            cursor = conn.cursor(name='data_stream', cursor_factory=RealDictCursor)
+            cursor.itersize = DATA_STREAM_CHUNK_SIZE
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(DATA_STREAM_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield ''.join(
+                    json.dumps({
+                        'id': row['id'],
+                        'value': row['data'],
+                        'timestamp': row['created_at'].isoformat(),
+                        'cursor': encode_cursor(row['created_at'], row['id'])
+                    }) + '\n'
+                    for row in rows
+                )
+                # A sync worker that sends nothing else for `timeout` seconds is killed mid-stream
+                if worker_heartbeat:
+                    worker_heartbeat()
+            cursor.close()
+        finally:
+            conn.rollback()
+
+
+def build_page_json_query(after, limit: int):
+    """
+    Keyset page rendered by Postgres. Returns one row: the items as a JSON array, the item count,
+    created_at and id of the last item, and whether another page exists.
+    """
+    # Fetch one extra row to know whether another page exists. Rows are numbered after the LIMIT:
+    # a window function over the whole table would stop the planner from using a top-N sort.
+    sql, params = build_keyset_query(after, limit + 1)
+    return (
+        f"WITH page AS (SELECT *, row_number() OVER (ORDER BY created_at DESC, id DESC) AS n FROM ({sql}) AS rows) "
+        # Concatenated rather than json_build_object(), which pads every key with ' : '. A NULL column
+        # would make the whole item NULL and string_agg would drop it while count(*) still counted it.
+        "SELECT '[' || COALESCE(string_agg("
+        "'{\"id\":\"item_' || n || '\",\"name\":\"Data Item ' || n || '\",\"value\":' || "
+        "COALESCE(to_json(data)::text, 'null') || "
+        # to_json() would trim trailing zeros from the fraction; isoformat() keeps all six digits and
+        # leaves the fraction out only when it is zero, so both render modes produce the same bytes.
+        "',\"status\":\"active\",\"timestamp\":' || COALESCE('\"' || to_char(created_at, CASE "
+        "WHEN date_trunc('second', created_at) = created_at THEN 'YYYY-MM-DD\"T\"HH24:MI:SS' "
+        "ELSE 'YYYY-MM-DD\"T\"HH24:MI:SS.US' END) || '\"', 'null') || '}', "
+        "',' ORDER BY n) FILTER (WHERE n <= %s), '') || ']', "
+        "count(*) FILTER (WHERE n <= %s), "
+        "max(created_at) FILTER (WHERE n = %s), max(id) FILTER (WHERE n = %s), "
+        "count(*) > %s "
+        "FROM page"
+    ), params + (limit,) * 5
+
+
+@retry_db_operation()
+def load_data_page_from_db(after, limit: int):
+    """Same document as load_data_page, with the items array built by Postgres and copied through as bytes"""
+    sql, params = build_page_json_query(after, limit)
+    with get_read_connection(prepared_first=True) as conn:
+        cursor = conn.cursor()
+        prepared_statements.execute(cursor, sql, params)
+        items, count, last_created_at, last_id, has_more = cursor.fetchone()
+        cursor.close()
+    
+    next_cursor = encode_cursor(last_created_at, last_id) if has_more else None
+    db_host = os.getenv('DB_HOST', '')
+    db_type = 'RDS PostgreSQL' if '.rds.amazonaws.com' in db_host else 'Azure SQL'
+    
+    # Left open like load_data_page's, so the caller can append request_id
+    document = b''.join((
+        b'{"items":', items.encode(), b',"count":', str(count).encode(),
+        b',"next_cursor":', json.dumps(next_cursor).encode(),
+        b',"db_type":', json.dumps(db_type).encode(), b',"db_status":"connected"'
+    ))
+    etag = hashlib.blake2b(document, digest_size=16).hexdigest()
+    return etag, document
+
+
+@retry_db_operation()
+def load_data_page(after, limit: int):
+    """Query one keyset page and return (etag, JSON document without its closing brace)"""
+    # Fetch one extra row to know whether another page exists
+    sql, params = build_keyset_query(after, limit + 1)
+    from psycopg2.extras import RealDictCursor
+    with get_read_connection(prepared_first=True) as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        prepared_statements.execute(cursor, sql, params)
+        results = cursor.fetchall()
+        cursor.close()
+    
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    
+    # Format for frontend
+    items = [
+        {
+            'id': f"item_{i+1}",
+            'name': f"Data Item {i+1}",
+            'value': row.get('data', 'N/A'),
+            'status': 'active',
+            'timestamp': row.get('created_at', '').isoformat() if hasattr(row.get('created_at', ''), 'isoformat') else str(row.get('created_at', ''))
+        }
+        for i, row in enumerate(results)
+    ]
+    
+    # Also include database status
+    db_host = os.getenv('DB_HOST', '')
+    db_type = 'RDS PostgreSQL' if '.rds.amazonaws.com' in db_host else 'Azure SQL'
+    
+    document = json.dumps({
+        'items': items,
+        'count': len(items),
+        'next_cursor': next_cursor,
+        'db_type': db_type,
+        'db_status': 'connected'
+    }, separators=(',', ':')).encode()
+    etag = hashlib.blake2b(document, digest_size=16).hexdigest()
+    # Leave the object open so the caller can append request_id
+    return etag, document[:-1]
+
+
+def record_admission(priority: str, admitted: bool, queue_delay: Optional[float]):
+    ADMISSION_DECISIONS.labels(priority, 'admitted' if admitted else 'shed').inc()
+    if queue_delay is not None:
+        HTTP_QUEUE_DELAY.observe(queue_delay)
+
+
+# Probes, health and metrics: never shed, and served whatever deadline the caller sent
+PROBE_PATHS = ('/live', '/ready', '/health', '/metrics')
+
+# Wraps Flask, so a shed request costs no routing, request context or hooks
+admission = AdmissionController(
+    app.wsgi_app,
+    target=ADMISSION_TARGET,
+    interval=ADMISSION_INTERVAL,
+    exempt_paths=PROBE_PATHS,
+    trusted_proxies=ADMISSION_TRUSTED_PROXIES,
+    enabled=ADMISSION_CONTROL_ENABLED,
+    on_decision=record_admission,
+    on_overload=lambda overloaded: ADMISSION_OVERLOADED.set(1 if overloaded else 0),
+    on_in_flight=HTTP_IN_FLIGHT.set
+)
+app.wsgi_app = admission
+
+
 @app.before_request
 def before_request():
     """Set request start time and add request ID"""
+    # The budget counts from when the request started queueing, as far as admission control can tell
+    received = time.monotonic() - request.environ.get(QUEUE_DELAY_ENVIRON, 0.0)
     g.start_time = time.time()
     g.request_id = request.headers.get('X-Request-ID', f"{int(time.time() * 1000)}")
+    if request.path in PROBE_PATHS:
+        return None
+    
+    # Everything done for the request (pool waits, statements, S3 calls) has to fit before this
+    try:
+        g.deadline = parse_deadline(request.headers, REQUEST_TIMEOUT, REQUEST_TIMEOUT_MAX, received)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    if remaining(g.deadline) <= 0:
+        REQUEST_DEADLINE_EXCEEDED.labels('arrival').inc()
+        return jsonify({'error': 'Request deadline exceeded', 'request_id': g.request_id}), 504
 
 
 @app.after_request
@@ -242,23 +1156,27 @@ def after_request(response):
     # Calculate request duration
     duration = time.time() - g.start_time
     
-    # Log request
-    logger.info(
-        f"Request: {request.method} {request.path} | "
-        f"Status: {response.status_code} | "
-        f"Duration: {duration:.3f}s | "
-        f"Request-ID: {g.request_id}"
-    )
+    # Label by URL rule rather than raw path to keep series cardinality bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    HTTP_LATENCY.labels(request.method, route).observe(duration)
+    
+    # Log request (sampled; the write happens on the log thread)
+    sample_rate = request_log_sampler.sample(response.status_code, duration)
+    if sample_rate is not None:
+        logger.info('Request completed', extra={
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'request_id': g.request_id,
+            'sample_rate': sample_rate,
+        })
     
     # Add comprehensive security headers
     response.headers['X-Request-ID'] = g.request_id
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
-    response.headers['Content-Security-Policy'] = "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; font-src 'self' data:"
-    response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-    response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
+    response.headers.update(SECURITY_HEADERS)
     
     return response
 
@@ -285,139 +1203,114 @@ def handle_exception(e):
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Comprehensive health check endpoint"""
+    """Comprehensive health check endpoint, answered from the background prober's snapshot"""
+    health_prober.ensure_started()
+    checks, age, checked_at = health_prober.snapshot()
+    
     health_status = {
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
         'service': 'service-a',
         'version': os.getenv('SERVICE_VERSION', '1.0.0'),
+        'checked_at': checked_at,
+        'snapshot_age_seconds': round(age, 3) if age is not None else None,
         'checks': {}
     }
     
-    overall_healthy = True
-    
-    # Database check with timeout
-    try:
-        if db_pool:
-            start = time.time()
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1')
-                cursor.close()
-            duration = time.time() - start
-            
-            health_status['checks']['database'] = {
-                'status': 'ok',
-                'response_time_ms': round(duration * 1000, 2)
-            }
-        else:
-            health_status['checks']['database'] = {'status': 'not_initialized'}
-            overall_healthy = False
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        health_status['checks']['database'] = {
-            'status': 'error',
-            'error': str(e) if app.debug else 'Connection failed'
-        }
-        overall_healthy = False
+    if checks is None:
+        health_status['status'] = 'starting'
+        return jsonify(health_status), 503
     
-    # S3 check with timeout
-    try:
-        if s3_client:
-            start = time.time()
-            s3_client.list_buckets()
-            duration = time.time() - start
-            
-            health_status['checks']['s3'] = {
-                'status': 'ok',
-                'response_time_ms': round(duration * 1000, 2)
-            }
-        else:
-            health_status['checks']['s3'] = {'status': 'not_initialized'}
-            overall_healthy = False
-    except Exception as e:
-        logger.error(f"S3 health check failed: {e}")
-        health_status['checks']['s3'] = {
-            'status': 'error',
-            'error': str(e) if app.debug else 'Connection failed'
-        }
-        overall_healthy = False
+    for name, result in checks.items():
+        # Don't expose dependency error details in production
+        if result.get('status') == 'error' and not app.debug:
+            result = dict(result, error='Connection failed')
+        health_status['checks'][name] = result
     
     # Determine overall status
-    if not overall_healthy:
+    if any(check.get('status') != 'ok' for check in checks.values()):
         health_status['status'] = 'degraded' if any(
-            check.get('status') == 'ok' for check in health_status['checks'].values()
+            check.get('status') == 'ok' for check in checks.values()
         ) else 'unhealthy'
     
+    if age > HEALTH_SNAPSHOT_MAX_AGE:
+        health_status['status'] = 'unhealthy'
+        health_status['reason'] = 'Health snapshot is stale'
+    
+    # Shared by the pod's workers; informational, since the checks above bypass the breakers
+    health_status['circuit_breakers'] = {
+        breaker.name: breaker.status() for breaker in (db_breaker, s3_breaker) if breaker
+    }
+    
+    # This worker's view
+    health_status['admission'] = admission.status()
+    
     status_code = 200 if health_status['status'] == 'healthy' else 503
     return jsonify(health_status), status_code
 
 
+def readiness_status():
+    """Readiness from in-memory state only; shared by /ready and the probe listener"""
+    health_prober.ensure_started()
+    checks, age, _ = health_prober.snapshot()
+    
+    # S3 only backs a health check, so readiness doesn't wait for its client
+    if not db_pool:
+        reason = 'Dependencies not initialized'
+    elif checks is None:
+        reason = 'Health checks have not completed yet'
+    elif age > HEALTH_SNAPSHOT_MAX_AGE:
+        reason = 'Health snapshot is stale'
+    elif checks['database'].get('status') != 'ok':
+        reason = f"Database check {checks['database'].get('status')}"
+    else:
+        return {'status': 'ready', 'snapshot_age_seconds': round(age, 3)}, 200
+    
+    return {'status': 'not_ready', 'reason': reason}, 503
+
+
+def liveness_status():
+    """Liveness: the process is up and its threads are being scheduled"""
+    return {
+        'status': 'alive',
+        'uptime_seconds': time.time() - app.start_time if hasattr(app, 'start_time') else 0
+    }, 200
+
+
+# Started per worker by init_worker() (gunicorn post_fork) and by main()
+probe_server = ProbeServer(
+    PROBE_PORT, {'/live': liveness_status, '/ready': readiness_status}
+) if PROBE_PORT else None
+
+
 @app.route('/ready', methods=['GET'])
 def ready():
-    """Readiness probe - checks if service can accept traffic"""
-    if db_pool and s3_client:
-        # Quick connectivity check
-        try:
-            with get_db_connection() as conn:
-                pass
-            return jsonify({'status': 'ready'}), 200
-        except Exception as e:
-            logger.warning(f"Readiness check failed: {e}")
-            return jsonify({'status': 'not_ready', 'reason': str(e)}), 503
-    
-    return jsonify({'status': 'not_ready', 'reason': 'Dependencies not initialized'}), 503
+    """Readiness probe - checks if service can accept traffic, from the cached health snapshot"""
+    payload, status_code = readiness_status()
+    return jsonify(payload), status_code
 
 
 @app.route('/live', methods=['GET'])
 def live():
     """Liveness probe - checks if service is running"""
-    return jsonify({
-        'status': 'alive',
-        'uptime_seconds': time.time() - app.start_time if hasattr(app, 'start_time') else 0
-    }), 200
+    payload, status_code = liveness_status()
+    return jsonify(payload), status_code
 
 
 @app.route('/metrics', methods=['GET'])
 def metrics():
-    """Prometheus-compatible metrics endpoint"""
-    metrics_data = {
-        'http_requests_total': 0,  # Would be tracked in production
-        'http_request_duration_seconds': 0,
-        'db_connections_active': db_pool.getconn() if db_pool else 0,
-        'db_connections_idle': (DB_POOL_MAX - db_pool.getconn()) if db_pool else 0,
-    }
-    return jsonify(metrics_data), 200
+    """Prometheus metrics endpoint, aggregated across all workers"""
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
 @app.route('/api/cloud-status', methods=['GET'])
 def cloud_status():
     """Get current cloud provider and status"""
     try:
-        # Detect cloud provider from environment variables or metadata
-        cloud_provider = os.getenv('CLOUD_PROVIDER', 'aws')
-        
-        # Try to detect from metadata services
-        try:
-            # AWS metadata
-            metadata_response = requests.get(
-                'http://169.254.169.254/latest/meta-data/instance-id',
-                timeout=2
-            )
-            if metadata_response.status_code == 200:
-                cloud_provider = 'aws'
-        except:
-            try:
-                # Azure metadata
-                metadata_response = requests.get(
-                    'http://169.254.169.254/metadata/instance?api-version=2021-02-01',
-                    headers={'Metadata': 'true'},
-                    timeout=2
-                )
-                if metadata_response.status_code == 200:
-                    cloud_provider = 'azure'
-            except:
-                pass
+        # Provider, region and instance identity come from the cached IMDS result; no network calls here
+        cloud_metadata.ensure_started()
+        identity = cloud_metadata.identity() or {}
+        cloud_provider = identity.get('provider') or os.getenv('CLOUD_PROVIDER', 'aws')
         
         # Determine database type
         db_host = os.getenv('DB_HOST', '')
@@ -429,23 +1322,24 @@ def cloud_status():
             db_type = 'Azure SQL'
             cloud_provider = 'azure'
         
-        # Check database connectivity
-        db_status = 'unknown'
-        try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1')
-                cursor.close()
-            db_status = 'connected'
-        except Exception:
-            db_status = 'disconnected'
+        # Database connectivity from the health prober's latest snapshot; with read replicas configured,
+        # the read-path check, which runs on a replica when one is within the lag bound
+        health_prober.ensure_started()
+        checks, _, _ = health_prober.snapshot()
+        db_check = (checks or {}).get('database_read') or (checks or {}).get('database', {})
+        db_status = 'connected' if db_check.get('status') == 'ok' else 'disconnected' if checks else 'unknown'
         
         return jsonify({
             'provider': cloud_provider,
             'status': 'operational' if db_status == 'connected' else 'degraded',
             'db_type': db_type,
             'db_status': db_status,
-            'region': os.getenv('AWS_REGION') or os.getenv('AZURE_LOCATION', 'unknown'),
+            'db_read_target': db_check.get('target', 'primary'),
+            'region': identity.get('region') or os.getenv('AWS_REGION') or os.getenv('AZURE_LOCATION', 'unknown'),
+            'availability_zone': identity.get('availability_zone'),
+            'instance_id': identity.get('instance_id'),
+            'instance_type': identity.get('instance_type'),
+            'metadata_detected_at': identity.get('detected_at'),
             'timestamp': datetime.utcnow().isoformat(),
             'request_id': g.request_id
         }), 200
@@ -461,43 +1355,44 @@ def cloud_status():
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    """Get data endpoint with proper error handling"""
+    """Get data endpoint with keyset pagination, response caching and an optional NDJSON streaming mode"""
     try:
-        limit = min(int(request.args.get('limit', 10)), 100)  # Max 100
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute(
-                'SELECT id, data, created_at FROM app_data ORDER BY created_at DESC LIMIT %s',
-                (limit,)
-            )
-            results = cursor.fetchall()
-            cursor.close()
-        
-        data = [dict(row) for row in results]
-        # Format for frontend
-        items = [
-            {
-                'id': f"item_{i+1}",
-                'name': f"Data Item {i+1}",
-                'value': row.get('data', 'N/A'),
-                'status': 'active',
-                'timestamp': row.get('created_at', '').isoformat() if hasattr(row.get('created_at', ''), 'isoformat') else str(row.get('created_at', ''))
-            }
-            for i, row in enumerate(results)
-        ]
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        stream = request.args.get('format') == 'ndjson'
+        if stream:
+            limit = int(request.args['limit']) if 'limit' in request.args else None
+        else:
+            limit = min(int(request.args.get('limit', 10)), DATA_PAGE_MAX)
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    
+    if stream:
+        return Response(
+            stream_with_context(stream_data_rows(after, limit)),
+            mimetype='application/x-ndjson'
+        )
+    
+    try:
+        cache_key = (limit, request.args.get('cursor'))
+        load_page = load_data_page_from_db if DATA_RENDER_IN_DB else load_data_page
+        if data_cache:
+            etag, body = data_cache.get_or_load(cache_key, lambda: load_page(after, limit))
+        else:
+            etag, body = load_page(after, limit)
         
-        # Also include database status
-        db_host = os.getenv('DB_HOST', '')
-        db_type = 'RDS PostgreSQL' if '.rds.amazonaws.com' in db_host else 'Azure SQL'
+        # Polling clients with an up-to-date copy get a 304 without a body being built
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
         
-        return jsonify({
-            'items': items,
-            'count': len(items),
-            'db_type': db_type,
-            'db_status': 'connected',
-            'request_id': g.request_id
-        }), 200
+        # Splice the per-request id onto the cached document instead of re-serialising it
+        body += b',"request_id":' + json.dumps(g.request_id).encode() + b'}'
+        response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        return response
     except DatabaseError as e:
         logger.error(f"Database error in get_data: {e}")
         return jsonify({
@@ -519,47 +1414,311 @@ def post_data():
     if not valid:
         return jsonify({'error': result, 'request_id': g.request_id}), 400
     
-    data = result
-    data_value = data.get('data', '').strip()
+    valid, data_value = validate_data_item(result)
+    if not valid:
+        return jsonify({'error': data_value, 'request_id': g.request_id}), 400
     
-    if not data_value:
-        return jsonify({'error': 'Data field cannot be empty', 'request_id': g.request_id}), 400
+    try:
+        idempotency = idempotency_request()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    
+    def describe(row_id, created_at):
+        return {'id': row_id, 'data': data_value, 'created_at': created_at.isoformat()}
+    
+    try:
+        if idempotency:
+            status_code, body, replayed = insert_data_row_once(idempotency, data_value, describe)
+        else:
+            status_code, body, replayed = 201, describe(*insert_data_row(data_value)), False
+        if data_cache and not replayed:
+            data_cache.invalidate()
+        
+        headers = {'Idempotent-Replayed': 'true'} if replayed else {}
+        return jsonify(dict(body, request_id=g.request_id)), status_code, headers
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 422
+    except DatabaseError as e:
+        logger.error(f"Database error in post_data: {e}")
+        return jsonify({
+            'error': 'Database error',
+            'request_id': g.request_id
+        }), 503
+    except Exception as e:
+        logger.error(f"Unexpected error in post_data: {e}")
+        return jsonify({
+            'error': 'Internal server error',
+            'request_id': g.request_id
+        }), 500
+
+
+@app.route('/api/data/batch', methods=['POST'])
+def post_data_batch():
+    """Bulk ingest endpoint: JSON array or NDJSON body, written in a single transaction"""
+    if request.mimetype == 'application/x-ndjson':
+        items = iter_ndjson(request.stream)
+    elif request.is_json:
+        items = iter_json_array(request.stream)
+    else:
+        return jsonify({
+            'error': 'Content-Type must be application/json or application/x-ndjson',
+            'request_id': g.request_id
+        }), 400
     
-    if len(data_value) > 10000:  # Reasonable limit
-        return jsonify({'error': 'Data field too large (max 10000 chars)', 'request_id': g.request_id}), 400
+    # Validate while the body is still being read so bad input fails before any write
+    values = []
+    try:
+        for index, item in enumerate(items):
+            if index >= DATA_BATCH_MAX_ITEMS:
+                return jsonify({
+                    'error': f'Too many items (max {DATA_BATCH_MAX_ITEMS})',
+                    'request_id': g.request_id
+                }), 413
+            valid, data_value = validate_data_item(item)
+            if not valid:
+                return jsonify({'error': data_value, 'index': index, 'request_id': g.request_id}), 400
+            values.append((data_value,))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    
+    if not values:
+        return jsonify({'error': 'No items in request body', 'request_id': g.request_id}), 400
     
+    from psycopg2.extras import execute_values
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO app_data (data) VALUES (%s) RETURNING id, created_at',
-                (data_value,)
+            # RETURNING rows come back in VALUES order, page by page
+            rows = execute_values(
+                cursor,
+                'INSERT INTO app_data (data) VALUES %s RETURNING id',
+                values,
+                page_size=DATA_BATCH_PAGE_SIZE,
+                fetch=True
             )
-            result = cursor.fetchone()
-            row_id, created_at = result[0], result[1]
             conn.commit()
             cursor.close()
+        if data_cache:
+            data_cache.invalidate()
         
         return jsonify({
-            'id': row_id,
-            'data': data_value,
-            'created_at': created_at.isoformat(),
+            'ids': [row[0] for row in rows],
+            'count': len(rows),
             'request_id': g.request_id
         }), 201
     except DatabaseError as e:
-        logger.error(f"Database error in post_data: {e}")
+        logger.error(f"Database error in post_data_batch: {e}")
         return jsonify({
             'error': 'Database error',
             'request_id': g.request_id
         }), 503
     except Exception as e:
-        logger.error(f"Unexpected error in post_data: {e}")
+        logger.error(f"Unexpected error in post_data_batch: {e}")
         return jsonify({
             'error': 'Internal server error',
             'request_id': g.request_id
         }), 500
 
 
+def build_export_query(fmt: str, since: Optional[datetime], until: Optional[datetime], cursor) -> str:
+    """COPY statement for app_data rows with since < created_at <= until, oldest first"""
+    conditions = []
+    if since:
+        conditions.append(cursor.mogrify('created_at > %s', (since,)).decode())
+    if until:
+        conditions.append(cursor.mogrify('created_at <= %s', (until,)).decode())
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    rows = f'SELECT id, data, created_at FROM app_data{where} ORDER BY created_at, id'
+    if fmt == 'csv':
+        return f'COPY ({rows}) TO STDOUT WITH (FORMAT csv, HEADER)'
+    # One JSON document per line. CSV format with quote and delimiter characters that row_to_json
+    # always escapes copies each document verbatim (text format would double its backslashes).
+    return (f"COPY (SELECT row_to_json(r) FROM ({rows}) AS r) "
+            f"TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')")
+
+
+def bearer_token_error(expected: str, feature: str):
+    """Error response unless the request's bearer token is `expected` (404 when no token is configured)"""
+    if not expected:
+        return jsonify({'error': f'{feature} is not enabled', 'request_id': g.request_id}), 404
+    
+    auth = request.headers.get('Authorization', '')
+    token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        return jsonify({'error': 'Unauthorized', 'request_id': g.request_id}), 401, {'WWW-Authenticate': 'Bearer'}
+    return None
+
+
+@app.route('/api/data/export', methods=['GET'])
+def export_data():
+    """Stream app_data as CSV or NDJSON straight from COPY, optionally compressed, for rows newer than `since`"""
+    denied = bearer_token_error(EXPORT_API_TOKEN, 'Export')
+    if denied:
+        return denied
+    
+    fmt = request.args.get('format', 'csv')
+    compression = request.args.get('compression', 'none')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson', 'request_id': g.request_id}), 400
+    if compression not in available_compressions():
+        return jsonify({
+            'error': f"compression must be one of {', '.join(available_compressions())}",
+            'request_id': g.request_id
+        }), 400
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO 8601 timestamp', 'request_id': g.request_id}), 400
+    
+    try:
+        # Fix the upper bound before streaming: the client passes it back as `since` next time. It is
+        # held back by EXPORT_WATERMARK_LAG, so transactions still in flight land in the next export.
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT least(max(created_at), LOCALTIMESTAMP - %s * INTERVAL '1 second') FROM app_data",
+                (EXPORT_WATERMARK_LAG,)
+            )
+            watermark = cursor.fetchone()[0]
+            if since and watermark and watermark < since:
+                watermark = since  # polled again within the lag: nothing new is settled yet
+            copy_sql = build_export_query(fmt, since, watermark, cursor)
+            cursor.close()
+    except DatabaseError as e:
+        logger.error(f"Database error in export_data: {e}")
+        return jsonify({
+            'error': 'Database error',
+            'request_id': g.request_id
+        }), 503
+    
+    headers = {
+        'Content-Disposition': f'attachment; filename="app_data.{fmt}"',
+        'Cache-Control': 'no-store',
+    }
+    if watermark or since:
+        headers['X-Export-Watermark'] = (watermark or since).isoformat()
+    if compression != 'none':
+        headers['Content-Encoding'] = compression
+    
+    logger.info(f"Exporting app_data as {fmt} ({compression}) since {since} up to {watermark}")
+    return Response(
+        stream_copy(
+            get_db_connection, copy_sql,
+            compression=compression,
+            chunk_size=EXPORT_CHUNK_SIZE,
+            statement_timeout_ms=EXPORT_STATEMENT_TIMEOUT_MS,
+            heartbeat=worker_heartbeat
+        ),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers=headers
+    )
+
+
+def object_operation(operation: str, call: Callable[[], Dict[str, Any]], status_code: int = 200,
+                     remote: bool = False):
+    """
+    Run an object store call for an /api/objects route and map its failures to responses. Remote
+    operations (those that call S3 rather than only sign a URL) go through the S3 circuit breaker.
+    """
+    denied = bearer_token_error(OBJECTS_API_TOKEN if object_store else '', 'Object storage')
+    if denied:
+        return denied
+    if not s3_client:
+        return jsonify({'error': 'Storage unavailable', 'request_id': g.request_id}), 503, {'Retry-After': '1'}
+    if remote and remaining(g.deadline) <= 0:
+        REQUEST_DEADLINE_EXCEEDED.labels('storage').inc()
+        return jsonify({'error': 'Request deadline exceeded', 'request_id': g.request_id}), 504
+    breaker = s3_breaker if remote else None
+    if breaker and not breaker.allow():
+        CIRCUIT_BREAKER_REJECTIONS.labels('s3').inc()
+        retry_after = str(max(1, round(breaker.retry_after())))
+        return jsonify({'error': 'Storage unavailable', 'request_id': g.request_id}), 503, {'Retry-After': retry_after}
+    
+    from botocore.exceptions import BotoCoreError, ClientError
+    try:
+        body = call()
+    except InvalidObjectRequest as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code', '')
+        logger.warning(f"S3 refused {operation}: {code}")
+        if breaker:
+            # A 4xx is S3 answering about this request; a 5xx or throttling is S3 struggling
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            if status >= 500 or code == 'SlowDown':
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        if code == 'NoSuchUpload':
+            return jsonify({'error': 'Upload not found', 'request_id': g.request_id}), 404
+        if code in ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall'):
+            return jsonify({'error': f'Storage rejected the parts: {code}', 'request_id': g.request_id}), 400
+        return jsonify({'error': 'Storage error', 'request_id': g.request_id}), 502
+    except BotoCoreError as e:
+        logger.error(f"Storage error in {operation}: {e}")
+        if breaker:
+            breaker.record_failure()
+        return jsonify({'error': 'Storage unavailable', 'request_id': g.request_id}), 503, {'Retry-After': '1'}
+    if breaker:
+        breaker.record_success()
+    return jsonify(dict(body, request_id=g.request_id)), status_code
+
+
+def object_request_body(required_fields) -> Dict[str, Any]:
+    """The request's JSON object body; InvalidObjectRequest if it is malformed or lacks required_fields"""
+    valid, result = validate_request_json(required_fields=required_fields)
+    if valid and not isinstance(result, dict):
+        valid, result = False, 'Request body must be a JSON object'
+    if not valid:
+        raise InvalidObjectRequest(result)
+    return result
+
+
+@app.route('/api/objects/upload-url', methods=['POST'])
+def object_upload_url():
+    """Presigned PUT URL for uploading one object straight to the bucket"""
+    def presign():
+        body = object_request_body(['key'])
+        return object_store.upload_url(body['key'], body.get('content_type'))
+    return object_operation('upload_url', presign)
+
+
+@app.route('/api/objects/download-url', methods=['GET'])
+def object_download_url():
+    """Presigned GET URL for downloading one object straight from the bucket"""
+    return object_operation('download_url', lambda: object_store.download_url(
+        request.args.get('key'), request.args.get('filename')
+    ))
+
+
+@app.route('/api/objects/multipart', methods=['POST'])
+def object_multipart_start():
+    """Start a multipart upload: returns its upload_id and a presigned PUT URL per part"""
+    def start():
+        body = object_request_body(['key', 'parts'])
+        return object_store.start_multipart(body['key'], body['parts'], body.get('content_type'))
+    return object_operation('start_multipart', start, 201, remote=True)
+
+
+@app.route('/api/objects/multipart/complete', methods=['POST'])
+def object_multipart_complete():
+    """Finish a multipart upload from the part numbers and the ETags S3 returned for them"""
+    def complete():
+        body = object_request_body(['key', 'upload_id', 'parts'])
+        return object_store.complete_multipart(body['key'], body['upload_id'], body['parts'])
+    return object_operation('complete_multipart', complete, remote=True)
+
+
+@app.route('/api/objects/multipart/abort', methods=['POST'])
+def object_multipart_abort():
+    """Abandon a multipart upload and free the parts already stored"""
+    def abort():
+        body = object_request_body(['key', 'upload_id'])
+        object_store.abort_multipart(body['key'], body['upload_id'])
+        return {'key': body['key'], 'status': 'aborted'}
+    return object_operation('abort_multipart', abort, remote=True)
+
+
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
     global shutdown_flag
@@ -567,6 +1726,52 @@ def signal_handler(signum, frame):
     shutdown_flag = True
 
 
+def warm_up():
+    """Build shared, read-only state once in the gunicorn master so forked workers inherit it"""
+    if not S3_PRELOAD:
+        return
+    # Creating a client parses botocore's S3 service model, which the default session then caches.
+    # No connection is opened until the first request.
+    with startup_profiler.phase('s3_preload'):
+        import boto3
+        boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'), config=s3_config())
+
+
+def init_dependencies():
+    """Create this process's pools and clients; runs on the worker's startup thread"""
+    started = time.perf_counter()
+    with startup_profiler.phase('db_pool'):
+        # Keep trying: a worker that starts before its database is reachable becomes ready once it is
+        init_db_pool(max_retries=None)
+    with startup_profiler.phase('replica_router'):
+        init_replica_router()
+    # Readiness only waits for the database check; run it now rather than at the end of the interval
+    health_prober.wake()
+    if idempotency_store:
+        idempotency_store.ensure_started()
+    index_builder.ensure_started()
+    with startup_profiler.phase('s3_client'):
+        if not init_s3():
+            logger.warning("Failed to initialize S3 client. Service will run in degraded mode.")
+    health_prober.wake()
+    startup_profiler.record('worker_startup', time.perf_counter() - started)
+    logger.info(f"Worker dependencies initialized; startup profile: {json.dumps(startup_profiler.report())}")
+
+
+def init_worker(heartbeat: Optional[Callable[[], None]] = None):
+    """Start this process's background threads and its startup thread (gunicorn post_fork)"""
+    global worker_heartbeat
+    worker_heartbeat = heartbeat
+    app.start_time = time.time()
+    # Accept requests straight away: /live answers at once, while /ready and the database routes
+    # return 503 until the startup thread has connected
+    threading.Thread(target=init_dependencies, name='startup', daemon=True).start()
+    health_prober.ensure_started()
+    cloud_metadata.ensure_started()
+    if probe_server:
+        probe_server.ensure_started()
+
+
 def main():
     """Main application entry point"""
     # Set up signal handlers
@@ -581,10 +1786,19 @@ def main():
     if not init_db_pool():
         logger.critical("Failed to initialize database pool. Exiting.")
         sys.exit(1)
+    init_replica_router()
     
     if not init_s3():
         logger.warning("Failed to initialize S3 client. Service will run in degraded mode.")
     
+    health_prober.ensure_started()
+    cloud_metadata.ensure_started()
+    if idempotency_store:
+        idempotency_store.ensure_started()
+    index_builder.ensure_started()
+    if probe_server:
+        probe_server.ensure_started()
+    
     # Run application
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', '8080'))
@@ -607,5 +1821,8 @@ def main():
                 logger.error(f"Error closing database pool: {e}")
 
 
+# Everything above runs on import (in the gunicorn master, with preload_app)
+startup_profiler.record('import_app', time.perf_counter() - startup_profiler.started)
+
 if __name__ == '__main__':
     main()
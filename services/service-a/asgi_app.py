@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Service A - asyncio entry point
+Serves the same routes as app.py on Quart with an asyncpg pool, for use under an ASGI server:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+
+Each in-flight request is a coroutine rather than an OS thread, so a single process can hold
+thousands of concurrent connections while they wait on Postgres.
+"""
+
+import os
+import time
+import json
+import asyncio
+import logging
+import traceback
+from typing import Optional
+from datetime import datetime
+
+import asyncpg
+import boto3
+from quart import Quart, jsonify, request, g, Response
+
+from app import (
+    DB_CONNECT_TIMEOUT, DB_POOL_MIN, DB_POOL_MAX, DATA_PAGE_MAX, DATA_STREAM_CHUNK_SIZE,
+    SECURITY_HEADERS, cloud_metadata, connection_budget, decode_cursor, encode_cursor,
+    request_log_sampler, s3_config, validate_data_item
+)
+
+logger = logging.getLogger('asgi_app')
+
+app = Quart(__name__)
+
+# Application state
+db_pool: Optional[asyncpg.Pool] = None
+s3_client = None
+
+
+def build_keyset_query(after, limit: Optional[int]):
+    """Build the newest-first keyset query with asyncpg-style $n placeholders"""
+    sql = 'SELECT id, data, created_at FROM app_data'
+    params = []
+    if after:
+        sql += ' WHERE (created_at, id) < ($1, $2)'
+        params.extend(after)
+    sql += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        params.append(limit)
+        sql += f' LIMIT ${len(params)}'
+    return sql, params
+
+
+async def init_db_pool() -> bool:
+    """Create the asyncpg pool"""
+    global db_pool
+
+    db_host = os.getenv('DB_HOST')
+    if not db_host:
+        logger.error("DB_HOST environment variable not set")
+        return False
+
+    # asyncpg pools can't be resized, so the worker's budget share is applied once at startup
+    max_size = DB_POOL_MAX
+    if connection_budget:
+        max_size = min(DB_POOL_MAX, connection_budget.rebalance())
+        connection_budget.ensure_started()
+
+    try:
+        db_pool = await asyncpg.create_pool(
+            host=db_host,
+            port=int(os.getenv('DB_PORT', '5432')),
+            database=os.getenv('DB_NAME', 'cloudphoenix'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            min_size=min(DB_POOL_MIN, max_size),
+            max_size=max_size,
+            timeout=DB_CONNECT_TIMEOUT,
+            server_settings={'statement_timeout': '30000'}  # 30 second statement timeout
+        )
+        logger.info(f"Async database pool initialized (min={min(DB_POOL_MIN, max_size)}, max={max_size})")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to initialize async DB pool: {e}")
+        return False
+
+
+def init_s3():
+    """Build the S3 client; boto3 is blocking, so calls on it go through asyncio.to_thread"""
+    global s3_client
+    try:
+        s3_client = boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'), config=s3_config())
+    except Exception as e:
+        logger.error(f"Failed to initialize S3 client: {e}")
+
+
+@app.before_serving
+async def startup():
+    """Initialize dependencies once the event loop is running"""
+    app.start_time = time.time()
+    logger.info("Initializing Service A (asyncio)...")
+    if not await init_db_pool():
+        logger.critical("Failed to initialize database pool. Serving in degraded mode.")
+    await asyncio.to_thread(init_s3)
+    cloud_metadata.ensure_started()
+
+
+@app.after_serving
+async def shutdown():
+    """Close the pool on server shutdown"""
+    if db_pool:
+        await db_pool.close()
+        logger.info("Database pool closed")
+
+
+@app.before_request
+async def before_request():
+    """Set request start time and add request ID"""
+    g.start_time = time.time()
+    g.request_id = request.headers.get('X-Request-ID', f"{int(time.time() * 1000)}")
+
+
+@app.after_request
+async def after_request(response):
+    """Log request and add security headers"""
+    duration = time.time() - g.start_time
+    sample_rate = request_log_sampler.sample(response.status_code, duration)
+    if sample_rate is not None:
+        logger.info('Request completed', extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'request_id': g.request_id,
+            'sample_rate': sample_rate,
+        })
+    response.headers['X-Request-ID'] = g.request_id
+    response.headers.update(SECURITY_HEADERS)
+    return response
+
+
+@app.errorhandler(Exception)
+async def handle_exception(e):
+    """Global exception handler"""
+    logger.error(f"Unhandled exception: {e}\n{traceback.format_exc()}")
+    return jsonify({
+        'error': str(e) if app.debug else 'Internal server error',
+        'request_id': g.get('request_id', 'unknown'),
+        'trace': traceback.format_exc() if app.debug else None
+    }), 500
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Comprehensive health check endpoint"""
+    health_status = {
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'service': 'service-a',
+        'version': os.getenv('SERVICE_VERSION', '1.0.0'),
+        'checks': {}
+    }
+
+    async def check_database():
+        if not db_pool:
+            return {'status': 'not_initialized'}
+        start = time.time()
+        await db_pool.fetchval('SELECT 1')
+        return {'status': 'ok', 'response_time_ms': round((time.time() - start) * 1000, 2)}
+
+    async def check_s3():
+        if not s3_client:
+            return {'status': 'not_initialized'}
+        start = time.time()
+        await asyncio.to_thread(s3_client.list_buckets)
+        return {'status': 'ok', 'response_time_ms': round((time.time() - start) * 1000, 2)}
+
+    # Both dependencies are probed concurrently
+    results = await asyncio.gather(check_database(), check_s3(), return_exceptions=True)
+    for name, result in zip(('database', 's3'), results):
+        if isinstance(result, Exception):
+            logger.error(f"{name} health check failed: {result}")
+            result = {'status': 'error', 'error': str(result) if app.debug else 'Connection failed'}
+        health_status['checks'][name] = result
+
+    if any(check.get('status') != 'ok' for check in health_status['checks'].values()):
+        health_status['status'] = 'degraded' if any(
+            check.get('status') == 'ok' for check in health_status['checks'].values()
+        ) else 'unhealthy'
+
+    status_code = 200 if health_status['status'] == 'healthy' else 503
+    return jsonify(health_status), status_code
+
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    """Readiness probe - checks if service can accept traffic"""
+    if db_pool and s3_client:
+        try:
+            async with db_pool.acquire():
+                pass
+            return jsonify({'status': 'ready'}), 200
+        except Exception as e:
+            logger.warning(f"Readiness check failed: {e}")
+            return jsonify({'status': 'not_ready', 'reason': str(e)}), 503
+
+    return jsonify({'status': 'not_ready', 'reason': 'Dependencies not initialized'}), 503
+
+
+@app.route('/live', methods=['GET'])
+async def live():
+    """Liveness probe - checks if service is running"""
+    return jsonify({
+        'status': 'alive',
+        'uptime_seconds': time.time() - app.start_time if hasattr(app, 'start_time') else 0
+    }), 200
+
+
+@app.route('/api/cloud-status', methods=['GET'])
+async def cloud_status():
+    """Get current cloud provider and status"""
+    try:
+        # Cached IMDS result, refreshed on the metadata thread; no network call on this path
+        identity = cloud_metadata.identity() or {}
+        cloud_provider = identity.get('provider') or os.getenv('CLOUD_PROVIDER', 'aws')
+
+        db_host = os.getenv('DB_HOST', '')
+        db_type = 'Unknown'
+        if '.rds.amazonaws.com' in db_host or 'rds' in db_host.lower():
+            db_type = 'RDS PostgreSQL'
+            cloud_provider = 'aws'
+        elif 'database.windows.net' in db_host or 'azure' in db_host.lower():
+            db_type = 'Azure SQL'
+            cloud_provider = 'azure'
+
+        try:
+            await db_pool.fetchval('SELECT 1')
+            db_status = 'connected'
+        except Exception:
+            db_status = 'disconnected'
+
+        return jsonify({
+            'provider': cloud_provider,
+            'status': 'operational' if db_status == 'connected' else 'degraded',
+            'db_type': db_type,
+            'db_status': db_status,
+            'region': identity.get('region') or os.getenv('AWS_REGION') or os.getenv('AZURE_LOCATION', 'unknown'),
+            'availability_zone': identity.get('availability_zone'),
+            'instance_id': identity.get('instance_id'),
+            'instance_type': identity.get('instance_type'),
+            'metadata_detected_at': identity.get('detected_at'),
+            'timestamp': datetime.utcnow().isoformat(),
+            'request_id': g.request_id
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in cloud_status: {e}")
+        return jsonify({
+            'provider': 'unknown',
+            'status': 'error',
+            'error': str(e),
+            'request_id': g.request_id
+        }), 500
+
+
+async def stream_data_rows(after, limit: Optional[int]):
+    """Yield NDJSON chunks from a server-side cursor, DATA_STREAM_CHUNK_SIZE rows at a time"""
+    sql, params = build_keyset_query(after, limit)
+    async with db_pool.acquire() as conn:
+        async with conn.transaction(readonly=True):
+            lines = []
+            async for row in conn.cursor(sql, *params, prefetch=DATA_STREAM_CHUNK_SIZE):
+                lines.append(json.dumps({
+                    'id': row['id'],
+                    'value': row['data'],
+                    'timestamp': row['created_at'].isoformat(),
+                    'cursor': encode_cursor(row['created_at'], row['id'])
+                }) + '\n')
+                if len(lines) >= DATA_STREAM_CHUNK_SIZE:
+                    yield ''.join(lines).encode()
+                    lines = []
+            if lines:
+                yield ''.join(lines).encode()
+
+
+@app.route('/api/data', methods=['GET'])
+async def get_data():
+    """Get data endpoint with keyset pagination and an optional NDJSON streaming mode"""
+    try:
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        stream = request.args.get('format') == 'ndjson'
+        if stream:
+            limit = int(request.args['limit']) if 'limit' in request.args else None
+        else:
+            limit = min(int(request.args.get('limit', 10)), DATA_PAGE_MAX)
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+
+    if not db_pool:
+        return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+
+    if stream:
+        return Response(stream_data_rows(after, limit), mimetype='application/x-ndjson')
+
+    try:
+        sql, params = build_keyset_query(after, limit + 1)
+        results = await db_pool.fetch(sql, *params)
+    except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError) as e:
+        logger.error(f"Database error in get_data: {e}")
+        return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(results[-1]['created_at'], results[-1]['id'])
+
+    items = [
+        {
+            'id': f"item_{i+1}",
+            'name': f"Data Item {i+1}",
+            'value': row['data'],
+            'status': 'active',
+            'timestamp': row['created_at'].isoformat()
+        }
+        for i, row in enumerate(results)
+    ]
+
+    db_host = os.getenv('DB_HOST', '')
+    db_type = 'RDS PostgreSQL' if '.rds.amazonaws.com' in db_host else 'Azure SQL'
+
+    return jsonify({
+        'items': items,
+        'count': len(items),
+        'next_cursor': next_cursor,
+        'db_type': db_type,
+        'db_status': 'connected',
+        'request_id': g.request_id
+    }), 200
+
+
+@app.route('/api/data', methods=['POST'])
+async def post_data():
+    """Post data endpoint with validation"""
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json', 'request_id': g.request_id}), 400
+
+    data = await request.get_json(silent=True)
+    if data is None:
+        return jsonify({'error': 'Invalid JSON in request body', 'request_id': g.request_id}), 400
+
+    valid, data_value = validate_data_item(data)
+    if not valid:
+        return jsonify({'error': data_value, 'request_id': g.request_id}), 400
+
+    if not db_pool:
+        return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+
+    try:
+        row = await db_pool.fetchrow(
+            'INSERT INTO app_data (data) VALUES ($1) RETURNING id, created_at',
+            data_value
+        )
+    except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError) as e:
+        logger.error(f"Database error in post_data: {e}")
+        return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+
+    return jsonify({
+        'id': row['id'],
+        'data': data_value,
+        'created_at': row['created_at'].isoformat(),
+        'request_id': g.request_id
+    }), 201
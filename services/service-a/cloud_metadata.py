@@ -0,0 +1,154 @@
+"""
+Cloud instance metadata
+Detects the cloud provider, region and instance identity from IMDS once, in the background, and caches the result
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+IMDS_ADDRESS = 'http://169.254.169.254'
+AWS_TOKEN_TTL_SECONDS = 21600
+
+
+class CloudMetadata:
+    """
+    Cached view of the instance metadata service.
+
+    AWS (IMDSv2) and Azure are probed in parallel with a short timeout, so
+    detection off-cloud costs one timeout rather than one per provider. The
+    result is refreshed every refresh_interval seconds on a background thread;
+    request handlers only read the cached dict and never touch the network.
+    The AWS session token is reused until shortly before it expires.
+    """
+
+    def __init__(self, timeout: float = 1.0, refresh_interval: float = 300.0):
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self._identity: Optional[dict] = None
+        self._aws_token: Optional[str] = None
+        self._aws_token_expires = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._session = None  # created on the detection thread: importing requests is slow for a cold start
+
+    def ensure_started(self):
+        """Start the detection thread for this process if it is not running"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Threads and pooled sockets do not survive fork; the cached identity does
+                self._pid = os.getpid()
+                self._session = None
+                self._aws_token = None
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cloud-metadata', daemon=True)
+                self._thread.start()
+
+    def identity(self) -> Optional[dict]:
+        """Return the latest detection result, or None before the first one completes"""
+        return self._identity
+
+    def detect_once(self) -> dict:
+        """Probe every provider concurrently and cache the first identity found"""
+        import requests
+        if self._session is None:
+            self._session = requests.Session()
+            # IMDS is link-local; never send it through HTTP(S)_PROXY
+            self._session.trust_env = False
+        probes: Dict[str, Callable[[], Optional[dict]]] = {
+            'aws': self._probe_aws,
+            'azure': self._probe_azure,
+        }
+        identity = None
+        with ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix='imds-probe') as executor:
+            futures = {executor.submit(probe): name for name, probe in probes.items()}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except requests.RequestException:
+                    continue
+                except Exception as e:
+                    logger.warning(f"{futures[future]} metadata probe failed: {e}")
+                    continue
+                if result is not None and identity is None:
+                    identity = result
+
+        if identity is None:
+            identity = {'provider': None}
+        identity['detected_at'] = datetime.utcnow().isoformat()
+        previous = self._identity
+        if previous is None or previous.get('provider') != identity['provider']:
+            logger.info(f"Cloud metadata: provider={identity['provider']} region={identity.get('region')}")
+        self._identity = identity
+        return identity
+
+    def _probe_aws(self) -> Optional[dict]:
+        headers = {'X-aws-ec2-metadata-token': self._get_aws_token()}
+        response = self._session.get(
+            f'{IMDS_ADDRESS}/latest/dynamic/instance-identity/document',
+            headers=headers,
+            timeout=self.timeout
+        )
+        if response.status_code == 401:
+            # Token revoked or expired early; fetch a new one on the next refresh
+            self._aws_token = None
+        if response.status_code != 200:
+            return None
+        document = response.json()
+        return {
+            'provider': 'aws',
+            'region': document.get('region'),
+            'availability_zone': document.get('availabilityZone'),
+            'instance_id': document.get('instanceId'),
+            'instance_type': document.get('instanceType'),
+            'account_id': document.get('accountId'),
+        }
+
+    def _get_aws_token(self) -> str:
+        if self._aws_token is None or time.monotonic() >= self._aws_token_expires:
+            response = self._session.put(
+                f'{IMDS_ADDRESS}/latest/api/token',
+                headers={'X-aws-ec2-metadata-token-ttl-seconds': str(AWS_TOKEN_TTL_SECONDS)},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            self._aws_token = response.text
+            # Renew well before expiry so a refresh never races the TTL
+            self._aws_token_expires = time.monotonic() + AWS_TOKEN_TTL_SECONDS * 0.9
+        return self._aws_token
+
+    def _probe_azure(self) -> Optional[dict]:
+        response = self._session.get(
+            f'{IMDS_ADDRESS}/metadata/instance/compute?api-version=2021-02-01',
+            headers={'Metadata': 'true'},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            return None
+        compute = response.json()
+        return {
+            'provider': 'azure',
+            'region': compute.get('location'),
+            'availability_zone': compute.get('zone') or None,
+            'instance_id': compute.get('vmId'),
+            'instance_type': compute.get('vmSize'),
+            'account_id': compute.get('subscriptionId'),
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.detect_once()
+            except Exception as e:
+                logger.error(f"Cloud metadata detection failed: {e}")
+            time.sleep(self.refresh_interval)
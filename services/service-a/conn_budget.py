@@ -0,0 +1,166 @@
+"""
+Per-pod database connection budget
+Splits a fixed number of Postgres connections across the gunicorn workers of a pod and rebalances as workers come and go
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BUDGET_DIR_ENV = 'DB_CONN_BUDGET_DIR'
+
+_private_dir: Optional[str] = None
+
+
+def _directory() -> str:
+    global _private_dir
+    directory = os.getenv(BUDGET_DIR_ENV)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    if _private_dir is None:
+        _private_dir = tempfile.mkdtemp(prefix='conn-budget-')
+    return _private_dir
+
+
+def pod_budget(per_pod: int, per_deployment: int = 0, max_pods: int = 0) -> int:
+    """Connections this pod may hold: the per-pod limit, capped by its share of a deployment-wide limit"""
+    budget = per_pod
+    if per_deployment and max_pods:
+        share = max(1, per_deployment // max_pods)
+        budget = min(budget, share) if budget else share
+    return budget
+
+
+def mark_worker_dead(pid: int):
+    """Release an exited worker's share (call from the gunicorn master's child_exit)"""
+    try:
+        os.remove(os.path.join(_directory(), f'worker_{pid}'))
+    except FileNotFoundError:
+        pass
+
+
+def set_expected_workers(count: int):
+    """Record the configured worker count (call from the gunicorn master on start and on TTIN/TTOU)"""
+    path = os.path.join(_directory(), 'expected_workers')
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(count))
+    os.replace(path + '.tmp', path)
+
+
+def reset_directory():
+    """Forget workers from a previous server run (call from the gunicorn master on start)"""
+    directory = os.getenv(BUDGET_DIR_ENV)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+class ConnectionBudget:
+    """
+    Divides `total` connections among the live workers of one pod.
+
+    Each worker registers a heartbeat file in a directory shared by the pod's
+    workers. A worker's share is total // workers, with the remainder going
+    to the lowest pids, so the shares never add up to more than total (unless
+    there are more workers than connections: every worker gets at least one). The
+    divisor is at least the configured worker count (set_expected_workers),
+    so the first workers to boot don't claim the whole budget. A background
+    thread refreshes the heartbeat every `interval` seconds, prunes files
+    whose heartbeat has stopped, and calls on_change whenever this worker's
+    share changes (e.g. after a worker is recycled or the count is changed
+    with TTIN/TTOU).
+    """
+
+    def __init__(self, total: int, interval: float = 5.0,
+                 on_change: Optional[Callable[[int], None]] = None):
+        self.total = total
+        self.interval = interval
+        self.on_change = on_change or (lambda share: None)
+        self._share: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def share(self) -> int:
+        """Register this worker if needed and return its current share"""
+        self._heartbeat()
+        workers = self._live_workers()
+        count = max(len(workers), self._expected_workers(), 1)
+        pid = os.getpid()
+        # A worker still starting may be missing from the listing; rank it as if present
+        rank = sorted(set(workers) | {pid}).index(pid)
+        return max(1, self.total // count + (1 if rank < self.total % count else 0))
+
+    def current(self) -> Optional[int]:
+        """The share most recently reported to on_change"""
+        return self._share
+
+    def ensure_started(self):
+        """Start the rebalancing thread for this process if it is not running"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._share = None
+                self._thread = threading.Thread(target=self._run, name='conn-budget', daemon=True)
+                self._thread.start()
+
+    def rebalance(self) -> int:
+        """Recompute this worker's share and report it if it changed"""
+        share = self.share()
+        if share != self._share:
+            if self._share is not None:
+                logger.info(f"Database connection share changed from {self._share} to {share}")
+            self._share = share
+            self.on_change(share)
+        return share
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(_directory(), f'worker_{pid}')
+
+    def _heartbeat(self):
+        path = self._path(os.getpid())
+        with open(path, 'a'):
+            os.utime(path)
+
+    @staticmethod
+    def _expected_workers() -> int:
+        try:
+            with open(os.path.join(_directory(), 'expected_workers')) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 1
+
+    def _live_workers(self) -> List[int]:
+        directory = _directory()
+        stale_before = time.time() - 3 * self.interval
+        workers = []
+        for name in os.listdir(directory):
+            if not name.startswith('worker_'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    # Killed without child_exit running (e.g. OOM-killed master); reclaim its share
+                    os.remove(path)
+                    continue
+                workers.append(int(name[len('worker_'):]))
+            except (OSError, ValueError):
+                continue
+        return workers
+
+    def _run(self):
+        while True:
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.error(f"Connection budget rebalance failed: {e}")
+            time.sleep(self.interval)
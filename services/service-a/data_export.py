@@ -0,0 +1,148 @@
+"""
+Streaming table export
+Runs COPY ... TO STDOUT on a background thread and hands fixed-size, optionally compressed chunks to the response
+"""
+
+import zlib
+import queue
+import logging
+import threading
+from typing import Callable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # Only needed for compression=zstd
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+_DONE = object()
+# How often the heartbeat is called while the COPY has no output yet (a sort, or a scan past old rows)
+HEARTBEAT_INTERVAL = 5.0
+
+
+class ExportCancelled(Exception):
+    """The client went away; stop copying"""
+    pass
+
+
+def available_compressions():
+    return [name for name in COMPRESSIONS if name != 'zstd' or zstandard is not None]
+
+
+def _compressor(compression: str):
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return None
+
+
+class _ChunkSink:
+    """File-like target for copy_expert: regroups COPY's per-row writes into chunk_size blocks"""
+
+    def __init__(self, chunks: queue.Queue, chunk_size: int, compressor, cancelled: threading.Event):
+        self._chunks = chunks
+        self._chunk_size = chunk_size
+        self._compressor = compressor
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+
+    def finish(self):
+        if self._buffer:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+        if self._compressor is not None:
+            self.put(self._compressor.flush())
+
+    def _emit(self, block: bytes):
+        self.put(self._compressor.compress(block) if self._compressor is not None else block)
+
+    def put(self, item):
+        if isinstance(item, bytes) and not item:
+            return  # The compressor is still buffering
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise ExportCancelled()
+
+
+def stream_copy(connection_factory: Callable, copy_sql: str, compression: str = 'none',
+                chunk_size: int = 64 * 1024, queue_size: int = 4,
+                statement_timeout_ms: Optional[int] = None,
+                heartbeat: Optional[Callable[[], None]] = None) -> Iterator[bytes]:
+    """
+    Yield the output of a COPY ... TO STDOUT statement as it is produced.
+
+    The COPY runs on its own thread and connection; output is regrouped into
+    chunk_size blocks, compressed as it goes and passed through a queue of at
+    most queue_size blocks, so memory stays flat whatever the table size and a
+    slow client slows the COPY down rather than buffering it. statement_timeout_ms
+    overrides the connection's statement timeout for this transaction (0 = none).
+    heartbeat is called for every chunk and every HEARTBEAT_INTERVAL seconds
+    spent waiting for one, so a sync worker streaming a long export still looks
+    alive to its supervisor, even before the COPY's first row. If the client disconnects the COPY is
+    abandoned and its connection closed; a failure mid-stream is raised from the
+    generator, which ends the response without its terminating chunk.
+    """
+    compressor = _compressor(compression)
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    cancelled = threading.Event()
+
+    def produce():
+        sink = _ChunkSink(chunks, chunk_size, compressor, cancelled)
+        try:
+            with connection_factory() as conn:
+                cursor = conn.cursor()
+                try:
+                    if statement_timeout_ms is not None:
+                        cursor.execute('SET LOCAL statement_timeout = %s', (statement_timeout_ms,))
+                    cursor.copy_expert(copy_sql, sink)
+                    sink.finish()
+                except ExportCancelled:
+                    # The server is still sending COPY data, so the connection can't go back to the pool
+                    conn.close()
+                    return
+                cursor.close()
+                conn.rollback()
+            sink.put(_DONE)
+        except ExportCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"Export failed: {e}")
+            try:
+                sink.put(e)
+            except ExportCancelled:
+                pass
+
+    threading.Thread(target=produce, name='data-export', daemon=True).start()
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                if heartbeat:
+                    heartbeat()
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            if heartbeat:
+                heartbeat()
+            yield item
+    finally:
+        cancelled.set()
@@ -0,0 +1,330 @@
+"""
+Self-managing PostgreSQL connection pool
+Blocking checkout with a real timeout, validation on checkout, lifetime/idle retirement and bulk flush
+"""
+
+import os
+import time
+import random
+import socket
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    """No connection became available within the acquire timeout"""
+    pass
+
+
+class _ConnInfo:
+    __slots__ = ('created_at', 'expires_at', 'last_used', 'generation')
+
+    def __init__(self, max_lifetime: float, generation: int):
+        now = time.monotonic()
+        self.created_at = now
+        # Up to 10% jitter so connections opened together are not all recycled together
+        self.expires_at = now + max_lifetime * (1 - random.random() * 0.1)
+        self.last_used = now
+        self.generation = generation
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool.
+
+    getconn() blocks up to `timeout` seconds for a free slot instead of failing
+    immediately when all maxconn connections are checked out. Connections idle
+    longer than validate_after are round-tripped with SELECT 1 before being handed
+    out; connections past max_lifetime, or idle past max_idle above minconn, are
+    closed. flush() retires every connection at once (idle ones immediately,
+    checked-out ones when returned), which is how a failover is absorbed: the
+    first broken socket or a change in the DB host's DNS answer triggers it.
+    The minconn connections are opened on construction, or with prefill=False
+    by calling prefill(), which can be retried on the same pool until the
+    database is reachable.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, acquire_timeout: float = 5.0,
+                 max_lifetime: float = 1800.0, max_idle: float = 300.0,
+                 validate_after: float = 1.0, maintenance_interval: float = 10.0,
+                 on_flush: Optional[Callable[[str], None]] = None, prefill: bool = True, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.maintenance_interval = maintenance_interval
+        # Called with the reason on every flush, for external counters
+        self.on_flush = on_flush or (lambda reason: None)
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle: List = []  # LIFO: the most recently used connection is the warmest
+        self._info: Dict = {}
+        self._in_use = 0
+        self._opening = 0
+        self._waiting = 0
+        self._generation = 0
+        self._closed = False
+        self._host_addresses = self._resolve_host()
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._inherited: List = []
+        self.flushes_total = 0
+        self.retired_total = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+        if prefill:
+            self.prefill()
+
+    # Public API, compatible with psycopg2.pool.AbstractConnectionPool
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Check out a validated connection, waiting up to timeout (default acquire_timeout)"""
+        self._ensure_maintenance()
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            conn = None
+            with self._cond:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                while not self._idle and self._in_use + self._opening >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Timed out after {self.acquire_timeout if timeout is None else timeout}s "
+                            f"waiting for a connection ({self._in_use}/{self.maxconn} in use)"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._in_use += 1
+                else:
+                    self._opening += 1
+
+            if conn is None:
+                # Connect outside the lock so a slow handshake doesn't block other checkouts
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is not None:
+                            self._in_use += 1
+                        self._cond.notify()
+                return conn
+
+            if self._usable(conn):
+                self._info[conn].last_used = time.monotonic()
+                return conn
+            self._discard(conn, checked_out=True)
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection; it is closed instead if broken, expired or from a flushed generation"""
+        info = self._info.get(conn)
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        if (close or conn.closed or info is None or info.generation != self._generation
+                or time.monotonic() >= info.expires_at):
+            self._discard(conn, checked_out=True)
+            return
+        with self._cond:
+            info.last_used = time.monotonic()
+            self._in_use -= 1
+            # Over the limit after a resize(): shrink by closing instead of keeping it idle
+            over_limit = self._in_use + self._opening + len(self._idle) >= self.maxconn
+            if self._closed or over_limit:
+                self._close_quietly(conn)
+                self._info.pop(conn, None)
+                self.retired_total += over_limit
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def flush(self, reason: str = 'flush requested'):
+        """Retire all connections: idle ones now, checked-out ones when they are returned"""
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self.flushes_total += 1
+            self.retired_total += len(idle)
+        logger.warning(f"Flushing database pool ({reason}): closing {len(idle)} idle connections")
+        self.on_flush(reason)
+        for conn in idle:
+            self._close_quietly(conn)
+            self._info.pop(conn, None)
+
+    def resize(self, maxconn: int):
+        """Change the connection limit; surplus idle connections close now, checked-out ones on return"""
+        with self._cond:
+            self.maxconn = maxconn
+            surplus = self._in_use + self._opening + len(self._idle) - maxconn
+            # Oldest-returned connections sit at the front of the idle list
+            retire, self._idle = self._idle[:max(surplus, 0)], self._idle[max(surplus, 0):]
+            self.retired_total += len(retire)
+            self._cond.notify_all()
+        for conn in retire:
+            self._close_quietly(conn)
+            self._info.pop(conn, None)
+
+    def prefill(self):
+        """Open connections until minconn are idle or checked out; those opened stay pooled if one fails"""
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) + self._in_use + self._opening >= min(self.minconn, self.maxconn):
+                    return
+                self._opening += 1
+            conn = None
+            try:
+                conn = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._idle.append(conn)
+                    self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+            self._info.pop(conn, None)
+
+    def stats(self) -> dict:
+        """Current occupancy and lifetime counters"""
+        with self._cond:
+            return {
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'opening': self._opening,
+                'waiting': self._waiting,
+                'max': self.maxconn,
+                'generation': self._generation,
+                'flushes_total': self.flushes_total,
+                'retired_total': self.retired_total,
+            }
+
+    # Internals
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self._info[conn] = _ConnInfo(self.max_lifetime, self._generation)
+        return conn
+
+    def _usable(self, conn) -> bool:
+        info = self._info.get(conn)
+        if conn.closed or info is None or info.generation != self._generation:
+            return False
+        now = time.monotonic()
+        if now >= info.expires_at:
+            return False
+        if now - info.last_used >= self.validate_after:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn, checked_out: bool):
+        self._close_quietly(conn)
+        self._info.pop(conn, None)
+        self.retired_total += 1
+        with self._cond:
+            if checked_out:
+                self._in_use -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _resolve_host(self) -> Optional[frozenset]:
+        host = self.connect_kwargs.get('host')
+        if not host or host.startswith('/'):
+            return None
+        try:
+            return frozenset(
+                info[4][0] for info in socket.getaddrinfo(host, self.connect_kwargs.get('port') or 5432)
+            )
+        except OSError:
+            return None
+
+    def _after_fork(self):
+        # Inherited connections share the parent's sockets. Closing them (even via garbage
+        # collection) would terminate the parent's sessions, so keep them referenced and unused.
+        self._inherited.extend(self._idle)
+        self._inherited.extend(self._info.keys())
+        self._idle = []
+        self._info = {}
+        self._in_use = self._opening = self._waiting = 0
+        self._cond = threading.Condition()
+        self._maintenance_thread = None
+
+    def _ensure_maintenance(self):
+        if self._maintenance_thread is None:
+            with self._cond:
+                if self._maintenance_thread is None:
+                    self._maintenance_thread = threading.Thread(
+                        target=self._maintain, name='db-pool-maintenance', daemon=True
+                    )
+                    self._maintenance_thread.start()
+
+    def _maintain(self):
+        while not self._closed:
+            time.sleep(self.maintenance_interval)
+            try:
+                addresses = self._resolve_host()
+                if addresses and self._host_addresses and addresses != self._host_addresses:
+                    self._host_addresses = addresses
+                    self.flush(f"DB host now resolves to {sorted(addresses)}")
+                    continue
+
+                now = time.monotonic()
+                with self._cond:
+                    keep, retire = [], []
+                    total = len(self._idle) + self._in_use
+                    # Oldest-returned connections sit at the front of the idle list
+                    for conn in self._idle:
+                        info = self._info.get(conn)
+                        expired = info is None or now >= info.expires_at
+                        idle_too_long = info is not None and now - info.last_used >= self.max_idle
+                        if expired or (idle_too_long and total > min(self.minconn, self.maxconn)):
+                            retire.append(conn)
+                            total -= 1
+                        else:
+                            keep.append(conn)
+                    self._idle = keep
+                    self.retired_total += len(retire)
+                for conn in retire:
+                    self._close_quietly(conn)
+                    self._info.pop(conn, None)
+            except Exception as e:
+                logger.error(f"Database pool maintenance failed: {e}")
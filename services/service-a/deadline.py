@@ -0,0 +1,63 @@
+"""
+Request deadlines
+Turns a caller's deadline or timeout header into a time budget that bounds the database and outbound calls made for the request
+"""
+
+import time
+from typing import Mapping, Optional
+
+# Absolute deadline as Unix time in seconds (fractions allowed), e.g. set by an upstream service
+DEADLINE_HEADER = 'X-Request-Deadline'
+# Time the caller will wait, in seconds (fractions allowed), counted from when the request arrives
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the work could start"""
+    pass
+
+
+def parse_deadline(headers: Mapping[str, str], default_timeout: float, max_timeout: float,
+                   received: Optional[float] = None) -> float:
+    """
+    The request's deadline on the time.monotonic() clock.
+
+    X-Request-Deadline wins over X-Request-Timeout; without either the
+    request gets default_timeout. A budget longer than max_timeout is cut to
+    it, so a caller cannot keep a worker longer than the server allows.
+
+    Budgets and the cap count from `received` (on the time.monotonic()
+    clock), which may be earlier than now when the request waited in a queue
+    first. An absolute deadline is a point in time already, so it is moved
+    to the monotonic clock as it stands now and not shifted by the wait; it
+    is converted with the wall clock once, so clock skew between caller and
+    server shifts it by at most the skew. Raises ValueError for a header
+    that is not a number.
+    """
+    now = time.monotonic()
+    received = now if received is None else received
+    limit = received + max_timeout
+    deadline = headers.get(DEADLINE_HEADER)
+    timeout = headers.get(TIMEOUT_HEADER)
+    if deadline:
+        try:
+            at = now + (float(deadline) - time.time())
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} must be a Unix timestamp in seconds") from None
+        if at != at:  # NaN
+            raise ValueError(f"{DEADLINE_HEADER} must be a Unix timestamp in seconds")
+        return min(at, limit)
+    budget = default_timeout
+    if timeout:
+        try:
+            budget = float(timeout)
+        except ValueError:
+            raise ValueError(f"{TIMEOUT_HEADER} must be a number of seconds") from None
+        if budget != budget:  # NaN
+            raise ValueError(f"{TIMEOUT_HEADER} must be a number of seconds")
+    return min(received + budget, limit)
+
+
+def remaining(deadline: float) -> float:
+    """Seconds left before deadline (negative once it has passed)"""
+    return deadline - time.monotonic()
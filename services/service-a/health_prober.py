@@ -0,0 +1,119 @@
+"""
+Background health prober
+Runs dependency checks concurrently on a schedule with a hard deadline and publishes a cached snapshot
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """
+    Probes dependencies off the request path.
+
+    Each check is a callable that returns None when the dependency is fine, a
+    status dict (e.g. {'status': 'not_initialized'}) to report as-is, or raises.
+    Every interval all checks run in parallel; any check still running at the
+    deadline is reported as 'timeout' and is not resubmitted until it returns,
+    so a hung dependency occupies at most one thread. Readers get the latest
+    snapshot with a single attribute read.
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], Optional[dict]]],
+                 interval: float = 5.0, timeout: float = 5.0):
+        self.checks = checks
+        self.interval = interval
+        self.timeout = timeout
+        self._snapshot: Optional[Tuple[float, str, Dict[str, dict]]] = None
+        self._inflight: Dict[str, Tuple[float, object]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def ensure_started(self):
+        """Start the probe thread for this process if it is not running"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Threads and executors do not survive fork
+                self._pid = os.getpid()
+                self._snapshot = None
+                self._inflight = {}
+                self._executor = ThreadPoolExecutor(max_workers=len(self.checks), thread_name_prefix='health-check')
+                self._thread = None
+                self._wake = threading.Event()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+                self._thread.start()
+
+    def snapshot(self) -> Tuple[Optional[Dict[str, dict]], Optional[float], Optional[str]]:
+        """Return (checks, age in seconds, ISO timestamp) of the latest probe, or Nones before the first"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None, None, None
+        taken_at, timestamp, checks = snapshot
+        return checks, time.monotonic() - taken_at, timestamp
+
+    def wake(self):
+        """Start the next probe round now instead of at the end of the interval (e.g. once a dependency is up)"""
+        self._wake.set()
+
+    def probe_once(self):
+        """Run every check concurrently and publish the results"""
+        started = time.monotonic()
+        futures = {}
+        for name, check in self.checks.items():
+            inflight = self._inflight.get(name)
+            if inflight is not None and not inflight[1].done():
+                continue
+            future = self._executor.submit(self._timed, check)
+            self._inflight[name] = (started, future)
+            futures[name] = future
+
+        wait(futures.values(), timeout=self.timeout)
+
+        results = {}
+        for name in self.checks:
+            submitted_at, future = self._inflight[name]
+            if future.done():
+                results[name] = future.result()
+            else:
+                results[name] = {
+                    'status': 'timeout',
+                    'error': f'No response within {self.timeout}s',
+                    'pending_seconds': round(time.monotonic() - submitted_at, 2)
+                }
+        self._snapshot = (time.monotonic(), datetime.utcnow().isoformat(), results)
+
+    @staticmethod
+    def _timed(check: Callable[[], Optional[dict]]) -> dict:
+        start = time.perf_counter()
+        try:
+            result = check()
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+        if result is not None:
+            return result
+        return {'status': 'ok', 'response_time_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_once()
+            except RuntimeError:
+                # The executor refuses new work once the interpreter is shutting down
+                return
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
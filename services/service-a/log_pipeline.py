@@ -0,0 +1,137 @@
+"""
+Non-blocking JSON logging
+Log records are put on a bounded in-memory queue and written to stdout by a background thread
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional['DroppingQueueHandler'] = None
+_output_handler: Optional[logging.Handler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, plus any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller.
+
+    When the queue is full (stdout is backed up) the record is dropped and
+    counted instead of waiting. Formatting is left to the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue, on_drop: Optional[Callable[[], None]] = None):
+        super().__init__(log_queue)
+        self.on_drop = on_drop or (lambda: None)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now so later mutation by the caller can't change the message
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.on_drop()
+
+
+def configure_logging(level: int = logging.INFO, queue_size: int = 10000,
+                      on_drop: Optional[Callable[[], None]] = None):
+    """Route the root logger through a bounded queue to a JSON stdout writer thread"""
+    global _handler, _output_handler
+    _output_handler = logging.StreamHandler(sys.stdout)
+    _output_handler.setFormatter(JsonFormatter())
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size), on_drop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _start_listener()
+
+
+def dropped_records() -> int:
+    """Number of records this process dropped because the queue was full"""
+    return _handler.dropped if _handler else 0
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_handler.queue, _output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    # Flush whatever is still queued on interpreter exit
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork and the queue's locks may be held; start fresh
+    global _listener
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _handler.dropped = 0
+    _listener = None
+    _start_listener()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class RequestLogSampler:
+    """
+    Decides which access-log records to keep.
+
+    Errors (status >= 400) and requests slower than slow_seconds are always
+    logged; everything else is logged with probability sample_rate. The rate
+    applied is returned so downstream aggregation can re-weight samples.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, slow_seconds: float = 1.0):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+    def sample(self, status_code: int, duration: float) -> Optional[float]:
+        """Return the effective sample rate if this request should be logged, else None"""
+        if status_code >= 400 or duration >= self.slow_seconds:
+            return 1.0
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return self.sample_rate
+        return None
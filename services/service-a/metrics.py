@@ -0,0 +1,314 @@
+"""
+Multi-process Prometheus metrics
+Every worker records into its own memory-mapped file and /metrics sums all workers' files at scrape time.
+
+prometheus_client's multiprocess mode serialises every update in a process behind one lock; here each
+series has its own lock, so recording on the request path never contends across routes or metrics.
+Set PROMETHEUS_MULTIPROC_DIR to a directory shared by the workers (gunicorn_config.py does this);
+without it each process uses a private temporary directory and only reports its own samples.
+"""
+
+import os
+import glob
+import json
+import mmap
+import bisect
+import struct
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+_INITIAL_FILE_SIZE = 1 << 20
+_REGISTRY: List['_Metric'] = []
+_stores: Dict[str, '_MmapFile'] = {}
+_stores_lock = threading.Lock()
+_private_dir: Optional[str] = None
+
+
+class _MmapFile:
+    """
+    Append-only file of (key, float64) entries.
+
+    Layout: an 8-byte header holding the number of bytes used, then entries of
+    [uint32 key length][key, space-padded to 8-byte alignment][float64 value].
+    Readers trust only the header, which is written after each new entry.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()  # taken only when a new series is appended
+        self._file = open(path, 'w+b')
+        self._capacity = _INITIAL_FILE_SIZE
+        self._file.truncate(self._capacity)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = 8
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions: Dict[str, int] = {}
+
+    def position(self, key: str) -> int:
+        pos = self._positions.get(key)
+        if pos is None:
+            with self._lock:
+                pos = self._positions.get(key)
+                if pos is None:
+                    pos = self._append(key)
+        return pos
+
+    def _append(self, key: str) -> int:
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(encoded), padded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._used - 8
+
+    def read(self, pos: int) -> float:
+        return struct.unpack_from('d', self._map, pos)[0]
+
+    def write(self, pos: int, value: float):
+        struct.pack_into('d', self._map, pos, value)
+
+
+def _read_file(path: str):
+    """Yield (key, value) pairs from a worker file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return
+    used = struct.unpack_from('i', data, 0)[0]
+    pos = 8
+    while pos < used:
+        key_length = struct.unpack_from('i', data, pos)[0]
+        pos += 4
+        key = data[pos:pos + key_length].decode('utf-8')
+        pos += key_length + 8 - (key_length + 4) % 8
+        yield key, struct.unpack_from('d', data, pos)[0]
+        pos += 8
+
+
+def _directory() -> str:
+    global _private_dir
+    directory = os.getenv(MULTIPROC_DIR_ENV)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    if _private_dir is None:
+        _private_dir = tempfile.mkdtemp(prefix='metrics-')
+    return _private_dir
+
+
+def _store(kind: str) -> _MmapFile:
+    store = _stores.get(kind)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(kind)
+            if store is None:
+                path = os.path.join(_directory(), f'{kind}_{os.getpid()}.db')
+                store = _stores[kind] = _MmapFile(path)
+    return store
+
+
+def _reset_after_fork():
+    # The child must not keep writing into the parent's files or cached offsets
+    global _private_dir, _stores_lock
+    _stores.clear()
+    _stores_lock = threading.Lock()
+    _private_dir = None
+    for metric in _REGISTRY:
+        metric._children.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(name: str, suffix: str, labels: Sequence[Tuple[str, str]]) -> str:
+    return json.dumps([name, suffix, list(labels)], separators=(',', ':'))
+
+
+class _Child:
+    """One labelled series; its lock covers only its own slots"""
+
+    def __init__(self, metric: '_Metric', labels: Tuple[Tuple[str, str], ...]):
+        self._metric = metric
+        self._labels = labels
+        self._lock = threading.Lock()
+        self._store = _store(metric.file_kind)
+        self._pos = self._store.position(_key(metric.name, '', labels))
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._store.write(self._pos, self._store.read(self._pos) + amount)
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self._store.write(self._pos, float(value))
+
+
+class _HistogramChild:
+    """Histogram series: non-cumulative bucket counts plus sum and count"""
+
+    def __init__(self, metric: 'Histogram', labels: Tuple[Tuple[str, str], ...]):
+        self._upper_bounds = metric.buckets
+        self._lock = threading.Lock()
+        self._store = _store(metric.file_kind)
+        self._bucket_pos = [
+            self._store.position(_key(metric.name, '_bucket', labels + (('le', _format_bound(bound)),)))
+            for bound in metric.buckets
+        ]
+        self._sum_pos = self._store.position(_key(metric.name, '_sum', labels))
+        self._count_pos = self._store.position(_key(metric.name, '_count', labels))
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            if index < len(self._bucket_pos):
+                pos = self._bucket_pos[index]
+                self._store.write(pos, self._store.read(pos) + 1)
+            self._store.write(self._sum_pos, self._store.read(self._sum_pos) + value)
+            self._store.write(self._count_pos, self._store.read(self._count_pos) + 1)
+
+
+class _Metric:
+    metric_type = ''
+    file_kind = 'counter'
+    child_class = _Child
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _REGISTRY.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(
+                values, self.child_class(self, tuple(zip(self.labelnames, values)))
+            )
+        return child
+
+
+class Counter(_Metric):
+    """Monotonic counter, summed across workers including exited ones"""
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Per-worker gauge, summed across live workers"""
+    metric_type = 'gauge'
+    file_kind = 'gauge'
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    """Histogram with fixed upper bounds, summed across workers"""
+    metric_type = 'histogram'
+    child_class = _HistogramChild
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def mark_process_dead(pid: int):
+    """Drop an exited worker's gauges; its counters and histograms are kept"""
+    path = os.path.join(_directory(), f'gauge_{pid}.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def reset_directory():
+    """Clear samples left by a previous server run (call from the gunicorn master on start)"""
+    directory = os.getenv(MULTIPROC_DIR_ENV)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def generate_latest() -> str:
+    """Render all registered metrics, aggregated over every worker file, in Prometheus text format"""
+    samples: Dict[str, Dict[Tuple[str, Tuple], float]] = {}
+    for path in glob.glob(os.path.join(_directory(), '*.db')):
+        try:
+            for key, value in _read_file(path):
+                name, suffix, labels = json.loads(key)
+                series = samples.setdefault(name, {})
+                sample_key = (suffix, tuple(tuple(pair) for pair in labels))
+                series[sample_key] = series.get(sample_key, 0.0) + value
+        except (OSError, ValueError, struct.error):
+            # A worker exited between glob and read, or is mid-append
+            continue
+
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.metric_type}')
+        series = samples.get(metric.name, {})
+        if metric.metric_type != 'histogram':
+            for (_, labels), value in sorted(series.items()):
+                lines.append(f'{metric.name}{_format_labels(labels)} {value}')
+            continue
+
+        # Stored buckets are per-interval; Prometheus expects cumulative counts ending in +Inf
+        groups: Dict[Tuple, Dict] = {}
+        for (suffix, labels), value in series.items():
+            if suffix == '_bucket':
+                base = tuple(pair for pair in labels if pair[0] != 'le')
+                bound = float(dict(labels)['le'])
+                groups.setdefault(base, {}).setdefault('buckets', []).append((bound, value))
+            else:
+                groups.setdefault(labels, {})[suffix] = value
+        for labels, group in sorted(groups.items()):
+            cumulative = 0.0
+            for bound, value in sorted(group.get('buckets', [])):
+                cumulative += value
+                lines.append(f'{metric.name}_bucket{_format_labels(labels + (("le", _format_bound(bound)),))} {cumulative}')
+            lines.append(f'{metric.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {group.get("_count", 0.0)}')
+            lines.append(f'{metric.name}_sum{_format_labels(labels)} {group.get("_sum", 0.0)}')
+            lines.append(f'{metric.name}_count{_format_labels(labels)} {group.get("_count", 0.0)}')
+    return '\n'.join(lines) + '\n'
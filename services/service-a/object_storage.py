@@ -0,0 +1,146 @@
+"""
+Direct-to-storage object transfers
+Issues presigned S3 URLs so clients upload and download object bytes without passing them through the service
+"""
+
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 1024
+# S3 multipart limits
+MAX_PARTS = 10000
+
+# Characters S3 documents as safe in keys; anything else is refused rather than escaped
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9!_.*'()/-]+$")
+
+
+class InvalidObjectRequest(ValueError):
+    """A key, part list or other client input the store refuses; the message is shown to the client"""
+    pass
+
+
+class ObjectStore:
+    """
+    Presigned access to objects under `prefix` in `bucket`.
+
+    upload_url() and download_url() sign a single PUT or GET that the client
+    sends straight to S3; signing is local and makes no request. Large
+    uploads use multipart: start_multipart() creates the upload and signs one
+    URL per part, the client PUTs the parts and reports their ETags, and
+    complete_multipart() (or abort_multipart()) finishes it. Those three are
+    the only calls made to S3 from the service.
+
+    Client keys are relative to prefix and may not leave it. client_getter
+    returns the shared boto3 S3 client (thread-safe, unlike boto3 sessions).
+    on_presign(operation) is called for every signed URL.
+    """
+
+    def __init__(self, client_getter: Callable[[], Any], bucket: str, prefix: str = '',
+                 url_ttl: int = 900, multipart_url_ttl: int = 3600,
+                 on_presign: Optional[Callable[[str], None]] = None):
+        self.client_getter = client_getter
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_ttl = url_ttl
+        self.multipart_url_ttl = multipart_url_ttl
+        self.on_presign = on_presign or (lambda operation: None)
+
+    def object_key(self, key: Any) -> str:
+        """Full S3 key for a client-supplied key, or InvalidObjectRequest"""
+        if not isinstance(key, str) or not key:
+            raise InvalidObjectRequest("key is required")
+        if len(self.prefix) + len(key) > MAX_KEY_LENGTH:
+            raise InvalidObjectRequest(f"key must be at most {MAX_KEY_LENGTH - len(self.prefix)} characters")
+        if not _KEY_PATTERN.match(key):
+            raise InvalidObjectRequest("key may only contain letters, digits, / and !-_.*'()")
+        if any(segment in ('', '.', '..') for segment in key.split('/')):
+            raise InvalidObjectRequest("key may not contain empty, '.' or '..' path segments")
+        return self.prefix + key
+
+    def upload_url(self, key: str, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """Presigned PUT for one object; the client must send the returned headers with it"""
+        params = {'Bucket': self.bucket, 'Key': self.object_key(key)}
+        headers = {}
+        if content_type:
+            params['ContentType'] = content_type
+            headers['Content-Type'] = content_type
+        url = self._presign('put_object', params, self.url_ttl)
+        return {'key': key, 'method': 'PUT', 'url': url, 'headers': headers, 'expires_in': self.url_ttl}
+
+    def download_url(self, key: str, filename: Optional[str] = None) -> Dict[str, Any]:
+        """Presigned GET for one object, optionally served as an attachment named filename"""
+        params = {'Bucket': self.bucket, 'Key': self.object_key(key)}
+        if filename:
+            if '"' in filename or any(ord(c) < 32 for c in filename):
+                raise InvalidObjectRequest("filename may not contain quotes or control characters")
+            params['ResponseContentDisposition'] = f'attachment; filename="{filename}"'
+        url = self._presign('get_object', params, self.url_ttl)
+        return {'key': key, 'method': 'GET', 'url': url, 'expires_in': self.url_ttl}
+
+    def start_multipart(self, key: str, parts: Any, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """Create a multipart upload and presign a PUT for each of its parts (numbered from 1)"""
+        object_key = self.object_key(key)
+        if not isinstance(parts, int) or isinstance(parts, bool) or not 1 <= parts <= MAX_PARTS:
+            raise InvalidObjectRequest(f"parts must be an integer from 1 to {MAX_PARTS}")
+        params = {'Bucket': self.bucket, 'Key': object_key}
+        if content_type:
+            params['ContentType'] = content_type
+        upload_id = self.client_getter().create_multipart_upload(**params)['UploadId']
+        part_urls = [
+            {
+                'part_number': number,
+                'url': self._presign(
+                    'upload_part',
+                    {'Bucket': self.bucket, 'Key': object_key, 'UploadId': upload_id, 'PartNumber': number},
+                    self.multipart_url_ttl
+                ),
+            }
+            for number in range(1, parts + 1)
+        ]
+        logger.info(f"Started multipart upload of {object_key} in {parts} parts")
+        return {
+            'key': key, 'upload_id': upload_id, 'method': 'PUT',
+            'parts': part_urls, 'expires_in': self.multipart_url_ttl
+        }
+
+    def complete_multipart(self, key: str, upload_id: Any, parts: Any) -> Dict[str, Any]:
+        """Assemble an upload from the parts' numbers and the ETags S3 returned for them"""
+        object_key = self.object_key(key)
+        if not isinstance(upload_id, str) or not upload_id:
+            raise InvalidObjectRequest("upload_id is required")
+        completed = self._completed_parts(parts)
+        result = self.client_getter().complete_multipart_upload(
+            Bucket=self.bucket, Key=object_key, UploadId=upload_id, MultipartUpload={'Parts': completed}
+        )
+        return {'key': key, 'etag': result.get('ETag'), 'parts': len(completed)}
+
+    def abort_multipart(self, key: str, upload_id: Any):
+        """Discard an unfinished upload and the parts stored for it"""
+        object_key = self.object_key(key)
+        if not isinstance(upload_id, str) or not upload_id:
+            raise InvalidObjectRequest("upload_id is required")
+        self.client_getter().abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+
+    @staticmethod
+    def _completed_parts(parts: Any) -> List[Dict[str, Any]]:
+        if not isinstance(parts, list) or not parts or len(parts) > MAX_PARTS:
+            raise InvalidObjectRequest(f"parts must be a list of 1 to {MAX_PARTS} {{part_number, etag}} objects")
+        completed = []
+        for part in parts:
+            number = part.get('part_number') if isinstance(part, dict) else None
+            etag = part.get('etag') if isinstance(part, dict) else None
+            if not isinstance(number, int) or isinstance(number, bool) or not 1 <= number <= MAX_PARTS \
+                    or not isinstance(etag, str) or not etag:
+                raise InvalidObjectRequest("each part needs an integer part_number and the etag S3 returned")
+            completed.append({'PartNumber': number, 'ETag': etag})
+        # S3 wants the list in ascending order
+        completed.sort(key=lambda part: part['PartNumber'])
+        return completed
+
+    def _presign(self, operation: str, params: Dict[str, Any], ttl: int) -> str:
+        url = self.client_getter().generate_presigned_url(operation, Params=params, ExpiresIn=ttl)
+        self.on_presign(operation)
+        return url
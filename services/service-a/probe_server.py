@@ -0,0 +1,90 @@
+"""
+Kubernetes probe listener
+A minimal HTTP server on its own port and thread, so liveness/readiness never wait behind application traffic
+"""
+
+import os
+import json
+import socket
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ProbeHandler = Callable[[], Tuple[dict, int]]
+
+
+class _ReusePortServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # Every gunicorn worker binds the same port; the kernel spreads probes across live workers
+        if hasattr(socket, 'SO_REUSEPORT'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+class _ProbeRequestHandler(BaseHTTPRequestHandler):
+    # Drop clients that connect and never send a request line
+    timeout = 2
+
+    def do_GET(self):
+        handler = self.server.probe_handlers.get(self.path.split('?', 1)[0])
+        if handler is None:
+            payload, status = {'error': 'Not found'}, 404
+        else:
+            try:
+                payload, status = handler()
+            except Exception as e:
+                payload, status = {'status': 'error', 'error': str(e)}, 503
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProbeServer:
+    """
+    Serves probe handlers on a dedicated port from a daemon thread in each process.
+
+    Handlers are plain callables returning (payload, status code) and must only
+    read in-memory state (e.g. the health prober's snapshot): they run outside
+    Flask, without request context, DB connections or app workers. Under
+    gunicorn each worker starts its own from the post_fork hook, through
+    app.init_worker(); when run directly, main() starts it.
+    """
+
+    def __init__(self, port: int, handlers: Dict[str, ProbeHandler], host: str = '0.0.0.0'):
+        self.host = host
+        self.port = port
+        self.handlers = handlers
+        self._server: Optional[_ReusePortServer] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> bool:
+        """Bind and start serving in this process if not already; returns False if the port is unavailable"""
+        if self._pid == os.getpid():
+            return True
+        with self._lock:
+            if self._pid == os.getpid():
+                return True
+            try:
+                server = _ReusePortServer((self.host, self.port), _ProbeRequestHandler)
+            except OSError as e:
+                logger.error(f"Probe listener could not bind {self.host}:{self.port}: {e}")
+                return False
+            server.probe_handlers = self.handlers
+            threading.Thread(target=server.serve_forever, name='probe-server', daemon=True).start()
+            self._server = server
+            self._pid = os.getpid()
+            logger.info(f"Probe listener serving {sorted(self.handlers)} on {self.host}:{self.port}")
+            return True
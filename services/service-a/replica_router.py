@@ -0,0 +1,152 @@
+"""
+Lag-aware read-replica routing
+Measures each replica's replay lag in the background and picks a replica within the lag bound for each read
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Same measure as scripts/healthcheck.py, except that a replica with nothing left to replay counts as
+# caught up: on a quiet primary, now() - pg_last_xact_replay_timestamp() grows without any real lag.
+# That only holds while WAL is streaming in: with the receiver disconnected or stalled there is also
+# nothing left to replay, however far behind the primary it is, so the lag is NULL (unknown) instead.
+# The receiver's status is only visible to members of pg_read_all_stats; for other users it is NULL too.
+# A server that is not in recovery (e.g. a promoted replica) has no lag at all.
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class Replica:
+    """One read replica: its pool and its latest lag measurement"""
+
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.pool = pool
+        self.lag: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+class ReplicaRouter:
+    """
+    Chooses a read replica for each read, or None to use the primary.
+
+    A background thread measures every replica's replay lag each
+    check_interval seconds. A replica is eligible while its latest lag is at
+    most max_lag and the measurement is no older than three intervals;
+    eligible replicas take reads in turn. A replica whose WAL receiver is not
+    streaming can't tell how far behind it is and counts as down, like one
+    that can't be reached. mark_down() takes a replica out of rotation (and
+    flushes its pool) after a connection failure until the next successful
+    check. on_lag(name, lag) is called after every measurement, with None
+    when the replica is down.
+    """
+
+    def __init__(self, replicas: List[Replica], max_lag: float = 5.0, check_interval: float = 2.0,
+                 check_timeout: float = 2.0, on_lag: Optional[Callable[[str, Optional[float]], None]] = None):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.on_lag = on_lag or (lambda name, lag: None)
+        self._next = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def choose(self) -> Optional[Replica]:
+        """The next eligible replica, or None if every replica is lagging, down or unmeasured"""
+        now = time.monotonic()
+        eligible = [
+            replica for replica in self.replicas
+            if replica.lag is not None and replica.lag <= self.max_lag
+            and now - replica.checked_at <= 3 * self.check_interval
+        ]
+        if not eligible:
+            return None
+        self._next += 1
+        return eligible[self._next % len(eligible)]
+
+    def mark_down(self, replica: Replica, reason: str):
+        """Stop routing to a replica until its next successful lag check"""
+        if replica.lag is not None:
+            logger.warning(f"Read replica {replica.name} taken out of rotation: {reason}")
+        replica.lag = None
+        replica.error = reason
+        replica.pool.flush(f"replica failure: {reason}")
+
+    def status(self) -> Dict[str, dict]:
+        """Latest lag and eligibility of every replica"""
+        now = time.monotonic()
+        return {
+            replica.name: {
+                'lag_seconds': round(replica.lag, 3) if replica.lag is not None else None,
+                'eligible': replica.lag is not None and replica.lag <= self.max_lag
+                and now - replica.checked_at <= 3 * self.check_interval,
+                'checked_seconds_ago': round(now - replica.checked_at, 3) if replica.checked_at else None,
+                'error': replica.error,
+            }
+            for replica in self.replicas
+        }
+
+    def ensure_started(self):
+        """Start the lag-check thread for this process if it is not running"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='replica-lag', daemon=True)
+                self._thread.start()
+
+    def check_once(self):
+        """Measure every replica's lag now"""
+        for replica in self.replicas:
+            try:
+                conn = replica.pool.getconn(timeout=self.check_timeout)
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(LAG_SQL)
+                    lag = cursor.fetchone()[0]
+                    cursor.close()
+                    conn.rollback()
+                except Exception:
+                    replica.pool.putconn(conn, close=True)
+                    raise
+                replica.pool.putconn(conn)
+                if lag is None:
+                    raise RuntimeError("WAL receiver is not streaming (or the user lacks pg_read_all_stats to see it)")
+                lag = float(lag)
+            except Exception as e:
+                if replica.lag is not None or replica.error is None:
+                    logger.warning(f"Lag check on read replica {replica.name} failed: {e}")
+                replica.lag = None
+                replica.error = str(e)
+                replica.checked_at = time.monotonic()
+                self.on_lag(replica.name, None)
+                continue
+            if lag > self.max_lag and (replica.lag is None or replica.lag <= self.max_lag):
+                logger.warning(f"Read replica {replica.name} is {lag:.1f}s behind; reads go elsewhere")
+            replica.lag = lag
+            replica.error = None
+            replica.checked_at = time.monotonic()
+            self.on_lag(replica.name, lag)
+
+    def _run(self):
+        while True:
+            try:
+                self.check_once()
+            except Exception as e:
+                logger.error(f"Replica lag check failed: {e}")
+            time.sleep(self.check_interval)
@@ -0,0 +1,122 @@
+"""
+Read-through response cache
+In-process LRU + TTL cache that collapses concurrent misses for the same key into one load
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    """A load in progress that other callers for the same key wait on"""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache with single-flight loading and write invalidation.
+
+    Only one thread runs the loader for a missing key; others arriving while it
+    runs wait for and share its result (or its exception). invalidate() drops
+    every entry and bumps a generation counter, so a load that started before
+    the write is returned to its callers but never stored.
+
+    The cache is per process: a write handled by another worker or pod is only
+    picked up once the TTL expires.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 1.0,
+                 on_event: Optional[Callable[[str], None]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Called with 'hit', 'miss', 'collapsed', 'eviction' or 'invalidation' for external counters
+        self.on_event = on_event or (lambda event: None)
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, calling loader at most once across concurrent misses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.on_event('hit')
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            self.on_event('miss')
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.collapsed += 1
+                self.on_event('collapsed')
+                leader = False
+            else:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+                        self.on_event('eviction')
+            return flight.value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
+
+    def invalidate(self):
+        """Drop all entries; loads already in flight will not be stored"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._inflight.clear()
+            self.invalidations += 1
+            self.on_event('invalidation')
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters for sizing the cache"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'collapsed_misses': self.collapsed,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,110 @@
+"""
+Schema upkeep
+Builds the indexes the hot queries depend on from a background thread, without blocking writes to the table
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (name, DDL). CONCURRENTLY builds without locking out inserts, but cannot run inside a transaction.
+APP_DATA_INDEXES: Sequence[Tuple[str, str]] = (
+    # Keyset pages, NDJSON streams and the rendered first page of GET /api/data seek on this
+    ('app_data_created_at_id',
+     'CREATE INDEX CONCURRENTLY IF NOT EXISTS app_data_created_at_id ON app_data (created_at DESC, id DESC)'),
+)
+
+# Advisory lock key held while building, so one session across all pods does the work
+BUILD_LOCK_KEY = 0x61707064617461  # 'appdata'
+
+# No row: the index does not exist. False: a build was interrupted and left it unusable.
+INDEX_VALID_SQL = 'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)'
+
+
+class IndexBuilder:
+    """
+    Creates `indexes` if they are missing, once per database.
+
+    ensure_started() starts a thread that takes a database-wide advisory
+    lock, so of all the workers and pods starting together only one builds
+    while the others check back every retry_interval until the indexes are
+    there. A build cut short (the worker was killed, say) leaves an invalid
+    index that IF NOT EXISTS would keep skipping; it is dropped and built
+    again. The build has no statement timeout, as it may take minutes on a
+    large table, and holds one pooled connection while it runs.
+    """
+
+    def __init__(self, connection_factory: Callable, indexes: Sequence[Tuple[str, str]] = APP_DATA_INDEXES,
+                 retry_interval: float = 60.0):
+        self.connection_factory = connection_factory
+        self.indexes = indexes
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def ensure_started(self):
+        """Start the build thread for this process unless it has run or is running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='index-builder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.connection_factory() as conn:
+                    if self._build(conn):
+                        return
+            except Exception as e:
+                logger.error(f"Could not check or build indexes: {e}")
+            time.sleep(self.retry_interval)
+
+    def _build(self, conn) -> bool:
+        """Build what is missing; False if another session holds the build lock"""
+        conn.rollback()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            missing = [(name, ddl) for name, ddl in self.indexes if not self._valid(cursor, name)]
+            if not missing:
+                return True
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', (BUILD_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                logger.info("Another session is building indexes; checking again later")
+                return False
+            try:
+                cursor.execute('SET statement_timeout = 0')
+                for name, ddl in missing:
+                    # Checked again under the lock: the previous holder may have just built it
+                    cursor.execute(INDEX_VALID_SQL, (name,))
+                    row = cursor.fetchone()
+                    if row is not None and row[0]:
+                        continue
+                    if row is not None:
+                        logger.warning(f"Dropping index {name} left invalid by an interrupted build")
+                        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                    logger.info(f"Building index {name}")
+                    started = time.monotonic()
+                    cursor.execute(ddl)
+                    logger.info(f"Built index {name} in {time.monotonic() - started:.1f}s")
+            finally:
+                cursor.execute('RESET statement_timeout')
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (BUILD_LOCK_KEY,))
+            return True
+        finally:
+            cursor.close()
+            conn.autocommit = False
+
+    @staticmethod
+    def _valid(cursor, name: str) -> bool:
+        cursor.execute(INDEX_VALID_SQL, (name,))
+        row = cursor.fetchone()
+        return row is not None and row[0]
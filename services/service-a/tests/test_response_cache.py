@@ -0,0 +1,77 @@
+import time
+import threading
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def test_hit_after_miss():
+    cache = ResponseCache()
+    loads = []
+    for _ in range(3):
+        assert cache.get_or_load('k', lambda: loads.append(1) or 'value') == 'value'
+    assert len(loads) == 1
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl_seconds=0.01)
+    cache.get_or_load('k', lambda: 1)
+    time.sleep(0.02)
+    assert cache.get_or_load('k', lambda: 2) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.get_or_load('a', lambda: 'a')
+    cache.get_or_load('b', lambda: 'b')
+    cache.get_or_load('a', lambda: 'stale')
+    cache.get_or_load('c', lambda: 'c')
+    assert cache.get_or_load('a', lambda: 'reloaded') == 'a'
+    assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ResponseCache()
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(2)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['misses'] < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 5
+    assert len(loads) == 1
+    assert cache.stats()['collapsed_misses'] == 4
+
+
+def test_load_error_reaches_every_waiter_and_is_not_cached():
+    cache = ResponseCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('k', lambda: (_ for _ in ()).throw(RuntimeError('down')))
+    assert cache.get_or_load('k', lambda: 'value') == 'value'
+
+
+def test_load_overtaken_by_invalidation_is_not_stored():
+    cache = ResponseCache()
+
+    def loader():
+        cache.invalidate()
+        return 'before the write'
+
+    assert cache.get_or_load('k', loader) == 'before the write'
+    assert cache.get_or_load('k', lambda: 'after the write') == 'after the write'
+    assert cache.stats()['invalidations'] == 1
@@ -10,28 +10,39 @@ import time
 import signal
 import json
 import logging
+import threading
 import traceback
 from contextlib import contextmanager
 from functools import wraps
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
-from flask import Flask, jsonify, request, g
-import psycopg2
-from psycopg2 import pool, OperationalError, InterfaceError
-from psycopg2.extras import RealDictCursor
-import boto3
-from botocore.exceptions import ClientError, BotoCoreError
-from botocore.config import Config
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+# Imported first so that, with STARTUP_PROFILE=true, the imports below are timed
+from startup_profile import startup_profiler
+
+from flask import Flask, jsonify, request, g, Response, has_request_context
+from psycopg2 import OperationalError, InterfaceError, errors
+from psycopg2.pool import PoolError
+
+from admission import QUEUE_DELAY_ENVIRON, AdmissionController
+from circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from conn_budget import ConnectionBudget, pod_budget
+from db_pool import ConnectionPool
+from deadline import DeadlineExceeded, parse_deadline, remaining
+from group_commit import GroupCommitWriter, INSERT_SQL
+from health_prober import HealthProber
+from idempotency import MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyStore
+from job_queue import JobQueue, QueueFull
+from log_pipeline import RequestLogSampler, configure_logging
+from metrics import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prepared_statements import PreparedStatements
+from probe_server import ProbeServer
+
+# Configure structured logging: JSON lines written to stdout by a background thread from a bounded queue
+configure_logging(
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'info').upper(), logging.INFO),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    on_drop=lambda: LOG_RECORDS_DROPPED.inc()
 )
 logger = logging.getLogger(__name__)
 
@@ -39,20 +50,162 @@ app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 
 # Application state
-db_pool: Optional[pool.ThreadedConnectionPool] = None
-s3_client: Optional[boto3.client] = None
+db_pool: Optional[ConnectionPool] = None
+s3_client: Optional[Any] = None  # boto3 S3 client, see init_s3()
 shutdown_flag = False
 
 # Configuration
 DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
 DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
 DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '20'))
-S3_RETRY_CONFIG = Config(
-    retries={'max_attempts': 3, 'mode': 'adaptive'},
-    connect_timeout=10,
-    read_timeout=10
+# Postgres connections for the whole pod, split across its workers; 0 lets every worker open DB_POOL_MAX.
+# With DB_CONN_BUDGET_DEPLOYMENT set, each pod also stays within its 1/DB_CONN_BUDGET_MAX_PODS share of it.
+DB_CONN_BUDGET = pod_budget(
+    int(os.getenv('DB_CONN_BUDGET_POD', '0')),
+    int(os.getenv('DB_CONN_BUDGET_DEPLOYMENT', '0')),
+    int(os.getenv('DB_CONN_BUDGET_MAX_PODS', '0'))
 )
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+# Connections idle at least this long are checked with SELECT 1 before use
+DB_POOL_VALIDATE_AFTER = float(os.getenv('DB_POOL_VALIDATE_AFTER', '1'))
+# Prepare the hot statements once per connection; turn off behind PgBouncer in transaction mode,
+# where consecutive transactions may run on different server sessions
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+# Time budget of a request that sends no X-Request-Deadline or X-Request-Timeout header, and the most
+# one may ask for; keep it under gunicorn's 30 s worker timeout and the load balancer's idle timeout
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '25'))
+REQUEST_TIMEOUT_MAX = float(os.getenv('REQUEST_TIMEOUT_MAX', str(REQUEST_TIMEOUT)))
+# Session statement timeout: the limit for work outside a request, and for requests on their default
+# budget. Transactions of requests with less time left get SET LOCAL statement_timeout instead.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', str(int(REQUEST_TIMEOUT * 1000))))
+# Prepared statements use their generic plan: for the LIMIT and keyset statements Postgres would
+# otherwise pick a custom plan, i.e. plan again, on every execution
+DB_SESSION_OPTIONS = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}' + (
+    ' -c plan_cache_mode=force_generic_plan' if DB_PREPARED_STATEMENTS else ''
+)
+# Circuit breaker: once CIRCUIT_BREAKER_FAILURE_RATIO of the calls to the database in the last
+# CIRCUIT_BREAKER_WINDOW_SECONDS fail, calls are refused at once for CIRCUIT_BREAKER_OPEN_SECONDS
+# (doubling per consecutive trip, up to the max) instead of each waiting out the connect/acquire timeouts
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_BREAKER_FAILURE_RATIO = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATIO', '0.5'))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', '20'))
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW_SECONDS', '10'))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '5'))
+CIRCUIT_BREAKER_MAX_OPEN_SECONDS = float(os.getenv('CIRCUIT_BREAKER_MAX_OPEN_SECONDS', '60'))
+# Retries of failed idempotent database operations: at most this fraction of calls, with jittered backoff
+DB_RETRY_BUDGET_RATIO = float(os.getenv('DB_RETRY_BUDGET_RATIO', '0.1'))
+DB_RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', '0.05'))
+DB_RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', '1'))
+# Admission control (CoDel): once even the least-delayed request of an ADMISSION_INTERVAL_MS interval
+# queued longer than ADMISSION_TARGET_MS, reads that queued longer than the target get 503; writes
+# only after queueing a whole interval. Set the target above the clock skew between proxy and pods.
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+ADMISSION_TARGET = float(os.getenv('ADMISSION_TARGET_MS', '50')) / 1000
+ADMISSION_INTERVAL = float(os.getenv('ADMISSION_INTERVAL_MS', '500')) / 1000
+# Proxies (comma-separated addresses or CIDRs) whose X-Request-Start is trusted as the time a request
+# arrived; empty ignores the header and estimates queueing from the listen backlog
+ADMISSION_TRUSTED_PROXIES = [
+    proxy.strip() for proxy in os.getenv('ADMISSION_TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
+# botocore Config for the S3 client; see s3_config()
+S3_CLIENT_CONFIG = {
+    'retries': {'max_attempts': 3, 'mode': 'adaptive'},
+    'connect_timeout': 10,
+    'read_timeout': 10
+}
+# Build the S3 client's service model in the gunicorn master, shared copy-on-write by the workers.
+# It costs about 130 ms (importing boto3, parsing the model) before any worker is forked, so set
+# false where the first request matters more than worker memory
+S3_PRELOAD = os.getenv('S3_PRELOAD', 'true').lower() == 'true'
+# Cap on the wait between attempts while a worker keeps trying to reach the database at startup
+DB_INIT_RETRY_MAX_DELAY = float(os.getenv('DB_INIT_RETRY_MAX_DELAY', '10'))
 HEALTH_CHECK_TIMEOUT = int(os.getenv('HEALTH_CHECK_TIMEOUT', '5'))
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '5'))
+# Port for the standalone /live and /ready listener; 0 disables it
+PROBE_PORT = int(os.getenv('PROBE_PORT', '8081'))
+# A snapshot older than this means probe rounds are not completing
+HEALTH_SNAPSHOT_MAX_AGE = float(os.getenv(
+    'HEALTH_SNAPSHOT_MAX_AGE', str(3 * HEALTH_CHECK_INTERVAL + HEALTH_CHECK_TIMEOUT)
+))
+# Errors and slow requests are always logged; other requests at LOG_SAMPLE_RATE
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_SLOW_REQUEST_SECONDS = float(os.getenv('LOG_SLOW_REQUEST_SECONDS', '1'))
+GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'false').lower() == 'true'
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', '2'))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv('GROUP_COMMIT_MAX_ROWS', '100'))
+# POST /api/process?async=1: jobs wait in a per-worker queue and are written in batches
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '1000'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '50'))
+JOB_RESULT_TTL = float(os.getenv('JOB_RESULT_TTL', '3600'))
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', '10'))
+# Jobs still queued this long after submission (their worker died or failed them) are run by any worker
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '30'))
+# Retried writes carrying the same Idempotency-Key within the TTL get the first response back
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_BLOOM_CAPACITY = int(os.getenv('IDEMPOTENCY_BLOOM_CAPACITY', '100000'))
+IDEMPOTENCY_BLOOM_ERROR_RATE = float(os.getenv('IDEMPOTENCY_BLOOM_ERROR_RATE', '0.01'))
+
+# Metrics (aggregated across gunicorn workers through PROMETHEUS_MULTIPROC_DIR)
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route', ['method', 'route'])
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Database connections checked out of the pool')
+DB_POOL_IDLE = Gauge('db_pool_connections_idle', 'Idle database connections held by the pool')
+DB_POOL_WAITING = Gauge('db_pool_waiting_requests', 'Requests blocked waiting for a pool connection')
+DB_POOL_TIMEOUTS = Counter('db_pool_acquire_timeouts_total', 'Pool checkouts that gave up after the acquire timeout')
+DB_POOL_FLUSHES = Counter('db_pool_flushes_total', 'Times the pool discarded all connections after a failure or DNS change')
+DB_POOL_WORKER_CONNECTIONS = Gauge(
+    'db_pool_worker_connections', 'Connections held by each worker (in use + idle)', ['pid']
+)
+DB_POOL_WORKER_LIMIT = Gauge('db_pool_worker_limit', "Each worker's share of the pod connection budget", ['pid'])
+PROCESS_JOB_QUEUE_DEPTH = Gauge('process_job_queue_depth', 'Async process jobs waiting to run')
+PROCESS_JOBS = Counter('process_jobs_total', 'Async process jobs by outcome', ['status'])
+PROCESS_JOB_LATENCY = Histogram(
+    'process_job_duration_seconds', 'Time from accepting an async process job to finishing it', ['status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+DB_STATEMENT_PREPARES = Counter(
+    'db_statement_prepares_total', 'Statements prepared on a database connection, by reason', ['reason']
+)
+IDEMPOTENCY_EVENTS = Counter(
+    'idempotency_events_total', 'Idempotency-Key handling: new keys, replays, prefilter results, conflicts', ['event']
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'circuit_breaker_transitions_total', 'Circuit breaker state changes, by dependency and new state',
+    ['dependency', 'state']
+)
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    'circuit_breaker_rejections_total', 'Calls refused at once because the dependency\'s circuit was open',
+    ['dependency']
+)
+REQUEST_DEADLINE_EXCEEDED = Counter(
+    'request_deadline_exceeded_total', 'Work refused because the request deadline had passed, by stage', ['stage']
+)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total', 'Requests admitted or shed by admission control, by priority', ['priority', 'decision']
+)
+ADMISSION_OVERLOADED = Gauge(
+    'admission_overloaded_workers', 'Workers that found a standing queue at their latest request and shed reads'
+)
+HTTP_QUEUE_DELAY = Histogram(
+    'http_request_queue_seconds', 'Time requests waited before a worker picked them up',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled')
+DB_RETRIES = Counter(
+    'db_retries_total', 'Retries of failed database operations, and retries refused by the retry budget', ['outcome']
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_acquire_wait_seconds', 'Time spent acquiring a pool connection',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+
+
+request_log_sampler = RequestLogSampler(sample_rate=LOG_SAMPLE_RATE, slow_seconds=LOG_SLOW_REQUEST_SECONDS)
 
 
 class ServiceError(Exception):
@@ -70,43 +223,161 @@ class StorageError(ServiceError):
     pass
 
 
-def retry_db_operation(max_retries=3, delay=1):
-    """Decorator for retrying database operations"""
+def make_breaker(dependency: str) -> Optional[CircuitBreaker]:
+    """Circuit breaker for one dependency, shared by the pod's workers, or None when disabled"""
+    if not CIRCUIT_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        dependency,
+        failure_ratio=CIRCUIT_BREAKER_FAILURE_RATIO,
+        min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+        window=CIRCUIT_BREAKER_WINDOW,
+        open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS,
+        max_open_seconds=CIRCUIT_BREAKER_MAX_OPEN_SECONDS,
+        on_transition=lambda state: CIRCUIT_BREAKER_TRANSITIONS.labels(dependency, state).inc()
+    )
+
+
+db_breaker = make_breaker('database')
+db_retry_budget = RetryBudget(ratio=DB_RETRY_BUDGET_RATIO, window=CIRCUIT_BREAKER_WINDOW)
+
+
+def is_connection_failure(e: BaseException) -> bool:
+    """A lost or refused connection, directly or behind a DatabaseError; statement timeouts don't count"""
+    if isinstance(e, DatabaseError):
+        e = e.__cause__
+    return isinstance(e, (OperationalError, InterfaceError)) and not isinstance(e, errors.QueryCanceled)
+
+
+def retry_db_operation(max_retries=3, delay=DB_RETRY_BASE_DELAY):
+    """
+    Decorator for retrying idempotent database operations after a connection failure. Retries back off
+    with full jitter, capped at DB_RETRY_MAX_DELAY, and stop once the retry budget is spent or the pause
+    would outlast the request's deadline; a refusal by the circuit breaker, a pool timeout or a statement
+    timeout is not retried.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
+            db_retry_budget.record_call()
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except (OperationalError, InterfaceError) as e:
-                    last_exception = e
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Database operation failed (attempt {attempt + 1}/{max_retries}): {e}")
-                        time.sleep(delay * (attempt + 1))
-                    else:
+                except (OperationalError, InterfaceError, DatabaseError) as e:
+                    if not is_connection_failure(e):
+                        raise
+                    pause = backoff_delay(attempt, delay, DB_RETRY_MAX_DELAY)
+                    deadline = request_deadline()
+                    if attempt == max_retries - 1:
                         logger.error(f"Database operation failed after {max_retries} attempts: {e}")
-                        raise DatabaseError(f"Database operation failed: {e}") from e
-            raise last_exception
+                    elif deadline is not None and remaining(deadline) <= pause:
+                        logger.warning(f"Database operation failed with no time left to retry: {e}")
+                    elif not db_retry_budget.try_retry():
+                        DB_RETRIES.labels('budget_exhausted').inc()
+                        logger.warning(f"Database operation failed and the retry budget is spent: {e}")
+                    else:
+                        DB_RETRIES.labels('retried').inc()
+                        logger.warning(f"Database operation failed (attempt {attempt + 1}/{max_retries}): {e}")
+                        time.sleep(pause)
+                        continue
+                    if isinstance(e, DatabaseError):
+                        raise
+                    raise DatabaseError(f"Database operation failed: {e}") from e
         return wrapper
     return decorator
 
 
+# SET LOCAL costs a round trip, so it is only sent when it shortens the session timeout by at least this
+DEADLINE_MIN_SAVING_MS = 1000
+
+
+def request_deadline() -> Optional[float]:
+    """The current request's deadline on the time.monotonic() clock, or None outside a request"""
+    return g.get('deadline') if has_request_context() else None
+
+
+def check_deadline(stage: str = 'database') -> Optional[float]:
+    """Seconds left before the current request's deadline (None outside a request); DatabaseError once it has passed"""
+    deadline = request_deadline()
+    if deadline is None:
+        return None
+    left = remaining(deadline)
+    if left <= 0:
+        REQUEST_DEADLINE_EXCEEDED.labels(stage).inc()
+        error = DeadlineExceeded(f"Request deadline passed {-left:.3f}s ago")
+        raise DatabaseError(str(error)) from error
+    return left
+
+
+def apply_statement_deadline(conn, prepared_first: bool = False):
+    """
+    Limit the connection's current transaction to the time left before the request's deadline.
+    With prepared_first the limit goes out with the caller's first statement, which must be run
+    through prepared_statements: sent on its own it would make that statement the second in its
+    transaction, which could then not be retried when its prepared statement has vanished.
+    """
+    prepared_statements.defer(conn)
+    deadline = request_deadline()
+    if deadline is None:
+        return
+    timeout_ms = max(1, int(remaining(deadline) * 1000))
+    if timeout_ms <= DB_STATEMENT_TIMEOUT_MS - DEADLINE_MIN_SAVING_MS:
+        if prepared_first:
+            prepared_statements.defer(conn, 'SET LOCAL statement_timeout = %s', (timeout_ms,))
+            return
+        cursor = conn.cursor()
+        cursor.execute('SET LOCAL statement_timeout = %s', (timeout_ms,))
+        cursor.close()
+
+
+def cancelled_by_deadline(e: BaseException) -> bool:
+    """Whether a statement was cancelled because the request ran out of time, not because the database is slow"""
+    deadline = request_deadline()
+    return isinstance(e, errors.QueryCanceled) and deadline is not None and remaining(deadline) <= 0.001
+
+
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections with proper error handling"""
+def get_db_connection(guarded: bool = True, prepared_first: bool = False):
+    """
+    Context manager for database connections with proper error handling. While the database circuit
+    is open it raises DatabaseError at once; guarded=False bypasses the breaker (health checks must
+    see the database itself) and leaves its statistics alone. prepared_first: the caller's first
+    statement goes through prepared_statements (see apply_statement_deadline).
+    """
+    left = check_deadline()
+    breaker = db_breaker if guarded else None
+    if breaker and not breaker.allow():
+        CIRCUIT_BREAKER_REJECTIONS.labels('database').inc()
+        error = CircuitOpenError('database', breaker.retry_after())
+        raise DatabaseError(str(error)) from error
+    
     conn = None
+    acquire_timeout = DB_POOL_ACQUIRE_TIMEOUT if left is None else min(DB_POOL_ACQUIRE_TIMEOUT, left)
     try:
         if not db_pool:
             raise DatabaseError("Database pool not initialized")
         
-        conn = db_pool.getconn(timeout=5)
-        if not conn:
-            raise DatabaseError("Failed to get connection from pool")
+        wait_start = time.perf_counter()
+        try:
+            conn = db_pool.getconn(timeout=acquire_timeout)
+        except PoolError as e:
+            DB_POOL_TIMEOUTS.inc()
+            # A wait cut short by the request's deadline says nothing about the database
+            if breaker and acquire_timeout == DB_POOL_ACQUIRE_TIMEOUT:
+                breaker.record_failure()
+            raise DatabaseError(f"No database connection available: {e}") from e
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - wait_start)
         
+        apply_statement_deadline(conn, prepared_first)
         yield conn
     except (OperationalError, InterfaceError) as e:
         logger.error(f"Database connection error: {e}")
+        if breaker and not cancelled_by_deadline(e):
+            breaker.record_failure()
+        if conn is None or conn.closed:
+            # A dead socket usually means a failover: every pooled connection points at the old primary
+            db_pool.flush(f"connection failure: {e}")
         if conn:
             try:
                 db_pool.putconn(conn, close=True)
@@ -116,18 +387,163 @@ def get_db_connection():
     except Exception as e:
         logger.error(f"Unexpected database error: {e}")
         if conn:
+            # The database answered; the error is the query's or the caller's
+            if breaker:
+                breaker.record_success()
             try:
                 db_pool.putconn(conn)
             except Exception:
                 pass
         raise
     else:
+        if breaker:
+            breaker.record_success()
         if conn:
             db_pool.putconn(conn)
+    finally:
+        record_pool_usage()
+
+
+def record_pool_usage():
+    """Publish this worker's pool occupancy to the shared gauges"""
+    if db_pool:
+        stats = db_pool.stats()
+        DB_POOL_IN_USE.set(stats['in_use'])
+        DB_POOL_IDLE.set(stats['idle'])
+        DB_POOL_WAITING.set(stats['waiting'])
+        DB_POOL_WORKER_CONNECTIONS.labels(os.getpid()).set(stats['in_use'] + stats['idle'] + stats['opening'])
+
+
+def resize_db_pool(share: int):
+    """Apply this worker's share of the connection budget to its pool"""
+    maxconn = min(share, DB_POOL_MAX)
+    DB_POOL_WORKER_LIMIT.labels(os.getpid()).set(maxconn)
+    if db_pool:
+        db_pool.resize(maxconn)
+
+
+connection_budget = ConnectionBudget(DB_CONN_BUDGET, on_change=resize_db_pool) if DB_CONN_BUDGET else None
+
+
+group_commit_writer = GroupCommitWriter(
+    get_db_connection,
+    window_seconds=GROUP_COMMIT_WINDOW_MS / 1000.0,
+    max_rows=GROUP_COMMIT_MAX_ROWS
+) if GROUP_COMMIT_ENABLED else None
+
+
+INSERT_ROW_SQL = 'INSERT INTO app_data (data) VALUES (%s) RETURNING id, created_at'
+
+prepared_statements = PreparedStatements(
+    enabled=DB_PREPARED_STATEMENTS,
+    on_prepare=lambda reason: DB_STATEMENT_PREPARES.labels(reason).inc()
+)
+
+
+def insert_data_row(data_value: str):
+    """Insert one app_data row and return (id, created_at), coalescing with concurrent writers when enabled"""
+    if group_commit_writer:
+        try:
+            return group_commit_writer.insert(data_value, timeout=check_deadline())
+        except TimeoutError as e:
+            raise DatabaseError(str(e)) from e
+    
+    with get_db_connection(prepared_first=True) as conn:
+        cursor = conn.cursor()
+        prepared_statements.execute(cursor, INSERT_ROW_SQL, (data_value,))
+        row_id, created_at = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+    return row_id, created_at
+
+
+idempotency_store = IdempotencyStore(
+    get_db_connection,
+    ttl=IDEMPOTENCY_TTL,
+    bloom_capacity=IDEMPOTENCY_BLOOM_CAPACITY,
+    bloom_error_rate=IDEMPOTENCY_BLOOM_ERROR_RATE,
+    on_event=lambda event: IDEMPOTENCY_EVENTS.labels(event).inc()
+) if IDEMPOTENCY_ENABLED else None
 
 
-def init_db_pool() -> bool:
-    """Initialize database connection pool with retries"""
+def idempotency_request() -> Optional[Tuple[str, str]]:
+    """(key, request fingerprint) if the request carries an Idempotency-Key header; ValueError if it is malformed"""
+    key = request.headers.get('Idempotency-Key')
+    if key is None or not idempotency_store:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+    return key, IdempotencyStore.fingerprint(request.method, request.path, request.get_data())
+
+
+def insert_data_row_once(idempotency: Tuple[str, str], data_value: str,
+                         describe: Callable[[int, datetime], Dict[str, Any]]) -> Tuple[int, Dict[str, Any], bool]:
+    """
+    Insert one app_data row at most once per idempotency key and return (status, body, replayed).
+    The row and the key are committed together; if the key is already held, the insert is rolled
+    back and the stored response returned. Group commit is bypassed so both share a transaction.
+    """
+    key, request_hash = idempotency
+    stored = idempotency_store.lookup(key, request_hash)
+    if stored is not None:
+        return stored[0], stored[1], True
+    
+    with get_db_connection(prepared_first=True) as conn:
+        cursor = conn.cursor()
+        prepared_statements.execute(cursor, INSERT_ROW_SQL, (data_value,))
+        body = describe(*cursor.fetchone())
+        try:
+            stored = idempotency_store.claim(cursor, key, request_hash, 201, body)
+        except IdempotencyConflict as e:
+            # A client error, not a database one: leave the connection block before raising
+            stored = e
+        if stored is None:
+            conn.commit()
+        else:
+            conn.rollback()
+        cursor.close()
+    if isinstance(stored, IdempotencyConflict):
+        raise stored
+    if stored is not None:
+        return stored[0], stored[1], True
+    idempotency_store.remember(key)
+    return 201, body, False
+
+
+def process_batch(cursor, values: List[str]) -> List[Dict[str, Any]]:
+    """Process queued payloads and insert them with one statement, in the job queue's transaction"""
+    from psycopg2.extras import execute_values
+    processed = [f"processed_{value}" for value in values]
+    rows = execute_values(
+        cursor, INSERT_SQL, [(value,) for value in processed],
+        page_size=len(processed), fetch=True
+    )
+    return [
+        {'id': row_id, 'processed': value, 'created_at': created_at.isoformat()}
+        for (row_id, created_at), value in zip(rows, processed)
+    ]
+
+
+def record_job_finished(status: str, seconds: float):
+    PROCESS_JOBS.labels(status).inc()
+    PROCESS_JOB_LATENCY.labels(status).observe(seconds)
+    PROCESS_JOB_QUEUE_DEPTH.set(process_jobs.depth())
+
+
+process_jobs = JobQueue(
+    get_db_connection,
+    process_batch,
+    workers=JOB_WORKERS,
+    max_size=JOB_QUEUE_SIZE,
+    batch_size=JOB_BATCH_SIZE,
+    result_ttl=JOB_RESULT_TTL,
+    stale_after=JOB_STALE_SECONDS,
+    on_finish=record_job_finished
+)
+
+
+def init_db_pool(max_retries: Optional[int] = 3) -> bool:
+    """Initialize database connection pool with retries (max_retries=None: until it succeeds)"""
     global db_pool
     
     db_host = os.getenv('DB_HOST')
@@ -144,42 +560,68 @@ def init_db_pool() -> bool:
         logger.warning("DB_USER or DB_PASSWORD not set, attempting IAM authentication")
         # In production, use IAM roles for RDS authentication
     
-    max_retries = 3
-    for attempt in range(max_retries):
+    maxconn = DB_POOL_MAX
+    if connection_budget:
+        maxconn = min(DB_POOL_MAX, connection_budget.rebalance())
+    
+    # Built once, with only the connecting retried: each pool registers a fork hook that keeps it alive
+    pool = ConnectionPool(
+        minconn=min(DB_POOL_MIN, maxconn),
+        maxconn=maxconn,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        max_idle=DB_POOL_MAX_IDLE,
+        validate_after=DB_POOL_VALIDATE_AFTER,
+        on_flush=lambda reason: DB_POOL_FLUSHES.inc(),
+        prefill=False,
+        host=db_host,
+        port=db_port,
+        database=db_name,
+        user=db_user,
+        password=db_password,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        options=DB_SESSION_OPTIONS
+    )
+    
+    attempt = 0
+    while True:
         try:
-            db_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=DB_POOL_MIN,
-                maxconn=DB_POOL_MAX,
-                host=db_host,
-                port=db_port,
-                database=db_name,
-                user=db_user,
-                password=db_password,
-                connect_timeout=DB_CONNECT_TIMEOUT,
-                options='-c statement_timeout=30000'  # 30 second statement timeout
-            )
+            pool.prefill()
             
-            # Test connection
-            test_conn = db_pool.getconn()
-            test_conn.close()
-            db_pool.putconn(test_conn)
+            # Test connection (validated on checkout)
+            test_conn = pool.getconn()
+            pool.putconn(test_conn)
             
-            logger.info(f"Database connection pool initialized (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+            db_pool = pool
+            if connection_budget:
+                connection_budget.ensure_started()
+            logger.info(f"Database connection pool initialized (min={db_pool.minconn}, max={maxconn})")
             return True
         except Exception as e:
-            logger.error(f"Failed to initialize DB pool (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
+            attempt += 1
+            logger.error(f"Failed to initialize DB pool (attempt {attempt}/{max_retries or 'unlimited'}): {e}")
+            if max_retries and attempt >= max_retries:
                 logger.critical("Failed to initialize database pool after all retries")
+                pool.closeall()
                 return False
-    
-    return False
+            time.sleep(min(2 ** (attempt - 1), DB_INIT_RETRY_MAX_DELAY))  # Exponential backoff
+
+
+def s3_config():
+    """botocore Config for the S3 client"""
+    from botocore.config import Config
+    return Config(**S3_CLIENT_CONFIG)
 
 
 def init_s3() -> bool:
-    """Initialize S3 client using IAM roles (preferred) or credentials"""
+    """
+    Initialize S3 client using IAM roles (preferred) or credentials. No request is made:
+    the health prober's S3 check is the first to reach the service.
+    """
     global s3_client
+    # Only the health check uses S3; boto3 is imported here rather than at startup
+    import boto3
+    from botocore.exceptions import ClientError, BotoCoreError
     
     try:
         # Prefer IAM role over credentials
@@ -189,7 +631,7 @@ def init_s3() -> bool:
         # Check if we should use IAM role (no credentials provided)
         if not os.getenv('AWS_ACCESS_KEY_ID'):
             logger.info("Using IAM role for S3 access")
-            s3_client = boto3.client('s3', region_name=region, config=S3_RETRY_CONFIG)
+            s3_client = boto3.client('s3', region_name=region, config=s3_config())
         else:
             logger.info("Using provided credentials for S3 access")
             s3_client = boto3.client(
@@ -197,11 +639,8 @@ def init_s3() -> bool:
                 aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
                 aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
                 region_name=region,
-                config=S3_RETRY_CONFIG
+                config=s3_config()
             )
-        
-        # Test connection
-        s3_client.list_buckets()
         logger.info("S3 client initialized successfully")
         return True
     except (ClientError, BotoCoreError) as e:
@@ -212,6 +651,30 @@ def init_s3() -> bool:
         return False
 
 
+def check_database():
+    """Dependency check: round-trip a trivial query through the pool"""
+    if not db_pool:
+        return {'status': 'not_initialized'}
+    with get_db_connection(guarded=False) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.close()
+
+
+def check_s3():
+    """Dependency check: list buckets with the shared S3 client"""
+    if not s3_client:
+        return {'status': 'not_initialized'}
+    s3_client.list_buckets()
+
+
+health_prober = HealthProber(
+    {'database': check_database, 's3': check_s3},
+    interval=HEALTH_CHECK_INTERVAL,
+    timeout=HEALTH_CHECK_TIMEOUT
+)
+
+
 def validate_request_json(required_fields=None):
     """Validate request JSON and required fields"""
     if not request.is_json:
@@ -229,11 +692,49 @@ def validate_request_json(required_fields=None):
     return True, data
 
 
+def record_admission(priority: str, admitted: bool, queue_delay: Optional[float]):
+    ADMISSION_DECISIONS.labels(priority, 'admitted' if admitted else 'shed').inc()
+    if queue_delay is not None:
+        HTTP_QUEUE_DELAY.observe(queue_delay)
+
+
+# Probes, health and metrics: never shed, and served whatever deadline the caller sent
+PROBE_PATHS = ('/live', '/ready', '/health', '/metrics')
+
+# Wraps Flask, so a shed request costs no routing, request context or hooks
+admission = AdmissionController(
+    app.wsgi_app,
+    target=ADMISSION_TARGET,
+    interval=ADMISSION_INTERVAL,
+    exempt_paths=PROBE_PATHS,
+    trusted_proxies=ADMISSION_TRUSTED_PROXIES,
+    enabled=ADMISSION_CONTROL_ENABLED,
+    on_decision=record_admission,
+    on_overload=lambda overloaded: ADMISSION_OVERLOADED.set(1 if overloaded else 0),
+    on_in_flight=HTTP_IN_FLIGHT.set
+)
+app.wsgi_app = admission
+
+
 @app.before_request
 def before_request():
     """Set request start time and add request ID"""
+    # The budget counts from when the request started queueing, as far as admission control can tell
+    received = time.monotonic() - request.environ.get(QUEUE_DELAY_ENVIRON, 0.0)
     g.start_time = time.time()
     g.request_id = request.headers.get('X-Request-ID', f"{int(time.time() * 1000)}")
+    if request.path in PROBE_PATHS:
+        return None
+    
+    # Everything done for the request (pool waits, statements) has to fit before this
+    try:
+        g.deadline = parse_deadline(request.headers, REQUEST_TIMEOUT, REQUEST_TIMEOUT_MAX, received)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    if remaining(g.deadline) <= 0:
+        REQUEST_DEADLINE_EXCEEDED.labels('arrival').inc()
+        return jsonify({'error': 'Request deadline exceeded', 'request_id': g.request_id}), 504
+
 
 
 @app.after_request
@@ -242,13 +743,23 @@ def after_request(response):
     # Calculate request duration
     duration = time.time() - g.start_time
     
-    # Log request
-    logger.info(
-        f"Request: {request.method} {request.path} | "
-        f"Status: {response.status_code} | "
-        f"Duration: {duration:.3f}s | "
-        f"Request-ID: {g.request_id}"
-    )
+    # Label by URL rule rather than raw path to keep series cardinality bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    HTTP_LATENCY.labels(request.method, route).observe(duration)
+    
+    # Log request (sampled; the write happens on the log thread)
+    sample_rate = request_log_sampler.sample(response.status_code, duration)
+    if sample_rate is not None:
+        logger.info('Request completed', extra={
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'request_id': g.request_id,
+            'sample_rate': sample_rate,
+        })
     
     # Add comprehensive security headers
     response.headers['X-Request-ID'] = g.request_id
@@ -285,109 +796,103 @@ def handle_exception(e):
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Comprehensive health check endpoint"""
+    """Comprehensive health check endpoint, answered from the background prober's snapshot"""
+    health_prober.ensure_started()
+    checks, age, checked_at = health_prober.snapshot()
+    
     health_status = {
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
         'service': 'service-b',
         'version': os.getenv('SERVICE_VERSION', '1.0.0'),
+        'checked_at': checked_at,
+        'snapshot_age_seconds': round(age, 3) if age is not None else None,
         'checks': {}
     }
     
-    overall_healthy = True
+    if checks is None:
+        health_status['status'] = 'starting'
+        return jsonify(health_status), 503
     
-    # Database check with timeout
-    try:
-        if db_pool:
-            start = time.time()
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1')
-                cursor.close()
-            duration = time.time() - start
-            
-            health_status['checks']['database'] = {
-                'status': 'ok',
-                'response_time_ms': round(duration * 1000, 2)
-            }
-        else:
-            health_status['checks']['database'] = {'status': 'not_initialized'}
-            overall_healthy = False
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        health_status['checks']['database'] = {
-            'status': 'error',
-            'error': str(e) if app.debug else 'Connection failed'
-        }
-        overall_healthy = False
-    
-    # S3 check with timeout
-    try:
-        if s3_client:
-            start = time.time()
-            s3_client.list_buckets()
-            duration = time.time() - start
-            
-            health_status['checks']['s3'] = {
-                'status': 'ok',
-                'response_time_ms': round(duration * 1000, 2)
-            }
-        else:
-            health_status['checks']['s3'] = {'status': 'not_initialized'}
-            overall_healthy = False
-    except Exception as e:
-        logger.error(f"S3 health check failed: {e}")
-        health_status['checks']['s3'] = {
-            'status': 'error',
-            'error': str(e) if app.debug else 'Connection failed'
-        }
-        overall_healthy = False
+    for name, result in checks.items():
+        # Don't expose dependency error details in production
+        if result.get('status') == 'error' and not app.debug:
+            result = dict(result, error='Connection failed')
+        health_status['checks'][name] = result
     
     # Determine overall status
-    if not overall_healthy:
+    if any(check.get('status') != 'ok' for check in checks.values()):
         health_status['status'] = 'degraded' if any(
-            check.get('status') == 'ok' for check in health_status['checks'].values()
+            check.get('status') == 'ok' for check in checks.values()
         ) else 'unhealthy'
     
+    if age > HEALTH_SNAPSHOT_MAX_AGE:
+        health_status['status'] = 'unhealthy'
+        health_status['reason'] = 'Health snapshot is stale'
+    
+    # Shared by the pod's workers; informational, since the checks above bypass the breaker
+    if db_breaker:
+        health_status['circuit_breakers'] = {db_breaker.name: db_breaker.status()}
+    
+    # This worker's view
+    health_status['admission'] = admission.status()
+    
     status_code = 200 if health_status['status'] == 'healthy' else 503
     return jsonify(health_status), status_code
 
 
+def readiness_status():
+    """Readiness from in-memory state only; shared by /ready and the probe listener"""
+    health_prober.ensure_started()
+    checks, age, _ = health_prober.snapshot()
+    
+    # S3 only backs a health check, so readiness doesn't wait for its client
+    if not db_pool:
+        reason = 'Dependencies not initialized'
+    elif checks is None:
+        reason = 'Health checks have not completed yet'
+    elif age > HEALTH_SNAPSHOT_MAX_AGE:
+        reason = 'Health snapshot is stale'
+    elif checks['database'].get('status') != 'ok':
+        reason = f"Database check {checks['database'].get('status')}"
+    else:
+        return {'status': 'ready', 'snapshot_age_seconds': round(age, 3)}, 200
+    
+    return {'status': 'not_ready', 'reason': reason}, 503
+
+
+def liveness_status():
+    """Liveness: the process is up and its threads are being scheduled"""
+    return {
+        'status': 'alive',
+        'uptime_seconds': time.time() - app.start_time if hasattr(app, 'start_time') else 0
+    }, 200
+
+
+# Started per worker by init_worker() (gunicorn post_fork) and by main()
+probe_server = ProbeServer(
+    PROBE_PORT, {'/live': liveness_status, '/ready': readiness_status}
+) if PROBE_PORT else None
+
+
 @app.route('/ready', methods=['GET'])
 def ready():
-    """Readiness probe - checks if service can accept traffic"""
-    if db_pool and s3_client:
-        # Quick connectivity check
-        try:
-            with get_db_connection() as conn:
-                pass
-            return jsonify({'status': 'ready'}), 200
-        except Exception as e:
-            logger.warning(f"Readiness check failed: {e}")
-            return jsonify({'status': 'not_ready', 'reason': str(e)}), 503
-    
-    return jsonify({'status': 'not_ready', 'reason': 'Dependencies not initialized'}), 503
+    """Readiness probe - checks if service can accept traffic, from the cached health snapshot"""
+    payload, status_code = readiness_status()
+    return jsonify(payload), status_code
 
 
 @app.route('/live', methods=['GET'])
 def live():
     """Liveness probe - checks if service is running"""
-    return jsonify({
-        'status': 'alive',
-        'uptime_seconds': time.time() - app.start_time if hasattr(app, 'start_time') else 0
-    }), 200
+    payload, status_code = liveness_status()
+    return jsonify(payload), status_code
 
 
 @app.route('/metrics', methods=['GET'])
 def metrics():
-    """Prometheus-compatible metrics endpoint"""
-    metrics_data = {
-        'http_requests_total': 0,  # Would be tracked in production
-        'http_request_duration_seconds': 0,
-        'db_connections_active': db_pool.getconn() if db_pool else 0,
-        'db_connections_idle': (DB_POOL_MAX - db_pool.getconn()) if db_pool else 0,
-    }
-    return jsonify(metrics_data), 200
+    """Prometheus metrics endpoint, aggregated across all workers"""
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
 @app.route('/api/process', methods=['POST'])
@@ -407,25 +912,54 @@ def process():
         return jsonify({'error': 'Data field too large (max 10000 chars)', 'request_id': g.request_id}), 400
     
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            # Simulate processing
-            processed = f"processed_{data_value}"
-            cursor.execute(
-                'INSERT INTO app_data (data) VALUES (%s) RETURNING id, created_at',
-                (processed,)
-            )
-            result = cursor.fetchone()
-            row_id, created_at = result[0], result[1]
-            conn.commit()
-            cursor.close()
-        
+        idempotency = idempotency_request()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 400
+    
+    if request.args.get('async', '').lower() in ('1', 'true'):
+        if idempotency:
+            # The job's row is written later by a batch, outside any transaction the key could join
+            return jsonify({
+                'error': 'Idempotency-Key is only supported for synchronous processing',
+                'request_id': g.request_id
+            }), 400
+        try:
+            job_id = process_jobs.submit(data_value, request_id=g.request_id)
+        except QueueFull as e:
+            PROCESS_JOBS.labels('rejected').inc()
+            logger.warning(f"Rejected async process job: {e}")
+            return jsonify({
+                'error': 'Job queue full, retry later',
+                'request_id': g.request_id
+            }), 503, {'Retry-After': '1'}
+        except (DatabaseError, errors.Error) as e:
+            logger.error(f"Database error queueing process job: {e}")
+            return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+        PROCESS_JOB_QUEUE_DEPTH.set(process_jobs.depth())
+        status_url = f"/api/process/{job_id}"
         return jsonify({
-            'id': row_id,
-            'processed': processed,
-            'created_at': created_at.isoformat(),
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': status_url,
             'request_id': g.request_id
-        }), 201
+        }), 202, {'Location': status_url}
+    
+    # Simulate processing
+    processed = f"processed_{data_value}"
+    
+    def describe(row_id, created_at):
+        return {'id': row_id, 'processed': processed, 'created_at': created_at.isoformat()}
+    
+    try:
+        if idempotency:
+            status_code, body, replayed = insert_data_row_once(idempotency, processed, describe)
+        else:
+            status_code, body, replayed = 201, describe(*insert_data_row(processed)), False
+        
+        headers = {'Idempotent-Replayed': 'true'} if replayed else {}
+        return jsonify(dict(body, request_id=g.request_id)), status_code, headers
+    except IdempotencyConflict as e:
+        return jsonify({'error': str(e), 'request_id': g.request_id}), 422
     except DatabaseError as e:
         logger.error(f"Database error in process: {e}")
         return jsonify({
@@ -440,6 +974,19 @@ def process():
         }), 500
 
 
+@app.route('/api/process/<job_id>', methods=['GET'])
+def process_job_status(job_id):
+    """Status and result of an async process job, from whichever pod accepted it"""
+    try:
+        job = process_jobs.status(job_id)
+    except (DatabaseError, errors.Error) as e:
+        logger.error(f"Database error reading process job {job_id}: {e}")
+        return jsonify({'error': 'Database error', 'request_id': g.request_id}), 503
+    if job is None:
+        return jsonify({'error': 'Job not found', 'request_id': g.request_id}), 404
+    return jsonify(dict(job, request_id=g.request_id)), 200
+
+
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
     global shutdown_flag
@@ -447,6 +994,58 @@ def signal_handler(signum, frame):
     shutdown_flag = True
 
 
+def warm_up():
+    """Build shared, read-only state once in the gunicorn master so forked workers inherit it"""
+    if not S3_PRELOAD:
+        return
+    # Creating a client parses botocore's S3 service model, which the default session then caches.
+    # No connection is opened until the first request.
+    with startup_profiler.phase('s3_preload'):
+        import boto3
+        boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'), config=s3_config())
+
+
+def init_dependencies():
+    """Create this process's pool and clients; runs on the worker's startup thread"""
+    started = time.perf_counter()
+    with startup_profiler.phase('db_pool'):
+        # Keep trying: a worker that starts before its database is reachable becomes ready once it is
+        init_db_pool(max_retries=None)
+    # Readiness only waits for the database check; run it now rather than at the end of the interval
+    health_prober.wake()
+    if idempotency_store:
+        idempotency_store.ensure_started()
+    try:
+        process_jobs.ensure_table()
+    except Exception as e:
+        # Retried by the first submit, status request or sweep
+        logger.error(f"Could not create the process_jobs table: {e}")
+    with startup_profiler.phase('s3_client'):
+        if not init_s3():
+            logger.warning("Failed to initialize S3 client. Service will run in degraded mode.")
+    health_prober.wake()
+    startup_profiler.record('worker_startup', time.perf_counter() - started)
+    logger.info(f"Worker dependencies initialized; startup profile: {json.dumps(startup_profiler.report())}")
+
+
+def init_worker():
+    """Start this process's background threads and its startup thread (gunicorn post_fork)"""
+    app.start_time = time.time()
+    # Accept requests straight away: /live answers at once, while /ready and the database routes
+    # return 503 until the startup thread has connected
+    threading.Thread(target=init_dependencies, name='startup', daemon=True).start()
+    health_prober.ensure_started()
+    process_jobs.ensure_started()
+    if probe_server:
+        probe_server.ensure_started()
+
+
+def shutdown_worker():
+    """Finish queued async jobs before the worker exits (gunicorn worker_exit)"""
+    if not process_jobs.drain(JOB_DRAIN_TIMEOUT):
+        logger.warning("Async process jobs were still running at shutdown")
+
+
 def main():
     """Main application entry point"""
     # Set up signal handlers
@@ -465,6 +1064,13 @@ def main():
     if not init_s3():
         logger.warning("Failed to initialize S3 client. Service will run in degraded mode.")
     
+    health_prober.ensure_started()
+    process_jobs.ensure_started()
+    if idempotency_store:
+        idempotency_store.ensure_started()
+    if probe_server:
+        probe_server.ensure_started()
+    
     # Run application
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', '8080'))
@@ -479,6 +1085,7 @@ def main():
     finally:
         # Cleanup
         logger.info("Cleaning up resources...")
+        shutdown_worker()
         if db_pool:
             try:
                 db_pool.closeall()
@@ -487,5 +1094,8 @@ def main():
                 logger.error(f"Error closing database pool: {e}")
 
 
+# Everything above runs on import (in the gunicorn master, with preload_app)
+startup_profiler.record('import_app', time.perf_counter() - startup_profiler.started)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,352 @@
+"""
+Circuit breakers and retry budgets
+Fail calls to a dependency that is down in microseconds instead of letting every worker wait out its timeouts
+"""
+
+import os
+import time
+import mmap
+import fcntl
+import random
+import struct
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BREAKER_DIR_ENV = 'CIRCUIT_BREAKER_DIR'
+# Workers per pod that can count outcomes; more than gunicorn's usual 2 * CPUs + 1
+MAX_WORKERS = 64
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Header: four float64s. open_until is 0 while closed; probe_until is the half-open probe's lease;
+# generation changes on every transition, retiring the outcomes counted before it
+_OPEN_UNTIL, _PROBE_UNTIL, _TRIPS, _GENERATION = 0, 8, 16, 24
+_HEADER_SIZE = 32
+
+_private_dir: Optional[str] = None
+
+
+def _directory() -> str:
+    global _private_dir
+    directory = os.getenv(BREAKER_DIR_ENV)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    if _private_dir is None:
+        _private_dir = tempfile.mkdtemp(prefix='breakers-')
+    return _private_dir
+
+
+def reset_directory():
+    """Forget breaker state from a previous server run (call from the gunicorn master on start)"""
+    directory = os.getenv(BREAKER_DIR_ENV)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CircuitOpenError(Exception):
+    """A call was refused because its dependency's circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one dependency, shared by every worker of a pod.
+
+    While closed, calls go through and their outcomes are counted over the
+    last `window` seconds across all workers: a sync worker stuck on a
+    timeout makes one call where a healthy one makes hundreds, so no single
+    worker would see enough calls to decide. When at least min_calls have
+    been made and failure_ratio of them failed, the circuit opens: allow()
+    returns False until the open period ends, a check that costs one read
+    from shared memory. The open period starts at open_seconds, doubles on
+    each consecutive trip up to max_open_seconds and is jittered by +/-20%
+    so pods do not probe in step. Once it ends the circuit is half-open: a
+    single call across the pod is let through as a probe (another gets the
+    chance if it has not reported back within probe_timeout); its success
+    closes the circuit, its failure opens it again.
+
+    The state lives in a small file mapped by each worker, in
+    CIRCUIT_BREAKER_DIR (gunicorn_config.py points it at a directory shared
+    by the pod's workers; without it each process keeps its own state).
+    Each worker counts into its own slot of the file, so recording an
+    outcome takes no cross-process lock; only transitions take the file
+    lock. Times are CLOCK_MONOTONIC, which all processes on a host share.
+    on_transition(state) is called in the process that made each transition.
+    """
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 20, window: int = 10,
+                 open_seconds: float = 5.0, max_open_seconds: float = 60.0, probe_timeout: float = 10.0,
+                 on_transition: Optional[Callable[[str], None]] = None):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = max(1, int(window))
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self.on_transition = on_transition or (lambda state: None)
+        # Slot: pid, generation, then a (second, successes, failures) bucket per second of the window
+        self._slot_format = f'{2 + 3 * self.window}d'
+        self._slot_size = struct.calcsize(self._slot_format)
+        self._slot: Optional[int] = None
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._transition_lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        self._file = None
+        self._pid: Optional[int] = None
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open state only the probe is allowed"""
+        open_until = self._read(_OPEN_UNTIL)
+        if not open_until:
+            return True
+        now = time.monotonic()
+        if now < open_until:
+            return False
+        with self._file_lock():
+            if not self._read(_OPEN_UNTIL):
+                return True
+            if self._read(_PROBE_UNTIL) > now:
+                return False
+            self._write(_PROBE_UNTIL, now + self.probe_timeout)
+        logger.info(f"{self.name} circuit half-open; letting a probe call through")
+        return True
+
+    def check(self):
+        """allow(), raising CircuitOpenError when the call may not go ahead"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        open_until = self._read(_OPEN_UNTIL)
+        if open_until:
+            if time.monotonic() >= open_until:
+                self._close()  # the probe succeeded
+            return
+        self._count(successes=1)
+
+    def record_failure(self):
+        open_until = self._read(_OPEN_UNTIL)
+        if open_until:
+            if time.monotonic() >= open_until:
+                self._open(open_until)  # the probe failed
+            return
+        self._count(failures=1)
+        successes, failures = self._totals()
+        calls = successes + failures
+        if calls >= self.min_calls and failures >= calls * self.failure_ratio:
+            self._open(0.0, f"{failures} of the last {calls} calls failed")
+
+    def state(self) -> str:
+        open_until = self._read(_OPEN_UNTIL)
+        if not open_until:
+            return CLOSED
+        return OPEN if time.monotonic() < open_until else HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through (0 unless open)"""
+        open_until = self._read(_OPEN_UNTIL)
+        return max(0.0, open_until - time.monotonic()) if open_until else 0.0
+
+    def status(self) -> dict:
+        successes, failures = self._totals()
+        return {
+            'state': self.state(),
+            'retry_after_seconds': round(self.retry_after(), 3),
+            'consecutive_trips': int(self._read(_TRIPS)),
+            'window_calls': successes + failures,
+            'window_failures': failures,
+        }
+
+    def _open(self, expected_open_until: float, reason: str = 'probe failed'):
+        with self._file_lock():
+            if self._read(_OPEN_UNTIL) != expected_open_until:
+                return  # another worker got there first
+            trips = self._read(_TRIPS) + 1
+            duration = min(self.open_seconds * 2 ** (trips - 1), self.max_open_seconds) * random.uniform(0.8, 1.2)
+            self._write(_OPEN_UNTIL, time.monotonic() + duration)
+            self._write(_PROBE_UNTIL, 0.0)
+            self._write(_TRIPS, trips)
+            self._write(_GENERATION, self._read(_GENERATION) + 1)
+        logger.warning(f"{self.name} circuit opened for {duration:.1f}s: {reason}")
+        self.on_transition(OPEN)
+
+    def _close(self):
+        with self._file_lock():
+            if not self._read(_OPEN_UNTIL):
+                return
+            self._write(_OPEN_UNTIL, 0.0)
+            self._write(_PROBE_UNTIL, 0.0)
+            self._write(_TRIPS, 0.0)
+            self._write(_GENERATION, self._read(_GENERATION) + 1)
+        logger.info(f"{self.name} circuit closed")
+        self.on_transition(CLOSED)
+
+    def _count(self, successes: int = 0, failures: int = 0):
+        """Add an outcome to this worker's slot"""
+        shared = self._state()
+        if self._slot is None:
+            return
+        base = _HEADER_SIZE + self._slot * self._slot_size
+        with self._lock:
+            generation = self._read(_GENERATION)
+            if struct.unpack_from('d', shared, base + 8)[0] != generation:
+                struct.pack_into(self._slot_format, shared, base, os.getpid(), generation,
+                                 *([-1.0, 0.0, 0.0] * self.window))
+            second = int(time.monotonic())
+            bucket = base + 16 + 24 * (second % self.window)
+            start, ok, failed = struct.unpack_from('3d', shared, bucket)
+            if start != second:
+                ok = failed = 0.0
+            struct.pack_into('3d', shared, bucket, second, ok + successes, failed + failures)
+
+    def _totals(self):
+        """Successes and failures in the window, summed over every worker's slot"""
+        shared = self._state()
+        generation = self._read(_GENERATION)
+        oldest = int(time.monotonic()) - self.window
+        successes = failures = 0
+        for slot in range(MAX_WORKERS):
+            values = struct.unpack_from(self._slot_format, shared, _HEADER_SIZE + slot * self._slot_size)
+            if not values[0] or values[1] != generation:
+                continue
+            for i in range(2, len(values), 3):
+                if values[i] > oldest:
+                    successes += values[i + 1]
+                    failures += values[i + 2]
+        return int(successes), int(failures)
+
+    def _state(self) -> mmap.mmap:
+        if self._pid != os.getpid():
+            with self._open_lock:
+                if self._pid != os.getpid():
+                    self._attach()
+        return self._map
+
+    def _attach(self):
+        """Map the breaker's file in this process and claim a counting slot in it"""
+        path = os.path.join(_directory(), f'breaker_{self.name}.db')
+        size = _HEADER_SIZE + MAX_WORKERS * self._slot_size
+        self._file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+            self._slot = None
+            pid = os.getpid()
+            for slot in range(MAX_WORKERS):
+                base = _HEADER_SIZE + slot * self._slot_size
+                owner = int(struct.unpack_from('d', self._map, base)[0])
+                if not owner or owner == pid or not _alive(owner):
+                    struct.pack_into(self._slot_format, self._map, base, pid, -1.0,
+                                     *([-1.0, 0.0, 0.0] * self.window))
+                    self._slot = slot
+                    break
+            else:
+                logger.warning(f"{self.name} circuit breaker has no free slot; this worker's calls are not counted")
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _read(self, offset: int) -> float:
+        return struct.unpack_from('d', self._state(), offset)[0]
+
+    def _write(self, offset: int, value: float):
+        struct.pack_into('d', self._state(), offset, value)
+
+    @contextmanager
+    def _file_lock(self):
+        # Serialises transitions across workers. flock only excludes other open files, so threads
+        # sharing this process's file also take a thread lock, and the file is opened again after a
+        # fork rather than shared with the parent
+        self._state()
+        with self._transition_lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of the calls made, so retrying cannot multiply the load on a
+    dependency that is already failing.
+
+    Over the last `window` seconds, a retry is allowed while retries stay
+    below ratio times the calls recorded plus min_per_second times the window
+    (so quiet periods can still retry). Counted per worker: each worker's
+    retries are bounded by its own traffic.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, window: int = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = max(1, int(window))
+        self._buckets = [[-1, 0, 0] for _ in range(self.window)]  # [second, calls, retries]
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self._bucket()[1] += 1
+
+    def try_retry(self) -> bool:
+        """Take a retry from the budget; False when it is spent"""
+        with self._lock:
+            calls, retries = self._totals()
+            if retries >= calls * self.ratio + self.min_per_second * self.window:
+                return False
+            self._bucket()[2] += 1
+            return True
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            calls, retries = self._totals()
+        return {'window_calls': calls, 'window_retries': retries}
+
+    def _bucket(self):
+        second = int(time.monotonic())
+        bucket = self._buckets[second % self.window]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0]
+        return bucket
+
+    def _totals(self):
+        oldest = int(time.monotonic()) - self.window
+        calls = retries = 0
+        for second, called, retried in self._buckets:
+            if second > oldest:
+                calls += called
+                retries += retried
+        return calls, retries
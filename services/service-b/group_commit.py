@@ -0,0 +1,136 @@
+"""
+Group-commit write coalescer
+Collects concurrent single-row inserts for a short window and writes them in one transaction
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = 'INSERT INTO app_data (data) VALUES %s RETURNING id, created_at'
+
+
+class _PendingInsert:
+    """A single caller waiting for its row to be committed"""
+    __slots__ = ('value', 'done', 'result', 'error')
+
+    def __init__(self, value: str):
+        self.value = value
+        self.done = threading.Event()
+        self.result: Optional[Tuple[int, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitWriter:
+    """
+    Coalesces concurrent inserts into app_data.
+
+    Callers block in insert() until the batch holding their row is committed, so
+    each still gets its own id and created_at synchronously. A batch is flushed
+    when max_rows are queued or window_seconds after its first row arrived,
+    whichever comes first. If the flush fails, every caller in that batch gets
+    the exception.
+
+    A caller that times out while its row is still queued takes it back out,
+    so the row is never written and a retry cannot duplicate it. Once the
+    batch holding it is being flushed it can't be recalled: the row may
+    still commit after the caller has given up, as with any insert whose
+    client disconnects mid-commit. Clients that retry writes should send an
+    Idempotency-Key, which bypasses group commit.
+    """
+
+    def __init__(self, connection_factory: Callable, window_seconds: float = 0.002,
+                 max_rows: int = 100, timeout: float = 30.0):
+        self.connection_factory = connection_factory
+        self.window_seconds = window_seconds
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._pending: List[_PendingInsert] = []
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.batches_total = 0
+        self.rows_total = 0
+
+    def insert(self, value: str, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """Queue a row and wait for its (id, created_at), for at most timeout seconds if that is shorter"""
+        wait = self.timeout if timeout is None else min(timeout, self.timeout)
+        entry = _PendingInsert(value)
+        with self._cond:
+            self._ensure_flusher()
+            self._pending.append(entry)
+            self._cond.notify()
+
+        if not entry.done.wait(wait):
+            with self._cond:
+                queued = entry in self._pending
+                if queued:
+                    self._pending.remove(entry)
+            if queued:
+                raise TimeoutError(f"Group commit did not start within {wait:.3f}s; the row was not written")
+            # Already taken by the flusher, which may still commit it
+            if not entry.done.is_set():
+                raise TimeoutError(f"Group commit did not complete within {wait:.3f}s; the row may still be committed")
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def stats(self) -> dict:
+        """Return batch counters for tuning window and batch size"""
+        return {
+            'batches_total': self.batches_total,
+            'rows_total': self.rows_total,
+            'avg_batch_size': round(self.rows_total / self.batches_total, 2) if self.batches_total else 0,
+        }
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so start one per worker process on first use
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = []
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window_seconds
+                while len(self._pending) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_rows]
+                self._pending = self._pending[self.max_rows:]
+            self._flush(batch)
+
+    def _flush(self, batch: List[_PendingInsert]):
+        from psycopg2.extras import execute_values
+        try:
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                rows = execute_values(
+                    cursor, INSERT_SQL, [(entry.value,) for entry in batch],
+                    page_size=len(batch), fetch=True
+                )
+                conn.commit()
+                cursor.close()
+            for entry, row in zip(batch, rows):
+                entry.result = (row[0], row[1])
+            self.batches_total += 1
+            self.rows_total += len(batch)
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} rows failed: {e}")
+            for entry in batch:
+                entry.error = e
+        finally:
+            for entry in batch:
+                entry.done.set()
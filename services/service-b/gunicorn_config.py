@@ -5,6 +5,13 @@ Gunicorn configuration for production deployment
 import multiprocessing
 import os
 
+# Workers write metrics to per-process files here; /metrics aggregates them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/service-b-metrics')
+# Workers register here to split the pod's DB connection budget (DB_CONN_BUDGET_POD)
+os.environ.setdefault('DB_CONN_BUDGET_DIR', '/tmp/service-b-conn-budget')
+# Circuit breaker state, shared so that every worker fails fast once one has seen a dependency go down
+os.environ.setdefault('CIRCUIT_BREAKER_DIR', '/tmp/service-b-breakers')
+
 # Server socket
 bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
 backlog = 2048
@@ -17,11 +24,17 @@ timeout = 30
 keepalive = 2
 
 # Logging
-accesslog = '-'
+# The app writes its own sampled JSON access log off the request thread; set
+# GUNICORN_ACCESS_LOG=- to also get gunicorn's unsampled one
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
 errorlog = '-'
 loglevel = os.getenv('LOG_LEVEL', 'info')
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
 
+# Import the app once in the master so workers share its modules and heap copy-on-write.
+# Per-process resources (DB pool, S3 client, background threads) are created in post_fork.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
 # Process naming
 proc_name = 'service-b'
 
@@ -40,6 +53,13 @@ tmp_upload_dir = None
 def on_starting(server):
     """Called just before the master process is initialized."""
     server.log.info("Starting Service B...")
+    from metrics import reset_directory
+    reset_directory()
+    import conn_budget
+    conn_budget.reset_directory()
+    conn_budget.set_expected_workers(server.num_workers)
+    import circuit_breaker
+    circuit_breaker.reset_directory()
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -48,6 +68,37 @@ def on_reload(server):
 def when_ready(server):
     """Called just after the server is started."""
     server.log.info("Service B is ready. Spawning workers")
+    if preload_app:
+        import gc
+        import app
+        app.warm_up()
+        # Exclude everything allocated so far from garbage collection, so collections in the
+        # workers don't write to (and un-share) the master's pages
+        gc.freeze()
+
+def post_fork(server, worker):
+    """Called just after a worker has been forked."""
+    import app
+    app.init_worker()
+    # Without an X-Request-Start header from a trusted proxy, admission control estimates queueing from the backlog
+    app.admission.attach(worker.sockets, server.num_workers)
+
+def worker_exit(server, worker):
+    """Called in the worker just before it exits."""
+    import app
+    app.shutdown_worker()
+
+def child_exit(server, worker):
+    """Called in the master after a worker has exited."""
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+    from conn_budget import mark_worker_dead
+    mark_worker_dead(worker.pid)
+
+def nworkers_changed(server, new_value, old_value):
+    """Called in the master when the worker count changes (TTIN/TTOU)."""
+    from conn_budget import set_expected_workers
+    set_expected_workers(new_value)
 
 def on_exit(server):
     """Called just before exiting."""
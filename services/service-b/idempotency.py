@@ -0,0 +1,211 @@
+"""
+Idempotency keys for write endpoints
+Replays the stored response of a retried write; an in-memory Bloom filter keeps first attempts off the key table
+"""
+
+import os
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+KEY_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    status SMALLINT NOT NULL,
+    response TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at ON idempotency_keys (expires_at)
+"""
+
+# Takes the key unless a live entry holds it; an expired entry is overwritten in place
+CLAIM_SQL = """
+INSERT INTO idempotency_keys (key, request_hash, status, response, expires_at)
+VALUES (%s, %s, %s, %s, NOW() + %s * INTERVAL '1 second')
+ON CONFLICT (key) DO UPDATE SET
+    request_hash = EXCLUDED.request_hash, status = EXCLUDED.status,
+    response = EXCLUDED.response, expires_at = EXCLUDED.expires_at
+WHERE idempotency_keys.expires_at <= NOW()
+RETURNING key
+"""
+
+LOOKUP_SQL = 'SELECT request_hash, status, response FROM idempotency_keys WHERE key = %s AND expires_at > NOW()'
+
+PURGE_SQL = 'DELETE FROM idempotency_keys WHERE expires_at <= NOW()'
+
+StoredResponse = Tuple[int, Dict[str, Any]]
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+    pass
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `error_rate` false positives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class IdempotencyStore:
+    """
+    Postgres-backed idempotency key table with a per-process Bloom prefilter.
+
+    A keyed write claims its key with claim() inside the same transaction as
+    the write itself. If another request (on any worker or pod) already holds
+    the key, claim() returns that request's stored response and the caller
+    rolls back, so a retry never inserts twice, even when the first attempt
+    is still in flight (the claim waits on its row lock).
+
+    Before that, lookup() answers replays without touching the write path,
+    but only for keys this process has seen: the Bloom filter has no false
+    negatives for them, so a first attempt (the common case) costs a few
+    hash computations and no query. Keys seen elsewhere are still caught by
+    claim(). The filter keeps two generations rotated every ttl seconds, so
+    it remembers keys for at least ttl without growing. A background thread
+    creates the table if needed and deletes expired keys every purge_interval.
+    """
+
+    def __init__(self, connection_factory: Callable, ttl: float = 86400.0, bloom_capacity: int = 100000,
+                 bloom_error_rate: float = 0.01, purge_interval: float = 300.0,
+                 on_event: Optional[Callable[[str], None]] = None):
+        self.connection_factory = connection_factory
+        self.ttl = ttl
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.purge_interval = purge_interval
+        # Called with 'new', 'replayed', 'prefilter_miss', 'prefilter_false_positive' or 'conflict'
+        self.on_event = on_event or (lambda event: None)
+        self._lock = threading.Lock()
+        self._current = BloomFilter(bloom_capacity, bloom_error_rate)
+        self._previous = BloomFilter(bloom_capacity, bloom_error_rate)
+        self._rotated = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @staticmethod
+    def fingerprint(method: str, path: str, body: bytes) -> str:
+        """Hash identifying the request a key was first used with"""
+        digest = hashlib.sha256(f'{method} {path}\n'.encode('utf-8'))
+        digest.update(body)
+        return digest.hexdigest()
+
+    def might_contain(self, key: str) -> bool:
+        """False if this process has certainly not stored key in the last ttl seconds"""
+        self._maybe_rotate()
+        return key in self._current or key in self._previous
+
+    def remember(self, key: str):
+        """Add a committed key to the prefilter"""
+        self._maybe_rotate()
+        with self._lock:
+            self._current.add(key)
+
+    def lookup(self, key: str, request_hash: str) -> Optional[StoredResponse]:
+        """Stored response for a replayed key, or None if the request should go ahead"""
+        if not self.might_contain(key):
+            self.on_event('prefilter_miss')
+            return None
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(LOOKUP_SQL, (key,))
+            row = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+        if row is None:
+            self.on_event('prefilter_false_positive')
+            return None
+        return self._replay(key, request_hash, row)
+
+    def claim(self, cursor, key: str, request_hash: str, status: int,
+              response: Dict[str, Any]) -> Optional[StoredResponse]:
+        """
+        Record `response` under key in the caller's transaction. Returns None if the
+        key was claimed (commit, then remember()), or the response stored by the
+        request that already holds it (roll back and return that instead).
+        """
+        cursor.execute(CLAIM_SQL, (key, request_hash, status, json.dumps(response), self.ttl))
+        if cursor.fetchone() is not None:
+            self.on_event('new')
+            return None
+        cursor.execute(LOOKUP_SQL, (key,))
+        row = cursor.fetchone()
+        if row is None:
+            # Expired between the two statements; treat like a held key with nothing to replay
+            raise IdempotencyConflict(f"Idempotency key {key!r} is being reused")
+        return self._replay(key, request_hash, row)
+
+    def ensure_started(self):
+        """Start the table maintenance thread for this process if it is not running"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='idempotency-purge', daemon=True)
+                self._thread.start()
+
+    def _replay(self, key: str, request_hash: str, row) -> StoredResponse:
+        stored_hash, status, response = row
+        if stored_hash != request_hash:
+            self.on_event('conflict')
+            raise IdempotencyConflict(f"Idempotency key {key!r} was used for a different request")
+        self.on_event('replayed')
+        # Seen by another worker or pod; answer the next retry here from the prefilter path
+        self.remember(key)
+        return status, json.loads(response)
+
+    def _maybe_rotate(self):
+        if time.monotonic() - self._rotated < self.ttl:
+            return
+        with self._lock:
+            if time.monotonic() - self._rotated >= self.ttl:
+                self._previous = self._current
+                self._current = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+                self._rotated = time.monotonic()
+
+    def _run(self):
+        created = False
+        while True:
+            try:
+                with self.connection_factory() as conn:
+                    cursor = conn.cursor()
+                    if not created:
+                        cursor.execute(KEY_TABLE_DDL)
+                    cursor.execute(PURGE_SQL)
+                    purged = cursor.rowcount
+                    conn.commit()
+                    cursor.close()
+                # Only once committed: a failed purge or commit rolls the DDL back with it
+                created = True
+                if purged:
+                    logger.info(f"Purged {purged} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Idempotency key maintenance failed: {e}")
+            # Keyed writes fail until the table exists, so retry creating it sooner
+            time.sleep(self.purge_interval if created else min(self.purge_interval, 5.0))
@@ -0,0 +1,317 @@
+"""
+Asynchronous job queue
+Records accepted work in Postgres, drains it in batches on a small thread pool and answers status requests on any pod
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Under an advisory lock: workers starting together on a fresh database would otherwise race to create it
+JOB_TABLE_DDL = """
+SELECT pg_advisory_xact_lock(hashtext('process_jobs'));
+CREATE TABLE IF NOT EXISTS process_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    request_id TEXT,
+    submitted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS process_jobs_queued ON process_jobs (submitted_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS process_jobs_finished_at ON process_jobs (finished_at) WHERE finished_at IS NOT NULL
+"""
+
+SUBMIT_SQL = "INSERT INTO process_jobs (job_id, status, payload, request_id) VALUES (%s, 'queued', %s, %s)"
+
+STATUS_SQL = """
+SELECT status, request_id, result, error, extract(epoch FROM submitted_at), extract(epoch FROM finished_at)
+FROM process_jobs WHERE job_id = %s
+"""
+
+# Jobs this process was handed; a job another worker has locked, or already finished, is skipped
+CLAIM_SQL = """
+SELECT job_id, payload, extract(epoch FROM submitted_at) FROM process_jobs
+WHERE job_id = ANY(%s) AND status = 'queued'
+FOR UPDATE SKIP LOCKED
+"""
+
+# Jobs nobody has run: their worker died, shut down with them queued or failed to run them
+CLAIM_STALE_SQL = """
+SELECT job_id, payload, extract(epoch FROM submitted_at) FROM process_jobs
+WHERE status = 'queued' AND submitted_at < NOW() - %s * INTERVAL '1 second'
+ORDER BY submitted_at LIMIT %s
+FOR UPDATE SKIP LOCKED
+"""
+
+DONE_SQL = """
+UPDATE process_jobs AS job SET status = 'done', result = v.result, payload = NULL, finished_at = NOW()
+FROM (VALUES %s) AS v (job_id, result) WHERE job.job_id = v.job_id
+"""
+
+# A failed job goes back to the queue for the stale sweep until it has used up its attempts
+FAIL_SQL = """
+UPDATE process_jobs SET attempts = attempts + 1, error = %(error)s,
+    status = CASE WHEN %(final)s OR attempts + 1 >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+    finished_at = CASE WHEN %(final)s OR attempts + 1 >= %(max_attempts)s THEN NOW() END
+WHERE job_id = ANY(%(job_ids)s) AND status = 'queued'
+RETURNING status, extract(epoch FROM submitted_at)
+"""
+
+PURGE_SQL = "DELETE FROM process_jobs WHERE finished_at < NOW() - %s * INTERVAL '1 second'"
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity; the caller should retry later"""
+    pass
+
+
+class JobFailed(Exception):
+    """Raised by a batch handler; the message is shown to clients polling the job"""
+    pass
+
+
+class JobQueue:
+    """
+    Runs `handler` on batches of submitted payloads, with job state in Postgres.
+
+    submit() records the job in the process_jobs table before returning its
+    id, so an accepted job survives the worker or pod that accepted it, and
+    status() answers for a job submitted anywhere. It raises QueueFull once
+    max_size jobs are waiting in this process. Each of the `workers` threads
+    takes up to batch_size of this process's jobs at a time, locks their rows
+    and passes their payloads to handler(cursor, payloads), which returns one
+    result per payload (e.g. after a single multi-row insert on cursor). The
+    results are stored in the handler's transaction, so a job is done exactly
+    when its rows are committed.
+
+    If the handler raises JobFailed, every job in the batch fails; any other
+    error puts the batch back in the queue until a job has been tried
+    max_attempts times. Every poll_interval one thread per process sweeps up
+    jobs still queued stale_after seconds after submission (their worker
+    died, was shut down or failed to run them) and deletes finished jobs
+    older than result_ttl. The table is created by ensure_table(), meant for
+    worker startup, and otherwise on first use.
+    on_finish(status, seconds) is called for every finished job, with the
+    time from submission to completion.
+    """
+
+    def __init__(self, connection_factory: Callable, handler: Callable[[Any, List[Any]], List[Any]],
+                 workers: int = 2, max_size: int = 1000, batch_size: int = 50, result_ttl: float = 3600.0,
+                 stale_after: float = 30.0, max_attempts: int = 3, poll_interval: float = 5.0,
+                 on_finish: Optional[Callable[[str, float], None]] = None):
+        self.connection_factory = connection_factory
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.on_finish = on_finish or (lambda status, seconds: None)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stopping = False
+        self._table_ready = False
+        self._last_sweep = 0.0
+        self._last_prune = 0.0
+
+    def submit(self, payload: Any, request_id: Optional[str] = None) -> str:
+        """Record a payload as a queued job and return its id"""
+        self.ensure_started()
+        if self._stopping:
+            raise QueueFull("Worker is shutting down")
+        if self._queue.full():
+            raise QueueFull(f"Job queue is full ({self.max_size} jobs waiting)")
+        self.ensure_table()
+        job_id = uuid.uuid4().hex
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SUBMIT_SQL, (job_id, json.dumps(payload), request_id))
+            conn.commit()
+            cursor.close()
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            pass  # recorded all the same; the stale sweep runs it
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Current state of a job submitted to any worker or pod, or None if unknown or expired"""
+        # Ids are uuid4 hex; anything else can't name a job
+        if len(job_id) != 32 or any(c not in '0123456789abcdef' for c in job_id):
+            return None
+        self.ensure_table()
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(STATUS_SQL, (job_id,))
+            row = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+        if row is None:
+            return None
+        status, request_id, result, error, submitted_at, finished_at = row
+        state = {'job_id': job_id, 'status': status, 'submitted_at': float(submitted_at), 'request_id': request_id}
+        if finished_at is not None:
+            state['finished_at'] = float(finished_at)
+        if result is not None:
+            state['result'] = json.loads(result)
+        if status == 'failed':
+            state['error'] = error
+        return state
+
+    def ensure_table(self):
+        """Create the process_jobs table unless this process already has"""
+        if self._table_ready:
+            return
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(JOB_TABLE_DDL)
+            conn.commit()
+            cursor.close()
+        self._table_ready = True
+
+    def depth(self) -> int:
+        """Jobs waiting in this process's queue"""
+        return self._queue.qsize()
+
+    def ensure_started(self):
+        """Start the worker threads for this process if they are not running"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads and queued jobs do not survive fork
+            self._queue = queue.Queue(maxsize=self.max_size)
+            self._stopping = False
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Stop accepting jobs and wait up to `timeout` seconds for queued ones to finish
+        (call on worker shutdown). Jobs still queued afterwards stay queued in the table
+        for the stale sweep of another worker or pod. Returns True if everything finished.
+        """
+        self._stopping = True
+        if self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        left = self._queue.unfinished_tasks
+        if left:
+            logger.warning(f"Leaving {left} queued jobs for another worker on shutdown")
+        return not left
+
+    def _take_batch(self) -> List[str]:
+        try:
+            batch = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, job_ids: Optional[List[str]] = None) -> int:
+        """Run the given jobs, or stale ones when job_ids is None; returns how many were claimed"""
+        from psycopg2.extras import execute_values
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            if job_ids is None:
+                cursor.execute(CLAIM_STALE_SQL, (self.stale_after, self.batch_size))
+            else:
+                cursor.execute(CLAIM_SQL, (job_ids,))
+            claimed = cursor.fetchall()
+            if not claimed:
+                conn.commit()
+                cursor.close()
+                return 0
+            try:
+                results = self.handler(cursor, [json.loads(payload) for _, payload, _ in claimed])
+                execute_values(cursor, DONE_SQL, [
+                    (job_id, json.dumps(result)) for (job_id, _, _), result in zip(claimed, results)
+                ])
+                conn.commit()
+                finished = [('done', submitted_at) for _, _, submitted_at in claimed]
+            except Exception as e:
+                conn.rollback()
+                final = isinstance(e, JobFailed)
+                if not final:
+                    logger.error(f"Job batch of {len(claimed)} failed: {e}")
+                # On a dead connection this raises too and the jobs stay queued as they were
+                cursor.execute(FAIL_SQL, {
+                    'error': str(e) if final else 'Internal error', 'final': final,
+                    'max_attempts': self.max_attempts, 'job_ids': [job_id for job_id, _, _ in claimed],
+                })
+                finished = [row for row in cursor.fetchall() if row[0] == 'failed']
+                conn.commit()
+            cursor.close()
+        now = time.time()
+        for status, submitted_at in finished:
+            self.on_finish(status, now - float(submitted_at))
+        return len(claimed)
+
+    def _sweep(self):
+        """Run stale jobs and purge expired ones; one thread per process at a time"""
+        if time.monotonic() - self._last_sweep < self.poll_interval or not self._sweep_lock.acquire(False):
+            return
+        try:
+            self._last_sweep = time.monotonic()
+            self.ensure_table()
+            if time.monotonic() - self._last_prune >= 60:
+                with self.connection_factory() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(PURGE_SQL, (self.result_ttl,))
+                    if cursor.rowcount:
+                        logger.info(f"Purged {cursor.rowcount} expired jobs")
+                    conn.commit()
+                    cursor.close()
+                self._last_prune = time.monotonic()
+            recovered = 0
+            while not self._stopping:
+                claimed = self._process()
+                recovered += claimed
+                if claimed < self.batch_size:
+                    break
+            if recovered:
+                logger.warning(f"Ran {recovered} jobs left queued by another worker")
+        finally:
+            self._sweep_lock.release()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                if batch:
+                    self._process(batch)
+                self._sweep()
+            except Exception as e:
+                # The jobs stay queued; the stale sweep picks them up once the database is back
+                logger.error(f"Job worker failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
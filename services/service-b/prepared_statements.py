@@ -0,0 +1,122 @@
+"""
+Per-connection prepared statements
+Prepares hot statements on each connection the first time they run there, so Postgres parses and plans them once per session
+"""
+
+import re
+import hashlib
+import logging
+import threading
+import weakref
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+from psycopg2 import errors, extensions
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r'%%|%s')
+
+
+class PreparedStatements:
+    """
+    Runs psycopg2-style statements (%s placeholders) as server-side prepared statements.
+
+    execute() sends PREPARE the first time a statement runs on a connection
+    and EXECUTE from then on. Which statements each connection has prepared is
+    tracked per connection object, so a reconnect, a pool flush after a
+    failover or a recycled connection simply starts with nothing prepared. If
+    the server has lost a session's statements anyway (DISCARD ALL, or a
+    pooler handing over a different session), the statement is prepared again
+    and retried when it was the first in its transaction; otherwise the error
+    is raised and the next transaction re-prepares. Transaction setup passed
+    to defer() (SET LOCAL statement_timeout, say) is sent in the same round
+    trip as the next statement execute()d on the connection, which so stays
+    first in its transaction, and is sent again with the retry.
+
+    Callers pass a small, fixed set of statement texts: each distinct text is
+    one prepared statement per connection. With enabled=False (PgBouncer in
+    transaction mode, where consecutive transactions may run on different
+    server sessions) execute() is a plain cursor.execute(). on_prepare(reason)
+    is called with 'first_use' or 'invalidated' for every PREPARE.
+    """
+
+    def __init__(self, enabled: bool = True, on_prepare: Optional[Callable[[str], None]] = None):
+        self.enabled = enabled
+        self.on_prepare = on_prepare or (lambda reason: None)
+        self._statements: Dict[str, Tuple[str, str, str]] = {}  # text -> (name, PREPARE, EXECUTE)
+        self._prepared: 'weakref.WeakKeyDictionary[object, Set[str]]' = weakref.WeakKeyDictionary()
+        self._deferred: 'weakref.WeakKeyDictionary[object, Tuple[str, Sequence]]' = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def defer(self, conn, sql: Optional[str] = None, params: Sequence = ()):
+        """
+        Send sql ahead of the next statement execute()d on conn, in the same round trip; None
+        forgets any setup deferred earlier. The caller's first statement on conn must be that
+        execute(), or the setup is sent late or, if the caller never calls it, not at all.
+        """
+        with self._lock:
+            if sql is None:
+                self._deferred.pop(conn, None)
+            else:
+                self._deferred[conn] = (sql, params)
+
+    def execute(self, cursor, sql: str, params: Sequence = ()):
+        """cursor.execute(sql, params), through a statement prepared on cursor's connection"""
+        conn = cursor.connection
+        with self._lock:
+            setup = self._deferred.pop(conn, None)
+        if not self.enabled:
+            self._execute(cursor, sql, params, setup)
+            return
+        name, prepare_sql, execute_sql = self._statement(sql)
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+        first_in_transaction = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        try:
+            if name not in prepared:
+                self._prepare(cursor, name, prepare_sql, prepared, 'first_use', setup)
+                self._execute(cursor, execute_sql, params)
+            else:
+                self._execute(cursor, execute_sql, params, setup)
+        except errors.InvalidSqlStatementName:
+            prepared.clear()
+            if not first_in_transaction:
+                raise
+            logger.warning(f"Prepared statement {name} vanished from the session; preparing it again")
+            conn.rollback()
+            self._prepare(cursor, name, prepare_sql, prepared, 'invalidated', setup)
+            self._execute(cursor, execute_sql, params)
+
+    def _statement(self, sql: str) -> Tuple[str, str, str]:
+        statement = self._statements.get(sql)
+        if statement is None:
+            count = 0
+
+            def number(match):
+                nonlocal count
+                if match.group() == '%%':
+                    return '%'
+                count += 1
+                return f'${count}'
+
+            body = _PLACEHOLDER.sub(number, sql)
+            name = 'ps_' + hashlib.blake2b(sql.encode('utf-8'), digest_size=8).hexdigest()
+            arguments = f" ({', '.join(['%s'] * count)})" if count else ''
+            statement = (name, f'PREPARE {name} AS {body}', f'EXECUTE {name}{arguments}')
+            self._statements[sql] = statement
+        return statement
+
+    def _prepare(self, cursor, name: str, prepare_sql: str, prepared: Set[str], reason: str,
+                 setup: Optional[Tuple[str, Sequence]] = None):
+        # PREPARE is not undone by a rollback, so the statement stays usable whatever happens next
+        self._execute(cursor, prepare_sql, None, setup)
+        prepared.add(name)
+        self.on_prepare(reason)
+
+    @staticmethod
+    def _execute(cursor, sql: str, params: Optional[Sequence], setup: Optional[Tuple[str, Sequence]] = None):
+        if setup is not None:
+            prefix = cursor.mogrify(*setup).decode()
+            # Without params psycopg2 sends sql as it is; with them, % in the prefix must not read as a placeholder
+            sql = f"{prefix if params is None else prefix.replace('%', '%%')}; {sql}"
+        cursor.execute(sql, params)
@@ -0,0 +1,99 @@
+"""
+Startup profiler
+Times module imports and initialisation steps, so a slow cold start can be traced to what caused it
+"""
+
+import os
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+ENABLED_ENV = 'STARTUP_PROFILE'
+
+
+class StartupProfiler:
+    """
+    Where startup time goes.
+
+    phase(name) times an initialisation step; record() stores a duration
+    measured elsewhere. With the import hook installed, every module loaded
+    afterwards is timed and its time charged to its top-level package,
+    excluding the nested imports it triggers (the self column of
+    python -X importtime, summed per package), so the per-package figures add
+    up to the total. Modules loaded through importlib.import_module rather
+    than an import statement count towards the package that loaded them.
+    The hook adds a sys.modules lookup to every import statement, so it is
+    only installed when STARTUP_PROFILE=true; phases are always recorded.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.phases: Dict[str, float] = {}
+        self._import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install_import_hook(self):
+        """Time every module imported from now on"""
+        if self._import is None:
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def remove_import_hook(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as startup phase `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self, top: int = 10) -> dict:
+        """Phase durations and the `top` slowest packages to import, in milliseconds"""
+        with self._lock:
+            phases = dict(self.phases)
+            imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        report = {'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in phases.items()}}
+        if imports:
+            report['imports_total_ms'] = round(sum(seconds for _, seconds in imports) * 1000, 1)
+            report['imports_ms'] = {name: round(seconds * 1000, 1) for name, seconds in imports[:top]}
+        return report
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Relative imports stay within the importing package, whose time already includes them
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [0.0]  # time spent in nested imports
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            package = name.partition('.')[0]
+            with self._lock:
+                self.imports[package] = self.imports.get(package, 0.0) + elapsed - frame[0]
+
+
+startup_profiler = StartupProfiler()
+if os.getenv(ENABLED_ENV, 'false').lower() == 'true':
+    startup_profiler.install_import_hook()
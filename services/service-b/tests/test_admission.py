@@ -0,0 +1,135 @@
+import pytest
+
+import admission
+from admission import PROBE, READ, WRITE, AdmissionController, parse_request_start
+
+
+class FakeClock:
+    """Stands in for the time module: wall and monotonic clocks that only move when told to"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission, 'time', clock)
+    return clock
+
+
+def ok_app(environ, start_response):
+    start_response('200 OK', [])
+    return [b'ok']
+
+
+def environ(clock, queued: float, method='GET', path='/api/data', remote='10.0.0.5'):
+    return {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'REMOTE_ADDR': remote,
+        'HTTP_X_REQUEST_START': f't={(clock.now - queued) * 1000:.0f}',
+    }
+
+
+def call(controller, env):
+    statuses = []
+    body = controller(env, lambda status, headers: statuses.append((status, dict(headers))))
+    list(body)
+    getattr(body, 'close', lambda: None)()
+    return statuses[0]
+
+
+def make_controller(**kwargs):
+    options = dict(target=0.05, interval=0.5, exempt_paths=('/live',), trusted_proxies=('10.0.0.0/8',))
+    options.update(kwargs)
+    return AdmissionController(ok_app, **options)
+
+
+@pytest.mark.parametrize('value', ['t=1700000000', 't=1700000000000', '1700000000000000', 't=1700000000.5'])
+def test_parse_request_start_units(value):
+    assert parse_request_start(value, 1_700_000_001.0) == pytest.approx(1_700_000_000.0, abs=0.5)
+
+
+@pytest.mark.parametrize('value', ['t=', 'soon', 't=-5', 't=inf', 't=nan'])
+def test_parse_request_start_rejects_garbage(value):
+    assert parse_request_start(value, 1_700_000_001.0) is None
+
+
+def test_header_only_trusted_from_proxies(clock):
+    controller = make_controller()
+    assert controller.queue_delay(environ(clock, 2.0)) == pytest.approx(2.0)
+    assert controller.queue_delay(environ(clock, 2.0, remote='::ffff:10.1.2.3')) == pytest.approx(2.0)
+    # Nobody else's header counts; with no listeners attached there is no estimate either
+    assert controller.queue_delay(environ(clock, 2.0, remote='192.168.1.1')) is None
+    assert make_controller(trusted_proxies=()).queue_delay(environ(clock, 2.0)) is None
+
+
+def test_priorities(clock):
+    controller = make_controller()
+    assert controller.priority(environ(clock, 0, path='/live')) == PROBE
+    assert controller.priority(environ(clock, 0)) == READ
+    assert controller.priority(environ(clock, 0, method='POST')) == WRITE
+
+
+def test_request_queued_past_interval_is_shed(clock):
+    decisions = []
+    controller = make_controller(on_decision=lambda *decision: decisions.append(decision))
+    status, headers = call(controller, environ(clock, 0.6, method='POST'))
+    assert status.startswith('503')
+    assert headers['Retry-After'] == '1'
+    assert decisions == [(WRITE, False, pytest.approx(0.6))]
+
+
+def test_standing_queue_sheds_reads_but_not_writes(clock):
+    overloads = []
+    controller = make_controller(on_overload=overloads.append)
+    # A whole interval in which even the quickest request queued over the target
+    assert call(controller, environ(clock, 0.1))[0].startswith('200')
+    clock.advance(0.3)
+    assert call(controller, environ(clock, 0.2))[0].startswith('200')
+    clock.advance(0.3)
+    assert call(controller, environ(clock, 0.1))[0].startswith('503')
+    assert overloads == [True]
+    assert call(controller, environ(clock, 0.1, method='POST'))[0].startswith('200')
+    assert call(controller, environ(clock, 0.0, path='/live'))[0].startswith('200')
+
+
+def test_burst_that_drains_is_not_overload(clock):
+    controller = make_controller()
+    call(controller, environ(clock, 0.2))
+    clock.advance(0.3)
+    call(controller, environ(clock, 0.01))
+    clock.advance(0.3)
+    assert call(controller, environ(clock, 0.1))[0].startswith('200')
+    assert not controller.overloaded
+
+
+def test_stale_interval_is_forgotten(clock):
+    controller = make_controller()
+    call(controller, environ(clock, 0.2))
+    clock.advance(5.0)
+    assert call(controller, environ(clock, 0.1))[0].startswith('200')
+    assert not controller.overloaded
+
+
+def test_disabled_admits_everything(clock):
+    controller = make_controller(enabled=False)
+    assert call(controller, environ(clock, 10.0))[0].startswith('200')
+
+
+def test_in_flight_counts_until_response_closed(clock):
+    counts = []
+    controller = make_controller(on_in_flight=counts.append)
+    call(controller, environ(clock, 0.0))
+    assert counts == [1, 0]
+    assert controller.in_flight == 0
@@ -0,0 +1,111 @@
+import os
+import time
+import itertools
+
+import pytest
+
+from circuit_breaker import (
+    BREAKER_DIR_ENV, CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay,
+)
+
+_names = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def breaker_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(BREAKER_DIR_ENV, str(tmp_path))
+    return tmp_path
+
+
+def make_breaker(**kwargs):
+    options = dict(failure_ratio=0.5, min_calls=4, window=10, open_seconds=0.05, max_open_seconds=1.0)
+    options.update(kwargs)
+    return CircuitBreaker(f'test{next(_names)}', **options)
+
+
+def test_opens_once_enough_calls_fail():
+    transitions = []
+    breaker = make_breaker(on_transition=transitions.append)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 0
+    assert transitions == [OPEN]
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_successes_keep_it_closed():
+    breaker = make_breaker()
+    for _ in range(5):
+        breaker.record_success()
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state() == CLOSED
+    assert breaker.status()['window_calls'] == 9
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    transitions = []
+    breaker = make_breaker(min_calls=1, on_transition=transitions.append)
+    breaker.record_failure()
+    time.sleep(0.07)
+    assert breaker.state() == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state() == CLOSED
+    assert breaker.allow()
+    assert transitions == [OPEN, CLOSED]
+    # Outcomes from before it opened no longer count
+    assert breaker.status()['window_calls'] == 0
+
+
+def test_failed_probe_reopens_for_longer():
+    breaker = make_breaker(min_calls=1)
+    breaker.record_failure()
+    time.sleep(0.07)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == OPEN
+    assert breaker.status()['consecutive_trips'] == 2
+    assert breaker.retry_after() > 0.06
+
+
+def test_outcomes_are_shared_between_processes():
+    breaker = make_breaker()
+    breaker.record_failure()
+    pid = os.fork()
+    if pid == 0:
+        # A second worker: its own slot in the same file
+        try:
+            child = CircuitBreaker(breaker.name, failure_ratio=0.5, min_calls=4, window=10)
+            for _ in range(2):
+                child.record_failure()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert breaker.status()['window_failures'] == 3
+    breaker.record_failure()
+    assert breaker.state() == OPEN
+
+
+def test_retry_budget_is_a_fraction_of_calls():
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0, window=10)
+    for _ in range(10):
+        budget.record_call()
+    assert [budget.try_retry() for _ in range(6)] == [True] * 5 + [False]
+    assert budget.status() == {'window_calls': 10, 'window_retries': 5}
+
+
+def test_retry_budget_allows_a_trickle_when_quiet():
+    budget = RetryBudget(ratio=0.1, min_per_second=0.2, window=10)
+    assert [budget.try_retry() for _ in range(3)] == [True, True, False]
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 0.05, 1.0) <= min(1.0, 0.05 * 2 ** attempt)
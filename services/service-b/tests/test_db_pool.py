@@ -0,0 +1,187 @@
+import time
+import threading
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.info = FakeInfo()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeServer:
+    """Opens FakeConnections; set fail to refuse them"""
+
+    def __init__(self):
+        self.opened = []
+        self.fail = False
+
+    def connect(self, **kwargs):
+        if self.fail:
+            raise psycopg2.OperationalError('could not connect to server')
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', server.connect)
+    return server
+
+
+def make_pool(**kwargs):
+    options = dict(minconn=0, maxconn=2, acquire_timeout=0.05, validate_after=60.0)
+    options.update(kwargs)
+    return ConnectionPool(**options)
+
+
+def test_prefills_minconn(server):
+    pool = make_pool(minconn=2)
+    assert len(server.opened) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_prefill_can_be_retried(server):
+    pool = make_pool(minconn=2, prefill=False)
+    assert server.opened == []
+    server.fail = True
+    with pytest.raises(psycopg2.OperationalError):
+        pool.prefill()
+    server.fail = False
+    pool.prefill()
+    pool.prefill()
+    assert len(server.opened) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_returned_connection_is_reused(server):
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(server.opened) == 1
+
+
+def test_checkout_times_out_when_exhausted(server):
+    pool = make_pool(maxconn=1)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+
+
+def test_waiting_checkout_gets_returned_connection(server):
+    pool = make_pool(maxconn=1, acquire_timeout=2.0)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+
+
+def test_open_transaction_is_rolled_back_on_return(server):
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.cursor().execute('SELECT 1')
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert not conn.closed
+
+
+def test_connection_failing_rollback_is_closed_on_return(server):
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.cursor().execute('SELECT 1')
+    conn.broken = True
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()['in_use'] == 0
+
+
+def test_dead_idle_connection_is_replaced_on_checkout(server):
+    pool = make_pool(validate_after=0.0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+
+
+def test_expired_connection_is_closed_on_return(server):
+    pool = make_pool(max_lifetime=0.0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_flush_retires_idle_and_checked_out_connections(server):
+    flushed = []
+    pool = make_pool(on_flush=flushed.append)
+    idle, busy = pool.getconn(), pool.getconn()
+    pool.putconn(idle)
+    pool.flush('failover')
+    assert idle.closed and not busy.closed
+    pool.putconn(busy)
+    assert busy.closed
+    assert pool.getconn() not in (idle, busy)
+    assert flushed == ['failover']
+
+
+def test_resize_closes_surplus_idle_connections(server):
+    pool = make_pool(maxconn=3)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+    pool.resize(1)
+    assert sum(1 for conn in conns if conn.closed) == 2
+    assert pool.stats()['idle'] == 1
+
+
+def test_closeall_refuses_checkouts(server):
+    pool = make_pool(minconn=1)
+    pool.closeall()
+    assert server.opened[0].closed
+    with pytest.raises(PoolError):
+        pool.getconn()
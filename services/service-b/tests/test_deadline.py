@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from deadline import DEADLINE_HEADER, TIMEOUT_HEADER, parse_deadline, remaining
+
+
+def test_default_timeout_counts_from_received():
+    received = time.monotonic() - 2.0
+    assert parse_deadline({}, 10.0, 30.0, received) == pytest.approx(received + 10.0)
+
+
+def test_timeout_header_counts_from_received():
+    received = time.monotonic() - 2.0
+    deadline = parse_deadline({TIMEOUT_HEADER: '5'}, 10.0, 30.0, received)
+    assert remaining(deadline) == pytest.approx(3.0, abs=0.05)
+
+
+def test_absolute_deadline_is_not_shortened_by_queueing():
+    received = time.monotonic() - 2.0
+    deadline = parse_deadline({DEADLINE_HEADER: str(time.time() + 5.0)}, 10.0, 30.0, received)
+    assert remaining(deadline) == pytest.approx(5.0, abs=0.05)
+
+
+def test_absolute_deadline_wins_over_timeout():
+    deadline = parse_deadline({DEADLINE_HEADER: str(time.time() + 5.0), TIMEOUT_HEADER: '1'}, 10.0, 30.0)
+    assert remaining(deadline) == pytest.approx(5.0, abs=0.05)
+
+
+def test_budgets_are_capped_from_received():
+    received = time.monotonic() - 2.0
+    for headers in ({TIMEOUT_HEADER: '100'}, {DEADLINE_HEADER: str(time.time() + 100.0)}):
+        assert parse_deadline(headers, 10.0, 30.0, received) == pytest.approx(received + 30.0, abs=0.05)
+
+
+def test_past_deadline_has_no_time_left():
+    deadline = parse_deadline({DEADLINE_HEADER: str(time.time() - 1.0)}, 10.0, 30.0)
+    assert remaining(deadline) < 0
+
+
+@pytest.mark.parametrize('headers', [
+    {TIMEOUT_HEADER: 'soon'},
+    {TIMEOUT_HEADER: 'nan'},
+    {DEADLINE_HEADER: 'tomorrow'},
+    {DEADLINE_HEADER: 'nan'},
+])
+def test_malformed_headers_raise(headers):
+    with pytest.raises(ValueError):
+        parse_deadline(headers, 10.0, 30.0)
@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+import psycopg2.extras
+import pytest
+
+from group_commit import GroupCommitWriter
+
+
+class FakeDatabase:
+    """Records every batch handed to execute_values; once `slow` is set, connecting waits for `release`"""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.slow = threading.Event()
+        self.connecting = threading.Event()
+        self.release = threading.Event()
+
+    @contextmanager
+    def connect(self):
+        if self.slow.is_set():
+            self.connecting.set()
+            self.release.wait(2)
+        yield self
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute_values(self, cursor, sql, values, page_size=None, fetch=False):
+        if self.fail:
+            raise psycopg2.OperationalError('connection lost')
+        start = sum(len(batch) for batch in self.batches)
+        self.batches.append([value for value, in values])
+        return [(start + i + 1, None) for i in range(len(values))]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(psycopg2.extras, 'execute_values', database.execute_values)
+    return database
+
+
+def test_concurrent_inserts_share_a_batch(database):
+    writer = GroupCommitWriter(database.connect, window_seconds=0.05)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.update({i: writer.insert(f'row{i}')})) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(database.batches) == 1
+    assert sorted(database.batches[0]) == [f'row{i}' for i in range(5)]
+    assert sorted(row_id for row_id, _ in results.values()) == [1, 2, 3, 4, 5]
+
+
+def test_batches_are_capped_at_max_rows(database):
+    writer = GroupCommitWriter(database.connect, window_seconds=0.05, max_rows=2)
+    threads = [threading.Thread(target=writer.insert, args=(f'row{i}',)) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(len(batch) for batch in database.batches) <= 2
+    assert writer.stats()['rows_total'] == 5
+
+
+def test_failed_flush_reaches_every_caller(database):
+    database.fail = True
+    writer = GroupCommitWriter(database.connect, window_seconds=0.001)
+    with pytest.raises(psycopg2.OperationalError):
+        writer.insert('row')
+
+
+def test_row_still_queued_at_timeout_is_never_written(database):
+    writer = GroupCommitWriter(database.connect, window_seconds=0.001)
+    writer.insert('first')
+    database.slow.set()
+    # Holds the flusher until released, so the next row stays queued behind it
+    blocked = threading.Thread(target=writer.insert, args=('blocked',))
+    blocked.start()
+    assert database.connecting.wait(2)
+    with pytest.raises(TimeoutError, match='not written'):
+        writer.insert('timed out', timeout=0.05)
+    database.release.set()
+    blocked.join()
+    assert [row for batch in database.batches for row in batch] == ['first', 'blocked']
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from idempotency import BloomFilter, IdempotencyConflict, IdempotencyStore
+
+
+class FakeCursor:
+    """Answers CLAIM_SQL and LOOKUP_SQL from canned rows"""
+
+    def __init__(self, claimed, stored=None):
+        self.rows = [('key',) if claimed else None, stored]
+        self.statements = 0
+
+    def execute(self, sql, params=None):
+        self.statements += 1
+
+    def fetchone(self):
+        return self.rows[self.statements - 1]
+
+
+def no_database():
+    raise AssertionError('the database should not be queried')
+
+
+def make_store(**kwargs):
+    events = []
+    store = IdempotencyStore(no_database, bloom_capacity=1000, on_event=events.append, **kwargs)
+    return store, events
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f'key-{i}' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f'key-{i}')
+    false_positives = sum(f'other-{i}' in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_unseen_key_is_not_looked_up():
+    store, events = make_store()
+    assert store.lookup('fresh', 'hash') is None
+    assert events == ['prefilter_miss']
+
+
+def test_remembered_key_survives_one_rotation():
+    store, _ = make_store(ttl=10.0)
+    store.remember('seen')
+    store._rotated -= 10.0
+    assert store.might_contain('seen')
+    store._rotated -= 10.0
+    assert not store.might_contain('seen')
+
+
+def test_fingerprint_covers_method_path_and_body():
+    base = IdempotencyStore.fingerprint('POST', '/api/data', b'{"data":"x"}')
+    assert base == IdempotencyStore.fingerprint('POST', '/api/data', b'{"data":"x"}')
+    assert base != IdempotencyStore.fingerprint('POST', '/api/data', b'{"data":"y"}')
+    assert base != IdempotencyStore.fingerprint('PUT', '/api/data', b'{"data":"x"}')
+
+
+def test_claim_of_a_free_key():
+    store, events = make_store()
+    assert store.claim(FakeCursor(claimed=True), 'key', 'hash', 201, {'id': 1}) is None
+    assert events == ['new']
+
+
+def test_claim_of_a_held_key_replays_its_response():
+    store, events = make_store()
+    cursor = FakeCursor(claimed=False, stored=('hash', 201, json.dumps({'id': 1})))
+    assert store.claim(cursor, 'key', 'hash', 201, {'id': 2}) == (201, {'id': 1})
+    assert events == ['replayed']
+    assert store.might_contain('key')
+
+
+def test_claim_of_a_key_used_for_another_request():
+    store, events = make_store()
+    cursor = FakeCursor(claimed=False, stored=('other', 201, json.dumps({'id': 1})))
+    with pytest.raises(IdempotencyConflict):
+        store.claim(cursor, 'key', 'hash', 201, {'id': 2})
+    assert events == ['conflict']